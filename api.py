@@ -0,0 +1,790 @@
+"""
+This module serves the read and write operations of both CLIs as a local
+HTTP/JSON API, so many Bladers share one server process and its database
+connections instead of each running app-client.py with connections of its
+own.
+
+  * A ConnectionPool holds at most pool_size database connections, shared
+    by all requests; a request waits up to POOL_TIMEOUT seconds for one.
+  * At most max_concurrent requests are handled at once; a request that
+    cannot start within QUEUE_TIMEOUT seconds gets 503 with Retry-After.
+  * The battle, tournament, location and leaderboard reads go through one
+    shared query cache (see query_cache.py).
+  * Every endpoint records its request count, errors and latency
+    percentiles, served at GET /metrics with the pool and cache statistics
+    (to any logged-in user, like the other endpoints).
+
+Requests authenticate with HTTP Basic auth as an application user (the
+users table, as at the CLI logins). Any user may read; Bladers may only add
+to their own collection, and only BeyAdmins may record battles.
+
+Endpoints (lists are returned as {"<name>": [objects]}):
+
+    GET  /beyblades
+    GET  /beyblades/<beyblade_ID>/parts
+    GET  /parts
+    GET  /parts/<part_ID>
+    GET  /users/<username>/collection
+    POST /users/<username>/collection    {"name", "type", "series",
+                                          "face_bolt_ID", "energy_ring_ID",
+                                          "fusion_wheel_ID", "spin_track_ID",
+                                          "performance_tip_ID",
+                                          "bey_condition"}
+    GET  /battles?user=&tournament=&location=&since=&until=&after=&limit=
+    POST /battles                        {"tournament_name", "battle_date",
+                                          "location", "player1_ID",
+                                          "player2_ID", "player1_beyblade_ID",
+                                          "player2_beyblade_ID", "winner_ID"}
+    GET  /tournaments
+    GET  /locations
+    GET  /leaderboard?type=&series=&tournament=&location=&since=&until=&top=
+    GET  /metrics
+
+Battles are returned in battle_ID order, `limit` at a time (default:
+BATTLE_PAGE); pass the returned next_after as `after` for the next page.
+
+Usage (the database user needs the BeyAdmin privileges to record battles):
+
+    $ python api.py [--host 127.0.0.1] [--port 8080] [--pool-size 8]
+                    [--max-concurrent 32]
+    $ curl -u gokus:gokuspw localhost:8080/users/gokus/collection
+
+Works with both backends (see backends.py).
+"""
+
+import argparse
+import base64
+import json
+import queue
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import backends
+import journal
+import output
+import query_cache
+import rollups
+import session
+
+# Database connections shared by the requests, and the seconds a request
+# waits for one
+POOL_SIZE = 8
+POOL_TIMEOUT = 10.0
+
+# Requests handled at once, and the seconds a request waits for its turn
+MAX_CONCURRENT = 32
+QUEUE_TIMEOUT = 5.0
+
+# Latencies kept per endpoint for the percentiles
+LATENCY_WINDOW = 2048
+
+# Seconds a successful login is reused for the same credentials
+AUTH_TTL = 60.0
+
+# Default and largest number of battles per page
+BATTLE_PAGE = 1000
+MAX_BATTLE_PAGE = 10000
+
+# Largest request body accepted, in bytes
+MAX_BODY = 64 * 1024
+
+# Columns of battle_details returned for each battle (see the battle views
+# of the CLIs); archived battles are joined with the same columns
+BATTLE_COLUMNS = ['battle_ID', 'tournament_name', 'battle_date', 'location',
+                  'player1_ID', 'player2_ID', 'player1_username',
+                  'player2_username', 'player1_beyblade_ID',
+                  'player2_beyblade_ID', 'player1_beyblade_name',
+                  'player2_beyblade_name', 'winner_ID']
+ARCHIVE_DETAILS = """
+    SELECT a.battle_ID, a.tournament_name, a.battle_date, a.location,
+           a.player1_ID, a.player2_ID, u1.username, u2.username,
+           a.player1_beyblade_ID, a.player2_beyblade_ID, bb1.name, bb2.name,
+           a.winner_ID
+    FROM battles_archive a
+    JOIN users u1 ON a.player1_ID = u1.user_ID
+    JOIN users u2 ON a.player2_ID = u2.user_ID
+    JOIN beycollection ub1 ON a.player1_beyblade_ID = ub1.user_beyblade_ID
+    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
+    JOIN beycollection ub2 ON a.player2_beyblade_ID = ub2.user_beyblade_ID
+    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID"""
+
+BEYBLADE_COLUMNS = ['beyblade_ID', 'name', 'type', 'is_custom', 'series',
+                    'face_bolt_ID', 'energy_ring_ID', 'fusion_wheel_ID',
+                    'spin_track_ID', 'performance_tip_ID']
+PART_COLUMNS = ['part_ID', 'part_type', 'weight', 'description']
+COLLECTION_COLUMNS = ['user_beyblade_ID', 'beyblade_ID', 'name', 'is_custom',
+                      'bey_condition']
+LEADERBOARD_COLUMNS = ['place', 'beyblade_ID', 'name', 'type', 'series',
+                       'battles', 'wins', 'draws']
+
+# Fields of a POST to a collection, in the parameter order of
+# sp_add_beyblade after the user_ID
+COLLECTION_FIELDS = ['name', 'type', 'series', 'face_bolt_ID',
+                     'energy_ring_ID', 'fusion_wheel_ID', 'spin_track_ID',
+                     'performance_tip_ID', 'bey_condition']
+
+_JSON = json.JSONEncoder(default=output.json_value)
+
+
+class ApiError(Exception):
+    """
+    An error returned to the client with an HTTP status.
+    """
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+# ----------------------------------------------------------------------
+# Connection Pool, Concurrency Limit and Metrics
+# ----------------------------------------------------------------------
+
+
+class ConnectionPool:
+    """
+    A fixed-size pool of database connections shared between threads.
+    Connections are opened on first need, and one that raised a database
+    error is closed rather than reused.
+
+    Arguments:
+        connect - Function returning a new connection.
+        size (int) - Most connections open at once.
+        timeout (float) - Seconds to wait for a free connection.
+    """
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.in_use = self.opened = self.discarded = 0
+        self.waits = self.timeouts = 0
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a connection for the duration of a with block. Its transaction
+        is rolled back when it is returned, so the next borrower starts with
+        a fresh snapshot; writes must commit before the block ends.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise ApiError(503, 'No database connection available.',
+                               {'Retry-After': '1'})
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                with self._lock:
+                    self.opened += 1
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+        healthy = True
+        try:
+            yield conn
+        except backends.Error as err:
+            # A rejected value leaves the connection usable; anything else
+            # (e.g. a lost connection) may not
+            healthy = isinstance(err, backends.DataError)
+            raise
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._checkin(conn, healthy)
+            self._slots.release()
+
+    def _checkin(self, conn, healthy):
+        if healthy:
+            try:
+                conn.rollback()
+                self._idle.put(conn)
+                return
+            except backends.Error:
+                pass
+        self._discard(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except backends.Error:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self._lock:
+            return {'size': self.size, 'open': self._idle.qsize()
+                    + self.in_use, 'in_use': self.in_use,
+                    'opened': self.opened, 'discarded': self.discarded,
+                    'waits': self.waits, 'timeouts': self.timeouts}
+
+
+class ConcurrencyLimiter:
+    """
+    Lets at most `limit` requests run at once; the others wait up to
+    `timeout` seconds for their turn.
+    """
+
+    def __init__(self, limit=MAX_CONCURRENT, timeout=QUEUE_TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.active = self.peak = self.rejected = 0
+
+    @contextmanager
+    def slot(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ApiError(503, 'Server busy, try again.',
+                           {'Retry-After': '1'})
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'limit': self.limit, 'active': self.active,
+                    'peak': self.peak, 'rejected': self.rejected}
+
+
+class EndpointMetrics:
+    """
+    Request counts, errors and latencies per endpoint. Percentiles are
+    computed over the last LATENCY_WINDOW requests of each endpoint.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {
+                    'requests': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                    'recent': deque(maxlen=self.window)}
+            entry['requests'] += 1
+            if status >= 500:
+                entry['errors'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['recent'].append(seconds)
+
+    def stats(self):
+        """
+        Returns, per endpoint, the requests, server errors and the mean,
+        p50, p95, p99 and maximum latency in milliseconds.
+        """
+        with self._lock:
+            endpoints = {name: dict(entry, recent=sorted(entry['recent']))
+                         for name, entry in self._endpoints.items()}
+        result = {}
+        for name, entry in sorted(endpoints.items()):
+            recent = entry['recent']
+
+            def percentile(p):
+                return round(recent[min(len(recent) - 1,
+                                        int(p * len(recent)))] * 1000, 2)
+
+            result[name] = {
+                'requests': entry['requests'],
+                'errors': entry['errors'],
+                'mean_ms': round(entry['total'] / entry['requests'] * 1000,
+                                 2),
+                'p50_ms': percentile(0.50),
+                'p95_ms': percentile(0.95),
+                'p99_ms': percentile(0.99),
+                'max_ms': round(entry['max'] * 1000, 2),
+            }
+        return result
+
+# ----------------------------------------------------------------------
+# Endpoints
+# ----------------------------------------------------------------------
+
+
+def _objects(columns, rows):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _day(params, name, end=False):
+    """
+    Returns the 'YYYY-MM-DD' query parameter `name`, or None; an `end` day
+    is returned as the next day, for use as an exclusive bound.
+    """
+    text = params.get(name)
+    if not text:
+        return None
+    try:
+        day = datetime.strptime(text, '%Y-%m-%d').date()
+    except ValueError:
+        raise ApiError(400, f"'{name}' must be a date in YYYY-MM-DD form.")
+    return (day + timedelta(days=1) if end else day).isoformat()
+
+
+def _int(params, name, default=None, minimum=None, maximum=None):
+    text = params.get(name)
+    if text in (None, ''):
+        return default
+    try:
+        value = int(text)
+    except ValueError:
+        raise ApiError(400, f"'{name}' must be a whole number.")
+    if minimum is not None and value < minimum:
+        raise ApiError(400, f"'{name}' must be at least {minimum}.")
+    return value if maximum is None else min(value, maximum)
+
+
+class BeybladeApi:
+    """
+    The endpoints, each called with a pooled connection, the authenticated
+    user ({'username', 'is_admin', 'user_ID'}), the query parameters, the
+    JSON body and the parameters of the path. They return the JSON response
+    (and 201 for created resources).
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def _fetchall(self, conn, sql, params=()):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, tuple(params))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def list_beyblades(self, conn, user, params, body):
+        rows = self._fetchall(
+            conn, f"SELECT {', '.join(BEYBLADE_COLUMNS)} FROM beyblades "
+                  "ORDER BY beyblade_ID;")
+        return {'beyblades': _objects(BEYBLADE_COLUMNS, rows)}
+
+    def beyblade_parts(self, conn, user, params, body, beyblade_ID):
+        rows = self._fetchall(conn, """
+            SELECT p.part_ID, p.part_type, p.weight, p.description
+            FROM parts p
+            JOIN beyblades b ON p.part_ID IN (b.face_bolt_ID,
+                b.energy_ring_ID, b.fusion_wheel_ID, b.spin_track_ID,
+                b.performance_tip_ID)
+            WHERE b.beyblade_ID = %s;""", (beyblade_ID,))
+        if not rows:
+            raise ApiError(404, f"No parts found for Beyblade ID: "
+                                f"{beyblade_ID}")
+        return {'parts': _objects(PART_COLUMNS, rows)}
+
+    def list_parts(self, conn, user, params, body):
+        rows = self._fetchall(
+            conn, "SELECT part_ID, part_type, weight, description FROM parts "
+                  "ORDER BY part_type, part_ID;")
+        return {'parts': _objects(PART_COLUMNS, rows)}
+
+    def get_part(self, conn, user, params, body, part_ID):
+        rows = self._fetchall(
+            conn, "SELECT part_ID, part_type, weight, description FROM parts "
+                  "WHERE part_ID = %s;", (part_ID,))
+        if not rows:
+            raise ApiError(404, f"No information found for part ID: "
+                                f"{part_ID}")
+        return _objects(PART_COLUMNS, rows)[0]
+
+    def get_collection(self, conn, user, params, body, username):
+        rows = self._fetchall(conn, """
+            SELECT ub.user_beyblade_ID, b.beyblade_ID, b.name, b.is_custom,
+                   ub.bey_condition
+            FROM beyblades b
+            JOIN beycollection ub ON b.beyblade_ID = ub.beyblade_ID
+            JOIN users u ON ub.user_ID = u.user_ID
+            WHERE u.username = %s
+            ORDER BY ub.user_beyblade_ID;""", (username,))
+        return {'collection': _objects(COLLECTION_COLUMNS, rows)}
+
+    def add_to_collection(self, conn, user, params, body, username):
+        if username != user['username'] and not user['is_admin']:
+            raise ApiError(403, 'Bladers can only add to their own '
+                                'collection.')
+        missing = [f for f in COLLECTION_FIELDS if not body.get(f)]
+        if missing:
+            raise ApiError(400, f"Missing fields: {', '.join(missing)}")
+        if body['type'] not in rollups.BEYBLADE_TYPES:
+            raise ApiError(400, "'type' must be one of "
+                                f"{', '.join(rollups.BEYBLADE_TYPES)}.")
+        if body['series'] not in rollups.BEYBLADE_SERIES:
+            raise ApiError(400, "'series' must be one of "
+                                f"{', '.join(rollups.BEYBLADE_SERIES)}.")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT user_ID FROM users WHERE username = %s;",
+                           (username,))
+            row = cursor.fetchone()
+            if row is None:
+                raise ApiError(404, f"User '{username}' not found.")
+            cursor.execute(
+                "CALL sp_add_beyblade(%s, %s, %s, %s, %s, %s, %s, %s, %s, "
+                "%s)", [row[0]] + [body[f] for f in COLLECTION_FIELDS])
+            conn.commit()
+        finally:
+            cursor.close()
+        self.cache.note_write()
+        return 201, {'added': body['name'], 'username': username}
+
+    def _battle_source(self, conn, start_date):
+        """
+        Returns battle_details, or battle_details together with the joined
+        archive when the range starts before the newest archive cutoff
+        (like battle_source() in the CLIs).
+        """
+        cutoff = self._fetchall(
+            conn, "SELECT MAX(cutoff) FROM battle_archive_runs;")[0][0]
+        if isinstance(cutoff, str):  # SQLite returns aggregates as text
+            cutoff = datetime.fromisoformat(cutoff)
+        if cutoff is None or (start_date and
+                              datetime.fromisoformat(start_date) >= cutoff):
+            return 'battle_details'
+        return (f"(SELECT {', '.join(BATTLE_COLUMNS)} FROM battle_details "
+                f"UNION ALL {ARCHIVE_DETAILS})")
+
+    def list_battles(self, conn, user, params, body):
+        start_date = _day(params, 'since')
+        end_date = _day(params, 'until', end=True)
+        limit = _int(params, 'limit', BATTLE_PAGE, 1, MAX_BATTLE_PAGE)
+        conditions = ['b.battle_ID > %s']
+        values = [_int(params, 'after', 0)]
+        if params.get('user'):
+            conditions.append('(b.player1_username = %s OR '
+                              'b.player2_username = %s)')
+            values += [params['user'], params['user']]
+        for name, column in (('tournament', 'tournament_name'),
+                             ('location', 'location')):
+            if params.get(name):
+                conditions.append(f"b.{column} = %s")
+                values.append(params[name])
+        if start_date:
+            conditions.append('b.battle_date >= %s')
+            values.append(start_date)
+        if end_date:
+            conditions.append('b.battle_date < %s')
+            values.append(end_date)
+        sql = (f"SELECT {', '.join('b.' + c for c in BATTLE_COLUMNS)} "
+               f"FROM {self._battle_source(conn, start_date)} b "
+               f"WHERE {' AND '.join(conditions)} "
+               "ORDER BY b.battle_ID LIMIT %s;")
+        rows = self.cache.fetchall(conn, sql, values + [limit])
+        return {'battles': _objects(BATTLE_COLUMNS, rows),
+                'next_after': rows[-1][0] if len(rows) == limit else None}
+
+    def record_battle(self, conn, user, params, body):
+        if not user['is_admin']:
+            raise ApiError(403, 'Only BeyAdmins can record battles.')
+        try:
+            entry = journal.make_entry(
+                body.get('tournament_name', ''), body.get('battle_date', ''),
+                body.get('location', ''), body.get('player1_ID'),
+                body.get('player2_ID'), body.get('player1_beyblade_ID'),
+                body.get('player2_beyblade_ID'), body.get('winner_ID'))
+        except ValueError as err:
+            raise ApiError(400, str(err))
+        cursor = conn.cursor()
+        try:
+            cursor.callproc('sp_record_battle',
+                            [entry[f] for f in journal.BATTLE_FIELDS])
+            conn.commit()
+        finally:
+            cursor.close()
+        self.cache.note_write()
+        return 201, {f: entry[f] for f in journal.BATTLE_FIELDS}
+
+    def list_tournaments(self, conn, user, params, body):
+        rows = self.cache.fetchall(
+            conn, "SELECT tournament_name FROM battles UNION "
+                  "SELECT tournament_name FROM battle_rollup_tournament "
+                  "ORDER BY tournament_name;")
+        return {'tournaments': [row[0] for row in rows]}
+
+    def list_locations(self, conn, user, params, body):
+        rows = self.cache.fetchall(
+            conn, "SELECT location FROM battles UNION "
+                  "SELECT location FROM battles_archive ORDER BY location;")
+        return {'locations': [row[0] for row in rows]}
+
+    def leaderboard(self, conn, user, params, body):
+        try:
+            sql, values = rollups.leaderboard_query(
+                params.get('type') or None, params.get('series') or None,
+                params.get('tournament') or None,
+                params.get('location') or None, _day(params, 'since'),
+                _day(params, 'until', end=True), _int(params, 'top', None, 1))
+        except ValueError as err:
+            raise ApiError(400, str(err))
+        return {'leaderboard': _objects(
+            LEADERBOARD_COLUMNS, self.cache.fetchall(conn, sql, values))}
+
+
+# (method, path template, BeybladeApi method); {name} matches one path
+# segment and is passed to the method as a keyword argument
+ROUTES = [
+    ('GET', '/beyblades', 'list_beyblades'),
+    ('GET', '/beyblades/{beyblade_ID}/parts', 'beyblade_parts'),
+    ('GET', '/parts', 'list_parts'),
+    ('GET', '/parts/{part_ID}', 'get_part'),
+    ('GET', '/users/{username}/collection', 'get_collection'),
+    ('POST', '/users/{username}/collection', 'add_to_collection'),
+    ('GET', '/battles', 'list_battles'),
+    ('POST', '/battles', 'record_battle'),
+    ('GET', '/tournaments', 'list_tournaments'),
+    ('GET', '/locations', 'list_locations'),
+    ('GET', '/leaderboard', 'leaderboard'),
+]
+
+_ROUTES = [(method, re.compile(
+    '^' + re.sub(r'\{(\w+)\}', r'(?P<\1>[^/]+)', template) + '/?$'),
+    f"{method} {template}", name) for method, template, name in ROUTES]
+
+# ----------------------------------------------------------------------
+# HTTP Server
+# ----------------------------------------------------------------------
+
+
+class ApiServer(ThreadingHTTPServer):
+    """
+    The HTTP server, holding the state shared by the request threads.
+
+    Arguments:
+        address (tuple) - The (host, port) to listen on.
+        pool (ConnectionPool) - The database connections.
+        max_concurrent (int) - Requests handled at once.
+        verbose (bool) - Whether to log every request to stderr.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, pool, max_concurrent=MAX_CONCURRENT,
+                 verbose=False):
+        super().__init__(address, ApiHandler)
+        self.pool = pool
+        self.limiter = ConcurrencyLimiter(max_concurrent)
+        self.metrics = EndpointMetrics()
+        self.cache = query_cache.QueryCache()
+        self.api = BeybladeApi(self.cache)
+        self.verbose = verbose
+        # Authorization header -> (user, expiry) of recent logins
+        self._logins = {}
+        self._logins_lock = threading.Lock()
+
+    def authenticate(self, header, conn):
+        """
+        Returns the user of a Basic Authorization header, checking the
+        password with the database unless it was checked in the last
+        AUTH_TTL seconds.
+        """
+        if not header or not header.startswith('Basic '):
+            raise ApiError(401, 'Log in with HTTP Basic authentication.',
+                           {'WWW-Authenticate': 'Basic realm="beybladedb"'})
+        now = time.monotonic()
+        with self._logins_lock:
+            login = self._logins.get(header)
+        if login is not None and login[1] > now:
+            return login[0]
+        try:
+            username, _, password = base64.b64decode(
+                header[6:]).decode('utf-8').partition(':')
+        except ValueError:
+            raise ApiError(401, 'Malformed Authorization header.')
+        result = session.authenticate_user(conn, username, password)
+        if result is None:
+            raise ApiError(401, 'Username or password is incorrect.',
+                           {'WWW-Authenticate': 'Basic realm="beybladedb"'})
+        user = {'username': username, 'is_admin': result[0],
+                'user_ID': result[1]}
+        with self._logins_lock:
+            if len(self._logins) > 10000:
+                self._logins.clear()
+            self._logins[header] = (user, now + AUTH_TTL)
+        return user
+
+    def metrics_report(self):
+        return {'endpoints': self.metrics.stats(),
+                'concurrency': self.limiter.stats(),
+                'pool': self.pool.stats(),
+                'cache': self.cache.stats()}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    Routes a request to its endpoint and writes the JSON response.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        endpoint = f"{method} (unknown)"
+        headers = {}
+        try:
+            body = self._read_body()
+            if url.path.rstrip('/') == '/metrics' and method == 'GET':
+                endpoint = 'GET /metrics'
+                # Outside the limiter, so the metrics stay readable while
+                # every request slot is busy
+                with self.server.pool.connection() as conn:
+                    self.server.authenticate(
+                        self.headers.get('Authorization'), conn)
+                status, response = 200, self.server.metrics_report()
+            else:
+                for route_method, pattern, name, attr in _ROUTES:
+                    match = pattern.match(url.path)
+                    if match and route_method == method:
+                        endpoint = name
+                        break
+                else:
+                    raise ApiError(404, f"No endpoint {method} {url.path}")
+                params = {k: v[-1] for k, v in
+                          parse_qs(url.query).items()}
+                path_args = {k: unquote(v) for k, v in
+                             match.groupdict().items()}
+                with self.server.limiter.slot():
+                    with self.server.pool.connection() as conn:
+                        user = self.server.authenticate(
+                            self.headers.get('Authorization'), conn)
+                        result = getattr(self.server.api, attr)(
+                            conn, user, params, body, **path_args)
+                status, response = (result if isinstance(result, tuple)
+                                    else (200, result))
+        except ApiError as err:
+            status, response = err.status, {'error': str(err)}
+            headers = err.headers
+        except backends.DataError as err:
+            status, response = 422, {'error': str(err)}
+        except backends.Error as err:
+            status, response = 503, {'error': f"Database error: {err}"}
+            headers = {'Retry-After': '1'}
+        except Exception:
+            traceback.print_exc()
+            status, response = 500, {'error': 'Internal server error.'}
+        self._send(status, response, headers)
+        self.server.metrics.record(endpoint, time.perf_counter() - started,
+                                   status)
+
+    def _read_body(self):
+        # A body that is not read would be parsed as the next request, so
+        # the connection is closed after refusing one
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise ApiError(400, 'Invalid Content-Length header.',
+                           {'Connection': 'close'})
+        if length > MAX_BODY:
+            raise ApiError(413, 'Request body too large.',
+                           {'Connection': 'close'})
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(400, 'The request body must be JSON.')
+        if not isinstance(body, dict):
+            raise ApiError(400, 'The request body must be a JSON object.')
+        return body
+
+    def _send(self, status, response, headers):
+        data = _JSON.encode(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve the Beyblade database as a local HTTP/JSON API.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE,
+                        help='database connections shared by the requests '
+                             f"(default: {POOL_SIZE})")
+    parser.add_argument('--max-concurrent', type=int, default=MAX_CONCURRENT,
+                        help='requests handled at once (default: '
+                             f"{MAX_CONCURRENT})")
+    parser.add_argument('--verbose', action='store_true',
+                        help='log every request')
+    parser.add_argument('--user', default='jlavin', help='database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    pool = ConnectionPool(
+        lambda: backends.connect(args.user, args.password), args.pool_size)
+    try:
+        # Fail at startup rather than at the first request if the database
+        # cannot be reached
+        with pool.connection():
+            pass
+    except (backends.Error + (ApiError,)) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    server = ApiServer((args.host, args.port), pool, args.max_concurrent,
+                       args.verbose)
+    print(f"Serving the Beyblade API on http://{args.host}:{args.port}/ "
+          f"({args.pool_size} connections, {args.max_concurrent} concurrent "
+          "requests)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
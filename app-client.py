@@ -10,14 +10,48 @@ the database schema before using this script (instructions in README).
 """
 
 
+from datetime import datetime, timedelta
 import sys  # to print error messages to sys.stderr
-import mysql.connector
-# To get error codes from the connector, useful for user-friendly
-# error-handling
-import mysql.connector.errorcode as errorcode
-
+# Database backends (MySQL server or embedded SQLite), their error types and
+# the error codes useful for user-friendly error-handling
+import backends
 from tabulate import tabulate
 
+# For the in-memory fuzzy search over parts and Beyblades
+import time
+import search_index
+
+# For tab-completion of IDs at the prompts
+import completion
+
+# For logging in and the cached login session
+import session
+
+# For bracket tournaments (pairings, rounds and standings)
+import tournaments
+
+# For sending reads to the read replica
+import replica
+
+# For caching the results of the battle and leaderboard queries
+import query_cache
+
+# For the filtered leaderboards of the daily battle rollups
+import rollups
+
+# For the output formats of the view commands (--format and --output)
+import argparse
+import output
+
+# For profiling the menu commands (--profile)
+import profiler
+
+# For adding a whole collection from a CSV file
+import collection_import
+
+# For the full-text search of part descriptions
+import part_search
+
 # For output coloring
 import colorama
 from colorama import Fore
@@ -28,6 +62,62 @@ colorama.init(autoreset=True)
 # to an actual client. ***Set to False when done testing.***
 DEBUG = True
 
+# Maximum number of results printed by the catalog search, and how old (in
+# seconds) the in-memory search index may get before it is refreshed
+SEARCH_LIMIT = 10
+SEARCH_REFRESH_SECONDS = 60
+
+# In-memory fuzzy search index over parts and Beyblades, built on first use
+catalog_index = None
+
+# Part types
+VALID_PART_TYPES = ['Face Bolt', 'Energy Ring', 'Fusion Wheel', 'Spin Track',
+                    'Performance Tip']
+
+# Columns of battle_details, the battles copied with their usernames and
+# Beyblade names by triggers, which the battle views read without joins
+DETAIL_COLUMNS = ("battle_ID, tournament_name, battle_date, location, "
+                  "player1_ID, player2_ID, player1_username, "
+                  "player2_username, player1_beyblade_ID, "
+                  "player2_beyblade_ID, player1_beyblade_name, "
+                  "player2_beyblade_name, winner_ID")
+
+# Archived battles (see archive.py) have no battle_details rows, so they
+# are joined with the same columns when a range reaches into the archive
+ARCHIVE_DETAILS = """
+    SELECT a.battle_ID, a.tournament_name, a.battle_date, a.location,
+           a.player1_ID, a.player2_ID, u1.username, u2.username,
+           a.player1_beyblade_ID, a.player2_beyblade_ID, bb1.name, bb2.name,
+           a.winner_ID
+    FROM battles_archive a
+    JOIN users u1 ON a.player1_ID = u1.user_ID
+    JOIN users u2 ON a.player2_ID = u2.user_ID
+    JOIN beycollection ub1 ON a.player1_beyblade_ID = ub1.user_beyblade_ID
+    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
+    JOIN beycollection ub2 ON a.player2_beyblade_ID = ub2.user_beyblade_ID
+    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID"""
+
+# Tab-completion of IDs at the prompts, loaded lazily from the global
+# connection
+completer = completion.Completer(lambda: conn)
+
+# Sends the reads of the view functions to the read replica, if one is
+# configured (see replica.py), and the writes to the primary
+router = replica.ReadRouter(user='gokus', password='gokuspw')
+
+# Results of the battle and leaderboard queries, dropped when the tables
+# they read are written (by this session or, via the change log, by others)
+result_cache = query_cache.QueryCache()
+router.write_listeners.append(result_cache.note_write)
+
+# Format and destination of the results of the view commands, set from the
+# command line in __main__ (see output.py)
+out = output.Output()
+
+# Profiler of the menu commands, set from the command line in __main__
+# (see profiler.py)
+command_profiler = None
+
 # ----------------------------------------------------------------------
 # SQL Utility Functions
 # ----------------------------------------------------------------------
@@ -35,31 +125,27 @@ DEBUG = True
 
 def get_conn():
     """"
-    Returns a connected MySQL connector instance, if connection is successful.
+    Returns a connected database connection (MySQL or SQLite, see backends.py),
+    if connection is successful.
     If unsuccessful, exits.
     """
     try:
-        conn = mysql.connector.connect(
-            host='localhost',
-            user='gokus',
-            # Find port in MAMP or MySQL Workbench GUI or with
-            # SHOW VARIABLES WHERE variable_name LIKE 'port';
-            port='3306',  # this may change!
-            password='gokuspw',
-            database='beybladedb'  # replace this with your database name
-        )
+        # The backend is chosen with the BEYBLADEDB_BACKEND environment
+        # variable; the MySQL host, port and database are set in backends.py
+        conn = backends.connect(user='gokus', password='gokuspw')
         print('Successfully connected.')
         return conn
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         # Remember that this is specific to _database_ users, not
         # application users. So is probably irrelevant to a client in your
         # simulated program. Their user information would be in a users table
         # specific to your database; hence the DEBUG use.
-        if err.errno == errorcode.ER_ACCESS_DENIED_ERROR and DEBUG:
+        errno = getattr(err, 'errno', None)
+        if errno == backends.ER_ACCESS_DENIED_ERROR and DEBUG:
             sys.stderr.write('Incorrect username or password'
                              'when connecting to DB.' + '\n')
             sys.stderr.flush()
-        elif err.errno == errorcode.ER_BAD_DB_ERROR and DEBUG:
+        elif errno == backends.ER_BAD_DB_ERROR and DEBUG:
             sys.stderr.write('Database does not exist.' + '\n')
             sys.stderr.flush()
         elif DEBUG:
@@ -71,6 +157,41 @@ def get_conn():
             sys.stderr('An error occurred, please contact the administrator.')
         sys.exit(1)
 
+
+def get_read_conn():
+    """
+    Returns a connection for a read-only view: the read replica if one is
+    configured and up to date (see replica.py), and otherwise the primary
+    database. If unsuccessful, exits.
+    """
+    try:
+        conn = router.connect_read()
+        print('Successfully connected.')
+        return conn
+    except backends.Error:
+        # get_conn() reports the error and exits
+        return get_conn()
+
+
+def query_rows(conn, cursor, sql, params=(), cached=False):
+    """
+    Runs the query of a view and returns its rows for out.write(): a list
+    (from the query cache if `cached`) for the grid format, and otherwise an
+    iterator over batches of the cursor, so the formats written
+    incrementally never hold the whole result (see output.py).
+
+    Arguments:
+        conn - The connection to run the query on.
+        cursor - An open cursor of conn.
+        sql (str) - The query, with %s placeholders.
+        params (tuple) - The values of the placeholders.
+        cached (bool) - Whether the query may be answered by result_cache.
+    """
+    if cached and not out.streaming:
+        return result_cache.fetchall(conn, sql, params)
+    cursor.execute(sql, tuple(params))
+    return output.cursor_rows(cursor) if out.streaming else cursor.fetchall()
+
 # ----------------------------------------------------------------------
 # Functions for Command-Line Options/Query Execution
 # ----------------------------------------------------------------------
@@ -83,20 +204,19 @@ def view_all_beyblades():
 
     Return value: Query of the beyblades table.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM beyblades;")
-
     # Fetching all results
-    results = cursor.fetchall()
+    results = query_rows(conn, cursor, "SELECT * FROM beyblades;")
 
     # Defining the table headers as per beyblades table columns
     headers = ['Beyblade ID', 'Name', 'Type', 'Is Custom', 'Series',
                'Face Bolt ID', 'Energy Ring ID', 'Fusion Wheel ID',
                'Spin Track ID', 'Performance Tip ID']
 
-    # Printing the results in a table format
-    print(tabulate(results, headers=headers, tablefmt="grid"))
+    # Printing the results in the selected output format
+    if not out.write(results, headers):
+        print(Fore.RED + "\nNo Beyblades found.")
 
     # Closing cursor and connection
     cursor.close()
@@ -114,7 +234,7 @@ def view_user_beyblades(user_name):
     Returns: Prints the Beyblade ID, Name, Custom Status, Beyblade-Player 
              ID, and Condition of the user's Beyblades
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     query = """
@@ -125,19 +245,15 @@ def view_user_beyblades(user_name):
     JOIN users u ON ub.user_ID = u.user_ID
     WHERE u.username = %s;
     """
-    cursor.execute(query, (user_name,))
-
-    results = cursor.fetchall()
+    results = query_rows(conn, cursor, query, (user_name,))
     headers = ["Beyblade-Player ID", "Beyblade ID", "Name", "Is Custom", 
                "Condition"]
 
-    if results:
-        formatted_results = [
-            (user_beyblade_id, id, name, "Yes" if is_custom else "No", 
-             condition) for user_beyblade_id, id, name, is_custom, 
-             condition in results]
-        print(tabulate(formatted_results, headers=headers, tablefmt="grid"))
-    else:
+    formatted_results = (
+        (user_beyblade_id, id, name, "Yes" if is_custom else "No",
+         condition) for user_beyblade_id, id, name, is_custom,
+        condition in results)
+    if not out.write(formatted_results, headers):
         print(Fore.RED + f"\nNo Beyblades found for user: {user_name}")
 
     cursor.close()
@@ -152,7 +268,7 @@ def heaviest_beyblade_for_type(beyblade_type):
         beyblade_type (str): The type of Beyblade (Attack, Defense, Stamina, 
         Balance).
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     # Call the UDF `udf_heaviest_beyblade_for_type` passing the beyblade type
@@ -181,47 +297,114 @@ def heaviest_beyblade_for_type(beyblade_type):
     conn.close()
 
 
-def view_all_battle_results_for_user(user_name):
+def input_date_range():
+    """
+    Prompts for an optional date range to bound battle queries by. Both
+    dates are inclusive; blank answers leave that end of the range open.
+
+    Return value: A (start_date, end_date) tuple of 'YYYY-MM-DD' strings or
+                  None, where end_date is exclusive (the day after the date
+                  entered) for use as battle_date < end_date.
+    """
+    bounds = []
+    for label in ('start', 'end'):
+        while True:
+            text = input(f'Enter {label} date (YYYY-MM-DD, leave blank for '
+                         'no limit): ').strip()
+            if not text:
+                bounds.append(None)
+                break
+            try:
+                day = datetime.strptime(text, '%Y-%m-%d').date()
+            except ValueError:
+                print(Fore.RED + "\nError: Invalid date. Please use YYYY-MM-DD.")
+                continue
+            if label == 'end':
+                day += timedelta(days=1)
+            bounds.append(day.isoformat())
+            break
+    return bounds[0], bounds[1]
+
+
+def date_bounds_sql(start_date, end_date):
+    """
+    Returns the SQL conditions (to be appended after a WHERE clause) and
+    parameters restricting battles b to start_date <= battle_date < end_date.
+    The battle views read battle_details (see battle_source()), whose
+    (tournament_name, location or username, battle_date) indexes turn these
+    bounds into index ranges.
+    """
+    sql, params = '', []
+    if start_date:
+        sql += ' AND b.battle_date >= %s'
+        params.append(start_date)
+    if end_date:
+        sql += ' AND b.battle_date < %s'
+        params.append(end_date)
+    return sql, params
+
+
+def battle_source(cursor, start_date):
+    """
+    Returns the table expression the battle views read from: just the
+    battle_details table, or battle_details together with battles_archive
+    when the requested range starts before the newest archive cutoff (or is
+    open), so the archive is only read when the range needs it (see
+    archive.py).
+
+    Arguments:
+        cursor - An open cursor, used to look up the archive cutoff.
+        start_date (str) - The 'YYYY-MM-DD' start of the range, or None.
+
+    Return value: SQL to use in place of the battle_details table name.
+    """
+    cursor.execute("SELECT MAX(cutoff) FROM battle_archive_runs;")
+    cutoff = cursor.fetchone()[0]
+    if isinstance(cutoff, str):  # SQLite returns aggregates as text
+        cutoff = datetime.fromisoformat(cutoff)
+    if cutoff is None or (start_date and
+                          datetime.fromisoformat(start_date) >= cutoff):
+        return 'battle_details'
+    return (f"(SELECT {DETAIL_COLUMNS} FROM battle_details UNION ALL "
+            f"{ARCHIVE_DETAILS})")
+
+
+def view_all_battle_results_for_user(user_name, start_date=None,
+                                     end_date=None):
     """
     Queries the battles table for all battle results related to the
     current user.
 
     Arguments:
         user_name (str) - the name of the user.
+        start_date, end_date (str) - optional 'YYYY-MM-DD' bounds on the
+            battle date (end exclusive), see date_bounds_sql().
 
     Return value: Query of the battles table.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     # SQL query to fetch battle results for the given user
-    query = """
+    query = f"""
     SELECT b.battle_ID, b.tournament_name, b.battle_date, b.location,
-           u1.username AS Player1_Username, u2.username AS Player2_Username,
-           bb1.name AS Player1_Beyblade_Name, bb2.name AS Player2_Beyblade_Name,
+           b.player1_username, b.player2_username,
+           b.player1_beyblade_name, b.player2_beyblade_name,
            b.player1_beyblade_ID, b.player2_beyblade_ID, b.winner_ID
-    FROM battles b
-    JOIN users u1 ON b.player1_ID = u1.user_ID
-    JOIN users u2 ON b.player2_ID = u2.user_ID
-    JOIN beycollection ub1 ON b.player1_beyblade_ID = ub1.user_beyblade_ID
-    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
-    JOIN beycollection ub2 ON b.player2_beyblade_ID = ub2.user_beyblade_ID
-    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID
-    WHERE u1.username = %s OR u2.username = %s;
+    FROM {battle_source(cursor, start_date)} b
+    WHERE (b.player1_username = %s OR b.player2_username = %s)
     """
-    cursor.execute(query, (user_name, user_name))
+    date_sql, date_params = date_bounds_sql(start_date, end_date)
+    # Fetching all results (from the query cache if possible)
+    results = query_rows(conn, cursor, query + date_sql + ';',
+                         (user_name, user_name, *date_params), cached=True)
+    headers = ["Battle ID", "Tournament Name", "Date", "Location",
+               "Player 1 Username", "Player 2 Username",
+               "Player 1 Beyblade Name", "Player 2 Beyblade Name",
+               "Player 1 Beyblade ID", "Player 2 BeyBlade ID", "Winner ID"]
 
-    # Fetching all results
-    results = cursor.fetchall()
-    if not results:
+    if not out.write(results, headers):
         print(Fore.RED + "\nNo battles found for user!")
-    else:
-        headers = ["Battle ID", "Tournament Name", "Date", "Location",
-                   "Player 1 Username", "Player 2 Username",
-                   "Player 1 Beyblade Name", "Player 2 Beyblade Name",
-                   "Player 1 Beyblade ID", "Player 2 BeyBlade ID", "Winner ID"]
-
-        print(tabulate(results, headers=headers, tablefmt="grid"))
 
     # Closing cursor and connection
     cursor.close()
@@ -234,24 +417,30 @@ def view_all_tournament_names():
     no tournaments exist,
     indicates no tournaments found.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     # SQL query to select distinct tournament names
-    sql = ("SELECT DISTINCT tournament_name FROM battles ORDER BY "
-           "tournament_name;")
+    sql = ("SELECT tournament_name FROM battles UNION "
+           "SELECT tournament_name FROM battle_rollup_tournament "
+           "ORDER BY tournament_name;")
 
     try:
-        cursor.execute(sql)
-        tournaments = cursor.fetchall()  # Fetch all results
+        # Fetch all results
+        tournaments = query_rows(conn, cursor, sql, cached=True)
 
-        if tournaments:
-            print(Fore.BLUE + "\nList of Tournament Names:")
+        if out.streaming:
+            found = out.write(tournaments, ['Tournament Name'],
+                              "\nList of Tournament Names:")
+        else:
+            found = bool(tournaments)
+            if found:
+                print(Fore.BLUE + "\nList of Tournament Names:")
             for tournament in tournaments:
                 print(tournament[0])  # Print each tournament name
-        else:
+        if not found:
             print(Fore.RED + "\nNo tournaments found in the database.")
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         print(Fore.RED + f"\nError: {err}")
     finally:
         cursor.close()
@@ -262,103 +451,183 @@ def view_all_battle_locations():
     """
     Fetches and displays unique battle locations from the 'battles' table.
     """
-    conn = get_conn()  # Way to get database connection
+    conn = get_read_conn()  # Way to get database connection
     cursor = conn.cursor()
 
     # SQL query to select distinct battle locations
-    sql = "SELECT DISTINCT location FROM battles ORDER BY location;"
+    sql = ("SELECT location FROM battles UNION "
+           "SELECT location FROM battles_archive ORDER BY location;")
 
     try:
-        cursor.execute(sql)
-        locations = cursor.fetchall()  # Fetch all results
+        # Fetch all results
+        locations = query_rows(conn, cursor, sql, cached=True)
 
-        if locations:
-            print(Fore.BLUE + "\nList of Battle Locations:")
+        if out.streaming:
+            found = out.write(locations, ['Location'],
+                              "\nList of Battle Locations:")
+        else:
+            found = bool(locations)
+            if found:
+                print(Fore.BLUE + "\nList of Battle Locations:")
             for location in locations:
                 print(location[0])  # Print each location
-        else:
+        if not found:
             print(Fore.RED + "\nNo battle locations found in the database.")
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         print(Fore.RED + f"\nError: {err}")
     finally:
         cursor.close()
         conn.close()  # Closing the connection when done
 
 
-def beyblade_leaderboard():
+def input_leaderboard_filters():
     """
-    Prints a leaderboard of Beyblades based on their wins in battles.
+    Prompts for the optional filters of a Beyblade leaderboard (see
+    rollups.py); blank answers leave a filter off.
+
+    Return value: A dictionary of keyword arguments for
+                  beyblade_leaderboard().
     """
-    conn = get_conn()
-    cursor = conn.cursor()
+    filters = {}
+    for key, label, choices in [
+            ('beyblade_type', 'Beyblade type', rollups.BEYBLADE_TYPES),
+            ('series', 'series', rollups.BEYBLADE_SERIES)]:
+        while True:
+            text = input(f"Enter {label} ({', '.join(choices)}; leave blank "
+                         "for all): ").strip()
+            match = [c for c in choices if c.lower() == text.lower()]
+            if not text or match:
+                filters[key] = match[0] if match else None
+                break
+            print(Fore.RED + f"Unknown {label} '{text}'.")
+    filters['tournament_name'] = completer.input(
+        'Enter tournament name (leave blank for all): ',
+        'tournament').strip() or None
+    filters['location'] = completer.input(
+        'Enter location (leave blank for all): ', 'location').strip() or None
+    filters['start_date'], filters['end_date'] = input_date_range()
+    while True:
+        text = input('Enter number of places to show (leave blank for '
+                     'all): ').strip()
+        if not text or (text.isdigit() and int(text) > 0):
+            filters['top'] = int(text) if text else None
+            break
+        print(Fore.RED + "Please enter a positive whole number.")
+    return filters
+
+
+def beyblade_leaderboard(beyblade_type=None, series=None,
+                         tournament_name=None, location=None,
+                         start_date=None, end_date=None, top=None):
+    """
+    Prints a leaderboard of Beyblades ranked by their wins in battles
+    (archived battles included), read from the daily battle rollups. Tied
+    Beyblades share a place.
 
-    query = """
-    SELECT bb.beyblade_ID, bb.name, bb.type, COUNT(*) as wins
-    FROM battles b
-    INNER JOIN beycollection ub ON b.winner_ID = ub.user_beyblade_ID
-    INNER JOIN beyblades bb ON ub.beyblade_ID = bb.beyblade_ID
-    GROUP BY bb.beyblade_ID, bb.name, bb.type
-    ORDER BY wins DESC, bb.name;
+    Arguments:
+        beyblade_type (str) - Only Beyblades of this type, or None.
+        series (str) - Only Beyblades of this series, or None.
+        tournament_name (str) - Only battles of this tournament, or None.
+        location (str) - Only battles at this location, or None.
+        start_date, end_date (str) - optional 'YYYY-MM-DD' bounds on the
+            battle date (end exclusive), see input_date_range().
+        top (int) - Only the first `top` places (ties included), or None.
     """
+    conn = get_read_conn()
+    cursor = conn.cursor()
+
     try:
-        cursor.execute(query)
-        results = cursor.fetchall()
+        query, params = rollups.leaderboard_query(
+            beyblade_type, series, tournament_name, location, start_date,
+            end_date, top)
+        results = query_rows(conn, cursor, query, params, cached=True)
 
-        if results:
-            print(Fore.BLUE + "\nBeyblade Leaderboard (Most Wins):")
-            headers = ['Beyblade ID', 'Name', 'Type', 'Wins']
-            print(tabulate(results, headers=headers, tablefmt="grid"))
-        else:
+        if not out.write(results, rollups.LEADERBOARD_HEADERS,
+                         "\nBeyblade Leaderboard (Most Wins):"):
             print(Fore.RED + "\nNo battle results found.")
-    except mysql.connector.Error as err:
+    except (backends.Error + (ValueError,)) as err:
         print(Fore.RED + f"\nError: {err}")
     finally:
         cursor.close()
         conn.close()
 
 
-def view_battle_results_for_tournament(tournament_name):
+def view_tournament(tournament_name):
+    """
+    Prints the pairings of the current round of a bracket tournament (see
+    tournaments.py) and its standings.
+
+    Arguments:
+        tournament_name (str) - The name of the tournament.
+    """
+    conn = get_read_conn()
+    try:
+        tournament = tournaments.get_tournament(conn, tournament_name)
+        if tournament is None:
+            print(Fore.RED + f"\nNo bracket tournament named: "
+                  f"{tournament_name}")
+            return
+        print(Fore.BLUE + f"\n{tournament_name} "
+              f"({tournament['format'].replace('_', ' ')}, "
+              f"{tournament['location']}): {tournament['status']}")
+        if tournament['current_round']:
+            pairings = tournaments.get_pairings(
+                conn, tournament['tournament_ID'],
+                tournament['current_round'])
+            out.write(pairings, [
+                'Match ID', 'Bracket', 'Player 1', 'Beyblade 1', 'Player 2',
+                'Beyblade 2', 'Result'],
+                f"\nRound {tournament['current_round']}:")
+        standings = tournaments.get_standings(conn,
+                                              tournament['tournament_ID'])
+        if not out.write(standings, [
+                'Rank', 'Username', 'Beyblade', 'Beyblade-Player ID',
+                'Points', 'Wins', 'Losses', 'Draws', 'Byes', 'Eliminated'],
+                "\nStandings:"):
+            print(Fore.RED + "\nNo entrants registered yet.")
+    except backends.Error as err:
+        print(Fore.RED + f"\nError: {err}")
+    finally:
+        conn.close()
+
+
+def view_battle_results_for_tournament(tournament_name, start_date=None,
+                                       end_date=None):
     """
     Queries the battles table for all battle results related to the 
     specified tournament.
 
     Arguments:
         tournament_name (str) - the name of the tournament.
+        start_date, end_date (str) - optional 'YYYY-MM-DD' bounds on the
+            battle date (end exclusive), see date_bounds_sql().
 
     Return value: None. Prints the query result of the battles table in a 
         formatted table.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     # SQL query to fetch battle results for the given tournament name
-    query = """
+    query = f"""
     SELECT b.battle_ID, b.battle_date, b.location,
-           u1.username AS Player1_Username, u2.username AS Player2_Username,
-           bb1.name AS Player1_Beyblade_Name, bb2.name AS Player2_Beyblade_Name,
+           b.player1_username, b.player2_username,
+           b.player1_beyblade_name, b.player2_beyblade_name,
            b.player1_beyblade_ID, b.player2_beyblade_ID, b.winner_ID
-    FROM battles b
-    JOIN users u1 ON b.player1_ID = u1.user_ID
-    JOIN users u2 ON b.player2_ID = u2.user_ID
-    JOIN beycollection ub1 ON b.player1_beyblade_ID = ub1.user_beyblade_ID
-    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
-    JOIN beycollection ub2 ON b.player2_beyblade_ID = ub2.user_beyblade_ID
-    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID
-    WHERE b.tournament_name = %s;
+    FROM {battle_source(cursor, start_date)} b
+    WHERE b.tournament_name = %s
     """
-    cursor.execute(query, (tournament_name,))
-
-    # Fetching all results
-    results = cursor.fetchall()
+    date_sql, date_params = date_bounds_sql(start_date, end_date)
+    # Fetching all results (from the query cache if possible)
+    results = query_rows(conn, cursor, query + date_sql + ';',
+                         (tournament_name, *date_params), cached=True)
     headers = ["Battle ID", "Date", "Location",
                "Player 1 Username", "Player 2 Username",
                "Player 1 Beyblade Name", "Player 2 Beyblade Name",
                "Player 1 Beyblade ID", "Player 2 BeyBlade ID", "Winner ID"]
 
     # Check if there are any results
-    if results:
-        print(tabulate(results, headers=headers, tablefmt="grid"))
-    else:
+    if not out.write(results, headers):
         print(Fore.RED + f"\nNo battles found for tournament: {tournament_name}")
 
     # Closing cursor and connection
@@ -366,48 +635,43 @@ def view_battle_results_for_tournament(tournament_name):
     conn.close()
 
 
-def view_battle_results_for_location(location):
+def view_battle_results_for_location(location, start_date=None,
+                                     end_date=None):
     """
     Queries the battles table for all battle results related to the specified 
     location.
 
     Arguments:
         location (str) - the specified location of the battles to query.
+        start_date, end_date (str) - optional 'YYYY-MM-DD' bounds on the
+            battle date (end exclusive), see date_bounds_sql().
 
     Return value: None. Prints the query result of the battles table in a 
         formatted table.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     # SQL query to fetch battle results for the given location
-    query = """
+    query = f"""
     SELECT b.battle_ID, b.tournament_name, b.battle_date,
-           u1.username AS Player1_Username, u2.username AS Player2_Username,
-           bb1.name AS Player1_Beyblade_Name, bb2.name AS Player2_Beyblade_Name,
+           b.player1_username, b.player2_username,
+           b.player1_beyblade_name, b.player2_beyblade_name,
            b.player1_beyblade_ID, b.player2_beyblade_ID, b.winner_ID
-    FROM battles b
-    JOIN users u1 ON b.player1_ID = u1.user_ID
-    JOIN users u2 ON b.player2_ID = u2.user_ID
-    JOIN beycollection ub1 ON b.player1_beyblade_ID = ub1.user_beyblade_ID
-    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
-    JOIN beycollection ub2 ON b.player2_beyblade_ID = ub2.user_beyblade_ID
-    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID
-    WHERE b.location = %s;
+    FROM {battle_source(cursor, start_date)} b
+    WHERE b.location = %s
     """
-    cursor.execute(query, (location,))
-
-    # Fetching all results
-    results = cursor.fetchall()
+    date_sql, date_params = date_bounds_sql(start_date, end_date)
+    # Fetching all results (from the query cache if possible)
+    results = query_rows(conn, cursor, query + date_sql + ';',
+                         (location, *date_params), cached=True)
     headers = ["Battle ID", "Tournament Name", "Date",
                "Player 1 Username", "Player 2 Username",
                "Player 1 Beyblade Name", "Player 2 Beyblade Name",
                "Player 1 Beyblade ID", "Player 2 BeyBlade ID", "Winner ID"]
 
     # Check if there are any results
-    if results:
-        print(tabulate(results, headers=headers, tablefmt="grid"))
-    else:
+    if not out.write(results, headers):
         print(Fore.RED + f"\nNo battles found for location: {location}")
 
     # Closing cursor and connection
@@ -426,7 +690,7 @@ def view_part_info(part_id):
     Return value: None. Prints the query result of the part in a formatted 
         table.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     # SQL query to fetch information for the given part_ID
@@ -444,7 +708,7 @@ def view_part_info(part_id):
 
     # Check if there is a result
     if result:
-        print(tabulate([result], headers=headers, tablefmt="grid"))
+        out.write([result], headers)
     else:
         print(Fore.RED + f"\nNo information found for part ID: {part_id}")
 
@@ -472,7 +736,7 @@ def add_beyblade(name, type, series, is_custom, face_bolt_id, energy_ring_id,
 
     Return value: none.
     """
-    conn = get_conn()
+    conn = router.track(get_conn())
     cursor = conn.cursor()
     sql = (
         "INSERT INTO beyblades (name, type, series, is_custom, face_bolt_id, "
@@ -492,7 +756,7 @@ def add_beyblade(name, type, series, is_custom, face_bolt_id, energy_ring_id,
         cursor.execute(sql, data)
         conn.commit()
         print(Fore.BLUE + f"\nAdded new Beyblade: {name}")
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         print(Fore.RED + f"\nError: {err}")
 
 
@@ -501,7 +765,7 @@ def view_all_beyblade_parts():
     Retrieves and displays all Beyblade parts from the database, sorted
     by part type and part ID.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     # SQL query to select all parts
@@ -509,24 +773,14 @@ def view_all_beyblade_parts():
            "ORDER BY part_type, part_ID;")
 
     try:
-        cursor.execute(sql)
-        parts = cursor.fetchall()  # Fetch all results
-
-        if parts:
-            # Printing the results in a table format
-            print(Fore.BLUE + "\nBeyblade Parts List:")
-            print(
-                tabulate(
-                    parts,
-                    headers=[
-                        'Part ID',
-                        'Part Type',
-                        'Weight (g)',
-                        'Description'],
-                    tablefmt="grid"))
-        else:
+        parts = query_rows(conn, cursor, sql)  # Fetch all results
+
+        # Printing the results in the selected output format
+        if not out.write(parts, ['Part ID', 'Part Type', 'Weight (g)',
+                                 'Description'],
+                         "\nBeyblade Parts List:"):
             print(Fore.RED + "\nNo parts found in the database.")
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         print(Fore.RED + f"\nError: {err}")
     finally:
         cursor.close()
@@ -544,7 +798,7 @@ def view_beyblade_parts(beyblade_id):
     Returns: Prints the PART ID, Part Type, Part Description, and Weight in a 
              formatted table.
     """
-    conn = get_conn()
+    conn = get_read_conn()
     cursor = conn.cursor()
 
     query = """
@@ -555,19 +809,87 @@ def view_beyblade_parts(beyblade_id):
                                       b.performance_tip_ID)
     WHERE b.beyblade_ID = %s;
     """
-    cursor.execute(query, (beyblade_id,))
-
-    results = cursor.fetchall()
+    results = query_rows(conn, cursor, query, (beyblade_id,))
     headers = ["Part ID", "Part Type", "Weight (g)", "Description"]
 
-    if results:
-        print(tabulate(results, headers=headers, tablefmt="grid"))
-    else:
+    if not out.write(results, headers):
         print(Fore.RED + f"\nNo parts found for Beyblade ID: {beyblade_id}")
 
     cursor.close()
     conn.close()
 
+def search_part_descriptions(search_text, part_type=None):
+    """
+    Searches part descriptions with the full-text index (see
+    part_search.py) and prints the matching parts, most relevant first.
+
+    Arguments:
+        search_text (str) - Words to look for (e.g. "stamina defense").
+        part_type (str) - Optional part type to restrict the results to.
+    """
+    conn = get_read_conn()
+    try:
+        rows = part_search.search_part_descriptions(conn, search_text,
+                                                    part_type)
+        if not out.write(rows, part_search.HEADERS):
+            print(Fore.RED + f"\nNo part descriptions match: {search_text}")
+    except ValueError as err:
+        print(Fore.RED + f"\n{err}")
+    except backends.Error as err:
+        print(Fore.RED + f"\nError: {err}")
+    finally:
+        conn.close()
+
+
+def get_catalog_index():
+    """
+    Returns the in-memory search index over parts and Beyblades, building it
+    on first use and refreshing it when it is older than
+    SEARCH_REFRESH_SECONDS (only changed rows are re-indexed).
+    """
+    global catalog_index
+    if catalog_index is None:
+        catalog_index = search_index.CatalogIndex()
+    if (catalog_index.last_refresh is None or time.time() -
+            catalog_index.last_refresh > SEARCH_REFRESH_SECONDS):
+        conn = get_read_conn()
+        try:
+            catalog_index.refresh(conn)
+        finally:
+            conn.close()
+    return catalog_index
+
+
+def search_catalog(query):
+    """
+    Prints the parts and Beyblades best matching a free-text query, ranked
+    by relevance, so their exact IDs can be used with the other options.
+
+    Arguments:
+        query (str) - Text to look for in part IDs, part types,
+            descriptions, Beyblade IDs and Beyblade names.
+    """
+    try:
+        index = get_catalog_index()
+    except backends.Error as err:
+        print(Fore.RED + f"\nError: {err}")
+        return
+
+    start = time.perf_counter()
+    results = index.search(query, limit=SEARCH_LIMIT)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    if results:
+        rows = [(r.kind, r.key, r.label,
+                 r.detail if len(r.detail) <= 60 else r.detail[:57] + '...',
+                 round(r.score, 2)) for r in results]
+        out.write(rows, ['Kind', 'ID', 'Name / Part Type',
+                         'Type / Description', 'Score'],
+                  f"\nTop matches for '{query}' ({elapsed_ms:.2f} ms):")
+    else:
+        print(Fore.RED + f"\nNo parts or Beyblades match: {query}")
+
+
 # ----------------------------------------------------------------------
 # Functions for Logging Users In
 # ----------------------------------------------------------------------
@@ -578,66 +900,46 @@ def view_beyblade_parts(beyblade_id):
 # support any prompt functionality to conditionally login to the sql database)
 
 
-def is_client(username):
-    """
-    Helper function to verify whether the user logging in is a BeyClient.
-    Checks the `is_admin` flag for the given username in the `users` table.
-    """
-    cursor = conn.cursor()
-    sql = "SELECT is_admin FROM users WHERE username = %s;"
-    try:
-        cursor.execute(sql, (username,))
-        result = cursor.fetchone()
-        # If the user exists and the is_admin flag is false, return True
-        if result and (not result[0]):
-            return True
-        else:
-            return False
-    except mysql.connector.Error as err:
-        print(Fore.RED + f"\nDatabase error: {err}")
-        return False
-    finally:
-        cursor.close()
-
-
 def login():
     """
-    This function prompts the login for an admin.
-    It checks the database to ensure that the username and password are correct.
+    This function prompts the login for a client.
+    It resumes an unexpired session if there is one (see session.py), and
+    otherwise checks the username and password with the database in a single
+    query that also returns the user's role.
     """
-    cursor = conn.cursor()
-
     print("\n------------------------------ BeyClient Login -----------------"
           "-------------\n")
 
+    saved = session.load_session('client')
+    if saved:
+        print(Fore.BLUE + f"Resuming session for {saved['username']}.")
+        show_options(saved['username'])
+
     while True:
         username = input("USERNAME: ").lower()
         password = input("PASSWORD: ").lower()
 
-        while not is_client(username):
-            print("\nIt appears that you are not a BeyClient. Please try "
-                  "again! \n")
-            username = input("USERNAME: ").lower()
-            password = input("PASSWORD: ").lower()
-
-        sql = "SELECT authenticate('%s', '%s');" % (username, password)
-
         try:
-            cursor.execute(sql)
-            check_response = cursor.fetchone()
-
-            if check_response[0] == 1:
-                show_options(username)
-            else:
-                print("\nUsername or password is incorrect. Please try again "
-                      ":)\n")
-
-        except mysql.connector.Error as err:
+            result = session.authenticate_user(conn, username, password)
+        except backends.Error as err:
             if DEBUG:
-                sys.stderr(err)
+                sys.stderr.write(str(err) + '\n')
                 sys.exit(1)
             else:
-                sys.stderr("Error logging in.")
+                sys.stderr.write("\nError logging in.\n")
+            continue
+
+        if result is None:
+            print("\nUsername or password is incorrect. Please try again "
+                  ":)\n")
+            continue
+        is_admin, user_id = result
+        if not is_admin:
+            session.save_session('client', username, is_admin, user_id)
+            show_options(username)
+        else:
+            print("\nIt appears that you are not a BeyClient. Please try "
+                  "again! \n")
 
 # Add user to 'user_info' and 'users' tables
 
@@ -668,8 +970,9 @@ def add_user(username, email, password, is_admin):
         cursor.execute(sql_users, (username, email, is_admin))
 
         conn.commit()
+        completer.invalidate('username')
         print(Fore.BLUE + f"\nUser '{username}' added successfully.")
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         print(Fore.RED + f"\nError: {err}")
 
 
@@ -715,7 +1018,7 @@ def add_user_beyblade(
         else:
             print(Fore.RED + f"\nError: User '{username}' not found.")
             return
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         print(Fore.RED + f"\nError fetching user ID: {err}")
         return
 
@@ -726,17 +1029,66 @@ def add_user_beyblade(
     try:
         cursor.execute(sql_call_sp, data)
         conn.commit()
+        if catalog_index is not None:
+            # sp_add_beyblade may have created a custom Beyblade with a
+            # generated ID, so refresh the search index on its next use
+            catalog_index.last_refresh = None
+        completer.invalidate('beyblade')
         print(Fore.BLUE + f"\nAdded new Beyblade: {name} for user {username}")
-    except mysql.connector.Error as err:
+    except backends.Error as err:
         print(Fore.RED + f"\nError adding Beyblade: {err}")
     finally:
         cursor.close()
 
 
+def import_user_beyblades(username, path):
+    """
+    Adds the Beyblades listed in a CSV file (name, type, series, the five
+    part IDs and bey_condition columns) to the user's collection in one
+    transaction, and prints the rows that could not be added.
+
+    Arguments:
+        username (str): Username of the user adding the Beyblades.
+        path (str): The CSV file to import.
+    """
+    try:
+        rows = collection_import.read_builds_csv(path)
+        added, created, failures = collection_import.import_collection(
+            conn, username, rows)
+    except (backends.Error + (OSError, ValueError)) as err:
+        print(Fore.RED + f"\nError: {err}")
+        return
+    if created and catalog_index is not None:
+        # New custom Beyblades have generated IDs, so refresh the search
+        # index on its next use
+        catalog_index.last_refresh = None
+    if added:
+        completer.invalidate('beyblade')
+    print(Fore.BLUE + f"\nAdded {added} Beyblades to your collection "
+          f"({created} new custom builds) from '{path}'.")
+    if failures:
+        print(Fore.RED + f"\n{len(failures)} rows could not be added:")
+        print(tabulate(failures, headers=['Line', 'Error'], tablefmt="grid"))
+
+
 # ----------------------------------------------------------------------
 # Command-Line Functionality
 # ----------------------------------------------------------------------
 
+# The functions run by the menu options, which can be profiled with
+# --profile and --profile-command
+COMMANDS = ['add_user', 'add_user_beyblade', 'import_user_beyblades',
+            'view_all_beyblades', 'view_user_beyblades',
+            'view_all_beyblade_parts',
+            'view_beyblade_parts', 'view_part_info',
+            'heaviest_beyblade_for_type', 'search_catalog',
+            'search_part_descriptions', 'view_all_tournament_names',
+            'view_battle_results_for_tournament',
+            'view_all_battle_locations',
+            'view_battle_results_for_location',
+            'view_all_battle_results_for_user', 'beyblade_leaderboard',
+            'view_tournament']
+
 
 def show_options(username):
     """
@@ -750,6 +1102,7 @@ def show_options(username):
 
     print('  (a) Create an account')  
     print('  (b) Add a Beyblade to your collection')  
+    print('  (s) Import Beyblades into your collection from a CSV file')
     print('\n')
 
     print('* View Beyblade Information: ')
@@ -762,6 +1115,8 @@ def show_options(username):
     print('  (f) View information about a part')  
     print('  (h) View all parts in the database')
     print('  (i) View parts of a Beyblade')
+    print('  (p) Search parts and Beyblades')
+    print('  (r) Search part descriptions')
     print('\n')
 
     print('* View Battle Information: ')
@@ -771,14 +1126,20 @@ def show_options(username):
     print('  (m) View battle results for a tournament')
     print('  (n) View battle results for location')
     print('  (o) View Beyblade Battles leaderboard')
+    print('  (g) View a bracket tournament')
     print('\n')
 
+    print('  (x) log out and quit')
     print('  (q) quit')
     print()
     ans = input('Enter an option: ').lower()
 
     if ans == 'q':
         quit_ui()
+    elif ans == 'x':
+        # Ends the cached login session, so the next run prompts again
+        session.clear_session('client')
+        quit_ui()
     elif ans == 'a':
         print("\nCREATING A NEW ACCOUNT.")
         new_username = input('Enter username: ')
@@ -793,11 +1154,15 @@ def show_options(username):
             'Enter Beyblade type (Attack, Defense, Stamina, Balance): ')
         series = input(
             'Enter Beyblade series (Metal Fusion, Metal Masters, Metal Fury): ')
-        face_bolt_id = input('Enter Face Bolt ID: ')
-        energy_ring_id = input('Enter Energy Ring ID: ')
-        fusion_wheel_id = input('Enter Fusion Wheel ID: ')
-        spin_track_id = input('Enter Spin Track ID: ')
-        performance_tip_id = input('Enter Performance Tip ID: ')
+        face_bolt_id = completer.input('Enter Face Bolt ID: ', 'face_bolt')
+        energy_ring_id = completer.input('Enter Energy Ring ID: ',
+                                         'energy_ring')
+        fusion_wheel_id = completer.input('Enter Fusion Wheel ID: ',
+                                          'fusion_wheel')
+        spin_track_id = completer.input('Enter Spin Track ID: ',
+                                        'spin_track')
+        performance_tip_id = completer.input(
+            'Enter Performance Tip ID: ', 'performance_tip')
         bey_condition = input('Enter Condition of Your Beyblade (i.e. Like New): ')
         add_user_beyblade(
             username,
@@ -811,6 +1176,13 @@ def show_options(username):
             performance_tip_id,
             bey_condition)
         show_options(username)
+    elif ans == 's':
+        path = input('Enter the path of the CSV file (name, type, series, '
+                     'face_bolt_ID, energy_ring_ID, fusion_wheel_ID, '
+                     'spin_track_ID, performance_tip_ID and bey_condition '
+                     'columns): ')
+        import_user_beyblades(username, path.strip())
+        show_options(username)
     elif ans == 'c':
         print(Fore.BLUE + "\nVIEWING ALL BEYBLADES.")
         view_all_beyblades()
@@ -833,20 +1205,16 @@ def show_options(username):
         show_options(username)
     elif ans == 'f':
         print(Fore.BLUE + "\nVIEWING INFORMATION ABOUT A PART.")
-        part_ID = input('Enter part ID: ')
+        part_ID = completer.input('Enter part ID: ', 'part')
         view_part_info(part_ID)
         show_options(username)
-    elif ans == 'g':
-        print(Fore.BLUE + "\nVIEWING ALL BEYBLADES IN YOUR COLLECTION.")
-        # view_user_beyblades()
-        show_options(username)
     elif ans == 'h':
         print(Fore.BLUE + "\nVIEWING ALL BEYBLADE PARTS.")
         view_all_beyblade_parts()
         show_options(username)
     elif ans == 'i':
         print(Fore.BLUE + "\nVIEWING ALL PARTS FOR A BEYBLADE.")
-        beyblade_ID = input('Enter Beyblade ID: ')
+        beyblade_ID = completer.input('Enter Beyblade ID: ', 'beyblade')
         view_beyblade_parts(beyblade_ID)
         show_options(username)
     elif ans == 'j':
@@ -859,21 +1227,52 @@ def show_options(username):
         show_options(username)
     elif ans == 'l':
         print(Fore.BLUE + "\nVIEWING YOUR BATTLE RESULTS.")
-        view_all_battle_results_for_user(username)
+        start_date, end_date = input_date_range()
+        view_all_battle_results_for_user(username, start_date, end_date)
         show_options(username)
     elif ans == 'm':
         print(Fore.BLUE + "\nVIEWING RESULTS FOR TOURNAMENT.")
-        tournament_name = input('Enter tournament name: ')
-        view_battle_results_for_tournament(tournament_name)
+        tournament_name = completer.input('Enter tournament name: ',
+                                          'tournament')
+        start_date, end_date = input_date_range()
+        view_battle_results_for_tournament(tournament_name, start_date,
+                                           end_date)
         show_options(username)
     elif ans == 'n':
         print(Fore.BLUE + "\nVIEWING BATTLE RESULTS FOR LOCATION.")
-        tournament_location = input('Enter tournament location: ')
-        view_battle_results_for_location(tournament_location)
+        tournament_location = completer.input(
+            'Enter tournament location: ', 'location')
+        start_date, end_date = input_date_range()
+        view_battle_results_for_location(tournament_location, start_date,
+                                         end_date)
         show_options(username)
     elif ans == 'o':
         print(Fore.BLUE + "\nVIEWING BEYBLADE BATTLE LEADERBOARD.")
-        beyblade_leaderboard()
+        beyblade_leaderboard(**input_leaderboard_filters())
+        show_options(username)
+    elif ans == 'g':
+        print(Fore.BLUE + "\nVIEWING A BRACKET TOURNAMENT.")
+        tournament_name = completer.input('Enter tournament name: ',
+                                          'tournament')
+        view_tournament(tournament_name)
+        show_options(username)
+    elif ans == 'p':
+        print(Fore.BLUE + "\nSEARCHING PARTS AND BEYBLADES.")
+        query = input('Enter search text: ')
+        search_catalog(query)
+        show_options(username)
+    elif ans == 'r':
+        print(Fore.BLUE + "\nSEARCHING PART DESCRIPTIONS.")
+        search_text = input('Enter words to search part descriptions for: ')
+        while True:
+            part_type = input(
+                'Filter by part type (Face Bolt, Energy Ring, Fusion Wheel, '
+                'Spin Track, Performance Tip), or leave blank: ').strip()
+            if not part_type or part_type in VALID_PART_TYPES:
+                break
+            print(Fore.RED + f"\nError: Invalid part type. "
+                  f"Please enter one of {VALID_PART_TYPES}.")
+        search_part_descriptions(search_text, part_type or None)
         show_options(username)
     elif ans == 'q':
         quit_ui()
@@ -883,6 +1282,10 @@ def quit_ui():
     """
     Quits the program, printing a good bye message to the user.
     """
+    if command_profiler is not None:
+        command_profiler.report()
+    if DEBUG:
+        print(result_cache.report())
     print('\n-----------------------------------------------------'
           '-----------\n')
     print('Thank you for keeping the Beyblade legacy ablaze. May the Beyblade '
@@ -900,8 +1303,21 @@ def main():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='BeyClient command-line interface to the Beyblade '
+                    'database.')
+    output.add_arguments(parser)
+    profiler.add_arguments(parser)
+    args = parser.parse_args()
+    out = output.from_args(args)
+    command_profiler = profiler.from_args(args, 'client')
+    if command_profiler is not None:
+        try:
+            command_profiler.install(globals(), COMMANDS)
+        except ValueError as err:
+            parser.error(str(err))
     # This conn is a global object that other functions can access.
     # You'll need to use cursor = conn.cursor() each time you are
     # about to execute a query with cursor.execute(<sqlquery>)
-    conn = get_conn()
+    conn = router.track(get_conn())
     main()
@@ -0,0 +1,122 @@
+"""
+This script moves old battles out of the hot battles table into the
+battles_archive table (ROW_FORMAT=COMPRESSED on MySQL) with the
+sp_archive_battles procedure. In the same transaction it adds the archived
+battles to the per-user, per-Beyblade and per-tournament rollup tables, so
+the leaderboard and statistics stay exact without scanning the archive.
+
+The battle views of both CLIs read battles_archive only when the requested
+date range starts before the newest archive cutoff (or has no start date);
+everything newer is answered from battles alone.
+
+Usage (as a BeyAdmin database user):
+
+    $ python archive.py status
+    $ python archive.py run --before 2024-01-01
+    $ python archive.py run --older-than-days 365
+
+Works with both backends (see backends.py).
+"""
+
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+import backends
+
+# Rollup tables kept up to date by sp_archive_battles
+ROLLUP_TABLES = ['battle_rollup_user', 'battle_rollup_beyblade',
+                 'battle_rollup_tournament']
+
+
+def archive_battles(conn, cutoff):
+    """
+    Archives all battles dated before the cutoff and commits.
+
+    Arguments:
+        conn - An open database connection.
+        cutoff (datetime) - Battles with battle_date < cutoff are archived.
+
+    Return value: The number of battles archived.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.callproc('sp_archive_battles', (cutoff,))
+        conn.commit()
+        cursor.execute("SELECT battles_archived FROM battle_archive_runs "
+                       "ORDER BY run_ID DESC LIMIT 1;")
+        return cursor.fetchone()[0]
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def archive_status(conn):
+    """
+    Returns the newest archive cutoff (None if nothing was archived yet) and
+    the row counts of the hot, archive and rollup tables as (table, rows)
+    pairs.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT MAX(cutoff) FROM battle_archive_runs;")
+        cutoff = cursor.fetchone()[0]
+        counts = []
+        for table in ['battles', 'battles_archive'] + ROLLUP_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table};")
+            counts.append((table, cursor.fetchone()[0]))
+    finally:
+        cursor.close()
+    return cutoff, counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Archive old battles into battles_archive.')
+    parser.add_argument('command', choices=['status', 'run'])
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--before', metavar='YYYY-MM-DD',
+                       help='archive battles dated before this day')
+    group.add_argument('--older-than-days', type=int, metavar='N',
+                       help='archive battles older than N days')
+    parser.add_argument('--user', default='jlavin',
+                        help='BeyAdmin database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        if args.before:
+            try:
+                cutoff = datetime.strptime(args.before, '%Y-%m-%d')
+            except ValueError:
+                parser.error('--before must be a date in YYYY-MM-DD form')
+        elif args.older_than_days is not None:
+            day = date.today() - timedelta(days=args.older_than_days)
+            cutoff = datetime(day.year, day.month, day.day)
+        else:
+            parser.error('run needs --before or --older-than-days')
+
+    try:
+        conn = backends.connect(args.user, args.password)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        if args.command == 'run':
+            archived = archive_battles(conn, cutoff)
+            print(f"Archived {archived} battles dated before {cutoff:%Y-%m-%d}.")
+        cutoff, counts = archive_status(conn)
+        print(f"Archive cutoff: {cutoff if cutoff is not None else 'none'}")
+        for table, rows in counts:
+            print(f"{table:<26} {rows} rows")
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,616 @@
+"""
+This module provides the database backends used by both CLIs. The backend is
+chosen with the BEYBLADEDB_BACKEND environment variable:
+
+    mysql  (default) - the MySQL server set up with the SQL scripts in the
+                       README, reached over mysql.connector.
+    sqlite           - an embedded SQLite database file (no server needed).
+                       The path is taken from BEYBLADEDB_SQLITE_PATH
+                       (default: beybladedb.sqlite3).
+
+A read replica of the selected database can be configured with
+BEYBLADEDB_REPLICA_HOST and BEYBLADEDB_REPLICA_PORT (MySQL) or
+BEYBLADEDB_SQLITE_REPLICA_PATH (SQLite); see replica.py.
+
+Both backends hand out connections with the mysql.connector interface used
+throughout the CLIs (conn.cursor(), cursor.execute() with %s placeholders,
+cursor.callproc(), conn.commit(), ...), so the CLI functions work unchanged.
+The SQLite backend reproduces the schema (setup-sqlite.sql) and implements
+sp_add_beyblade, sp_record_battle, sp_record_round, sp_add_user,
+sp_change_password, authenticate and udf_heaviest_beyblade_for_type in Python.
+
+To create and load an SQLite database from the CSV files, run:
+
+    $ python backends.py init-sqlite [PATH]
+"""
+
+import csv
+import hashlib
+import os
+import re
+import secrets
+import sqlite3
+import sys
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+try:
+    import mysql.connector
+except ImportError:  # Only the SQLite backend is usable without the connector
+    mysql = None
+
+# Exceptions raised by any backend. The CLIs catch these instead of
+# mysql.connector.Error so that errors from both backends are handled.
+if mysql is not None:
+    Error = (mysql.connector.Error, sqlite3.Error)
+else:
+    Error = (sqlite3.Error,)
+
+# Errors caused by the values sent (constraint violations, invalid data)
+# rather than by the connection; retrying such a statement cannot succeed
+if mysql is not None:
+    DataError = (mysql.connector.IntegrityError, mysql.connector.DataError,
+                 sqlite3.IntegrityError, sqlite3.DataError)
+else:
+    DataError = (sqlite3.IntegrityError, sqlite3.DataError)
+
+# MySQL error codes checked by get_conn() in the CLIs
+ER_ACCESS_DENIED_ERROR = 1045
+ER_BAD_DB_ERROR = 1049
+
+# Directory holding the SQL scripts and CSV files
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Tables loaded from CSV files, in foreign key order (see load-data.sql)
+CSV_TABLES = ['users', 'parts', 'beyblades', 'beycollection', 'battles']
+
+# Example users created by setup-passwords.sql, as
+# (username, password, is_admin)
+SEED_USERS = [('jlavin', 'jlavinpw', 1),
+              ('gokus', 'gokuspw', 0),
+              ('midoriyai', 'midoriyaipw', 0)]
+
+# ----------------------------------------------------------------------
+# MySQL Backend
+# ----------------------------------------------------------------------
+
+
+class MySQLBackend:
+    """
+    Connects to the MySQL server, as the CLIs always have.
+    """
+    name = 'mysql'
+
+    def __init__(self, host='localhost', port='3306', database='beybladedb'):
+        self.host = host
+        # Find port in MAMP or MySQL Workbench GUI or with
+        # SHOW VARIABLES WHERE variable_name LIKE 'port';
+        self.port = port
+        self.database = database
+
+    def connect(self, user, password):
+        """
+        Returns a new mysql.connector connection for the given database user.
+        """
+        if mysql is None:
+            raise ImportError('mysql-connector-python is not installed; '
+                              'install it or set BEYBLADEDB_BACKEND=sqlite.')
+        return mysql.connector.connect(
+            host=self.host,
+            user=user,
+            port=self.port,
+            password=password,
+            database=self.database,
+        )
+
+# ----------------------------------------------------------------------
+# SQLite Backend
+# ----------------------------------------------------------------------
+
+
+def _convert_datetime(value):
+    """
+    Converts a stored DATETIME value to datetime, like mysql.connector does.
+    """
+    text = value.decode()
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    return text
+
+
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(
+    datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+
+# Matches "CALL sp_name(...)" statements so they can be run in Python
+_CALL_RE = re.compile(r'^\s*CALL\s+(\w+)\s*\((.*)\)\s*;?\s*$',
+                      re.IGNORECASE | re.DOTALL)
+
+
+def make_salt(num_chars=8):
+    """
+    Generates a salt of printable ASCII characters (code 32 through 126),
+    like the make_salt function of setup-passwords.sql.
+    """
+    num_chars = min(20, num_chars)
+    return ''.join(chr(32 + secrets.randbelow(95)) for _ in range(num_chars))
+
+
+def hash_password(salt, password):
+    """
+    Returns SHA2(CONCAT(salt, password), 256) as a hexadecimal string.
+    """
+    return hashlib.sha256((salt + password).encode('utf-8')).hexdigest()
+
+
+def sp_add_beyblade(conn, user_id, name, type, series, face_bolt_id,
+                    energy_ring_id, fusion_wheel_id, spin_track_id,
+                    performance_tip_id, bey_condition):
+    """
+    Python version of sp_add_beyblade: reuses the Beyblade with the same
+    parts if there is one, and otherwise inserts a custom Beyblade with a
+    generated ID, then links it to the user in beycollection.
+    """
+    row = conn.execute(
+        "SELECT beyblade_ID FROM beyblades WHERE face_bolt_ID = ? "
+        "AND energy_ring_ID = ? AND fusion_wheel_ID = ? AND spin_track_ID = ? "
+        "AND performance_tip_ID = ? LIMIT 1;",
+        (face_bolt_id, energy_ring_id, fusion_wheel_id, spin_track_id,
+         performance_tip_id)).fetchone()
+    if row is None:
+        beyblade_id = hashlib.md5(str(uuid.uuid1()).encode()).hexdigest()[:10]
+        conn.execute(
+            "INSERT INTO beyblades (beyblade_ID, name, type, is_custom, "
+            "series, face_bolt_ID, energy_ring_ID, fusion_wheel_ID, "
+            "spin_track_ID, performance_tip_ID) "
+            "VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?);",
+            (beyblade_id, name, type, series, face_bolt_id, energy_ring_id,
+             fusion_wheel_id, spin_track_id, performance_tip_id))
+    else:
+        beyblade_id = row[0]
+    conn.execute(
+        "INSERT INTO beycollection (user_ID, beyblade_ID, bey_condition) "
+        "VALUES (?, ?, ?);", (user_id, beyblade_id, bey_condition))
+
+
+def sp_record_battle(conn, tournament_name, battle_date, location,
+                     player1_id, player2_id, player1_beyblade_id,
+                     player2_beyblade_id, winner_id):
+    """
+    Python version of sp_record_battle: inserts one battle result.
+    """
+    conn.execute(
+        "INSERT INTO battles (tournament_name, battle_date, location, "
+        "player1_ID, player2_ID, player1_beyblade_ID, player2_beyblade_ID, "
+        "winner_ID) VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+        (tournament_name, battle_date, location, player1_id, player2_id,
+         player1_beyblade_id, player2_beyblade_id, winner_id))
+
+
+def sp_add_user(conn, new_username, password, is_admin):
+    """
+    Python version of sp_add_user: stores a salted password hash.
+    """
+    salt = make_salt(8)
+    conn.execute("INSERT INTO user_info VALUES (?, ?, ?, ?);",
+                 (new_username, salt, hash_password(salt, password),
+                  int(bool(is_admin))))
+
+
+def sp_change_password(conn, username, new_password):
+    """
+    Python version of sp_change_password: stores a new salt and hash.
+    """
+    salt = make_salt(8)
+    conn.execute("UPDATE user_info SET salt = ?, password_hash = ? "
+                 "WHERE username = ?;",
+                 (salt, hash_password(salt, new_password), username))
+
+
+def sp_record_journaled_battle(conn, entry_id, *battle):
+    """
+    Python version of sp_record_journaled_battle: records a battle from the
+    battle journal unless its entry was already recorded.
+    """
+    if conn.execute("SELECT 1 FROM battle_journal_applied "
+                    "WHERE entry_ID = ?;", (entry_id,)).fetchone():
+        return
+    sp_record_battle(conn, *battle)
+    conn.execute(
+        "INSERT INTO battle_journal_applied (entry_ID, battle_ID, applied_at) "
+        "VALUES (?, last_insert_rowid(), datetime('now', 'localtime'));",
+        (entry_id,))
+
+
+def sp_record_round(conn, battles):
+    """
+    Python version of sp_record_round: checks a round of battles given as a
+    JSON array in one query, leaving the battles that fail in the temporary
+    table round_errors, and inserts them all with one statement if none do.
+    The caller commits (or rolls back).
+    """
+    conn.execute("DROP TABLE IF EXISTS temp.round_battles;")
+    conn.execute("DROP TABLE IF EXISTS temp.round_errors;")
+    # Values missing from an object or of the wrong type become NULL
+    columns = ', '.join(
+        [f"CASE json_type(value, '$.{name}') WHEN 'text' THEN "
+         f"NULLIF(TRIM(json_extract(value, '$.{name}')), '') END AS {name}"
+         for name in ('tournament_name', 'location')] +
+        ["datetime(json_extract(value, '$.battle_date')) AS battle_date"] +
+        [f"CASE json_type(value, '$.{name}') WHEN 'integer' THEN "
+         f"json_extract(value, '$.{name}') END AS {name}"
+         for name in ('player1_ID', 'player2_ID', 'player1_beyblade_ID',
+                      'player2_beyblade_ID', 'winner_ID')])
+    conn.execute(f"CREATE TEMP TABLE round_battles AS SELECT key + 1 AS "
+                 f"row_no, {columns} FROM json_each(?);", (battles,))
+    conn.execute(
+        "CREATE TEMP TABLE round_errors AS "
+        "SELECT row_no, error FROM ("
+        "  SELECT r.row_no, CASE"
+        "  WHEN r.tournament_name IS NULL OR r.battle_date IS NULL"
+        "    OR r.location IS NULL OR r.player1_ID IS NULL"
+        "    OR r.player2_ID IS NULL OR r.player1_beyblade_ID IS NULL"
+        "    OR r.player2_beyblade_ID IS NULL"
+        "    THEN 'Missing or invalid fields.'"
+        "  WHEN r.player1_ID = r.player2_ID"
+        "    THEN 'The two players must be different Bladers.'"
+        "  WHEN c1.user_beyblade_ID IS NULL"
+        "    THEN 'Beyblade-Player ID ' || r.player1_beyblade_ID ||"
+        "    ' is not in the collection of player 1 (' || r.player1_ID || ').'"
+        "  WHEN c2.user_beyblade_ID IS NULL"
+        "    THEN 'Beyblade-Player ID ' || r.player2_beyblade_ID ||"
+        "    ' is not in the collection of player 2 (' || r.player2_ID || ').'"
+        "  WHEN r.winner_ID IS NOT NULL AND r.winner_ID NOT IN"
+        "    (r.player1_beyblade_ID, r.player2_beyblade_ID)"
+        "    THEN 'The winner must be one of the two Beyblade-Player IDs.'"
+        "  END AS error"
+        "  FROM round_battles r"
+        "  LEFT JOIN beycollection c1"
+        "    ON c1.user_beyblade_ID = r.player1_beyblade_ID"
+        "    AND c1.user_ID = r.player1_ID"
+        "    AND c1.user_ID IN (SELECT user_ID FROM users)"
+        "  LEFT JOIN beycollection c2"
+        "    ON c2.user_beyblade_ID = r.player2_beyblade_ID"
+        "    AND c2.user_ID = r.player2_ID"
+        "    AND c2.user_ID IN (SELECT user_ID FROM users)"
+        ") WHERE error IS NOT NULL;")
+    if conn.execute("SELECT 1 FROM round_errors LIMIT 1;").fetchone() is None:
+        conn.execute(
+            "INSERT INTO battles (tournament_name, battle_date, location, "
+            "player1_ID, player2_ID, player1_beyblade_ID, "
+            "player2_beyblade_ID, winner_ID) "
+            "SELECT tournament_name, battle_date, location, player1_ID, "
+            "player2_ID, player1_beyblade_ID, player2_beyblade_ID, winner_ID "
+            "FROM round_battles ORDER BY row_no;")
+    conn.execute("DROP TABLE temp.round_battles;")
+
+
+def sp_archive_battles(conn, cutoff):
+    """
+    Python version of sp_archive_battles: moves battles dated before the
+    cutoff into battles_archive and adds them to the rollup tables. The
+    caller commits (or rolls back) the whole move.
+    """
+    conn.execute(
+        "INSERT INTO battles_archive SELECT battle_ID, tournament_name, "
+        "battle_date, location, player1_ID, player2_ID, player1_beyblade_ID, "
+        "player2_beyblade_ID, winner_ID FROM battles WHERE battle_date < ?;",
+        (cutoff,))
+    archived = conn.execute("SELECT changes();").fetchone()[0]
+
+    # "WHERE true" lets SQLite parse ON CONFLICT after INSERT ... SELECT
+    conn.execute(
+        "INSERT INTO battle_rollup_user (user_ID, battles, wins, draws) "
+        "SELECT user_ID, COUNT(*), SUM(won), SUM(draw) FROM ("
+        "  SELECT player1_ID AS user_ID, "
+        "  COALESCE(winner_ID = player1_beyblade_ID, 0) AS won, "
+        "  winner_ID IS NULL AS draw FROM battles WHERE battle_date < ? "
+        "  UNION ALL "
+        "  SELECT player2_ID, COALESCE(winner_ID = player2_beyblade_ID, 0), "
+        "  winner_ID IS NULL FROM battles WHERE battle_date < ?"
+        ") WHERE true GROUP BY user_ID "
+        "ON CONFLICT(user_ID) DO UPDATE SET "
+        "battles = battles + excluded.battles, wins = wins + excluded.wins, "
+        "draws = draws + excluded.draws;", (cutoff, cutoff))
+    conn.execute(
+        "INSERT INTO battle_rollup_beyblade (user_beyblade_ID, battles, wins) "
+        "SELECT user_beyblade_ID, COUNT(*), SUM(won) FROM ("
+        "  SELECT player1_beyblade_ID AS user_beyblade_ID, "
+        "  COALESCE(winner_ID = player1_beyblade_ID, 0) AS won "
+        "  FROM battles WHERE battle_date < ? "
+        "  UNION ALL "
+        "  SELECT player2_beyblade_ID, "
+        "  COALESCE(winner_ID = player2_beyblade_ID, 0) "
+        "  FROM battles WHERE battle_date < ?"
+        ") WHERE true GROUP BY user_beyblade_ID "
+        "ON CONFLICT(user_beyblade_ID) DO UPDATE SET "
+        "battles = battles + excluded.battles, wins = wins + excluded.wins;",
+        (cutoff, cutoff))
+    conn.execute(
+        "INSERT INTO battle_rollup_tournament (tournament_name, battles, "
+        "draws, first_battle, last_battle) "
+        "SELECT tournament_name, COUNT(*), SUM(winner_ID IS NULL), "
+        "MIN(battle_date), MAX(battle_date) FROM battles "
+        "WHERE battle_date < ? GROUP BY tournament_name "
+        "ON CONFLICT(tournament_name) DO UPDATE SET "
+        "battles = battles + excluded.battles, "
+        "draws = draws + excluded.draws, "
+        "first_battle = MIN(first_battle, excluded.first_battle), "
+        "last_battle = MAX(last_battle, excluded.last_battle);", (cutoff,))
+    conn.execute("DELETE FROM battles WHERE battle_date < ?;", (cutoff,))
+    conn.execute(
+        "INSERT INTO battle_archive_runs (cutoff, battles_archived, run_at) "
+        "VALUES (?, ?, datetime('now', 'localtime'));", (cutoff, archived))
+
+
+# Stored procedures available to CALL and callproc() on SQLite
+PROCEDURES = {
+    'sp_add_beyblade': sp_add_beyblade,
+    'sp_record_battle': sp_record_battle,
+    'sp_add_user': sp_add_user,
+    'sp_change_password': sp_change_password,
+    'sp_archive_battles': sp_archive_battles,
+    'sp_record_journaled_battle': sp_record_journaled_battle,
+    'sp_record_round': sp_record_round,
+}
+
+
+def _authenticate(conn, username, password):
+    """
+    Python version of the authenticate function: returns 1 if the password
+    matches the stored salted hash for the user and 0 otherwise.
+    """
+    row = conn.execute(
+        "SELECT salt, password_hash FROM user_info WHERE username = ?;",
+        (username,)).fetchone()
+    if row is None or password is None:
+        return 0
+    return 1 if hash_password(row[0], password) == row[1] else 0
+
+
+def _heaviest_beyblade_for_type(conn, beyblade_type):
+    """
+    Python version of udf_heaviest_beyblade_for_type: returns the ID of the
+    heaviest Beyblade of the given type, summing the weights of its parts.
+    """
+    row = conn.execute(
+        "SELECT b.beyblade_ID FROM beyblades AS b "
+        "JOIN parts AS fb ON b.face_bolt_ID = fb.part_ID "
+        "JOIN parts AS er ON b.energy_ring_ID = er.part_ID "
+        "JOIN parts AS fw ON b.fusion_wheel_ID = fw.part_ID "
+        "JOIN parts AS st ON b.spin_track_ID = st.part_ID "
+        "JOIN parts AS pt ON b.performance_tip_ID = pt.part_ID "
+        "WHERE b.type = ? GROUP BY b.beyblade_ID "
+        "ORDER BY SUM(fb.weight + er.weight + fw.weight + st.weight "
+        "+ pt.weight) DESC LIMIT 1;", (beyblade_type,)).fetchone()
+    return row[0] if row else None
+
+
+class SQLiteCursor:
+    """
+    A cursor over an SQLite connection that accepts the mysql.connector
+    %s placeholder style and runs CALL statements and callproc() through
+    the Python stored procedures.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.raw.cursor()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, operation, params=()):
+        match = _CALL_RE.match(operation)
+        if match:
+            return self._call(match.group(1), params)
+        self._cursor.execute(operation.replace('%s', '?'), tuple(params))
+
+    def executemany(self, operation, seq_params):
+        self._cursor.executemany(operation.replace('%s', '?'),
+                                 [tuple(p) for p in seq_params])
+
+    def callproc(self, procname, args=()):
+        self._call(procname, args)
+        return args
+
+    def _call(self, procname, args):
+        procedure = PROCEDURES.get(procname)
+        if procedure is None:
+            raise sqlite3.OperationalError(
+                f"PROCEDURE {procname} does not exist")
+        procedure(self._connection.raw, *args)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """
+    An SQLite connection with the parts of the mysql.connector connection
+    interface the CLIs use.
+    """
+    dialect = 'sqlite'
+
+    def __init__(self, path):
+        self.raw = sqlite3.connect(path,
+                                   detect_types=sqlite3.PARSE_DECLTYPES,
+                                   check_same_thread=False)
+        self.raw.execute('PRAGMA foreign_keys = ON;')
+        self.raw.create_function(
+            'authenticate', 2,
+            lambda username, password: _authenticate(self.raw, username,
+                                                     password))
+        self.raw.create_function(
+            'udf_heaviest_beyblade_for_type', 1,
+            lambda beyblade_type: _heaviest_beyblade_for_type(
+                self.raw, beyblade_type))
+        self.raw.create_function('make_salt', 1, make_salt)
+
+    def cursor(self, *args, **kwargs):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self.raw.close()
+
+
+class SQLiteBackend:
+    """
+    Embedded SQLite database stored in a single file. There are no database
+    users, so the user and password given to connect() are ignored; the
+    application-level login (authenticate) works as on MySQL.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path='beybladedb.sqlite3'):
+        self.path = path
+
+    def connect(self, user=None, password=None):
+        if not os.path.exists(self.path):
+            raise sqlite3.OperationalError(
+                f"SQLite database '{self.path}' does not exist; create it "
+                "with: python backends.py init-sqlite")
+        return SQLiteConnection(self.path)
+
+    def setup(self, data_dir=BASE_DIR):
+        """
+        Creates the schema and loads the CSV files and example users, like
+        running setup.sql, load-data.sql and setup-passwords.sql on MySQL.
+        """
+        conn = SQLiteConnection(self.path)
+        try:
+            with open(os.path.join(BASE_DIR, 'setup-sqlite.sql'),
+                      encoding='utf-8') as f:
+                conn.raw.executescript(f.read())
+            load_csv_files(conn.raw, data_dir)
+            for username, password, is_admin in SEED_USERS:
+                sp_add_user(conn.raw, username, password, is_admin)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def load_csv_files(raw_conn, data_dir):
+    """
+    Loads users.csv, parts.csv, beyblades.csv, beycollection.csv and
+    battles.csv into an SQLite database. Like LOAD DATA, foreign keys are
+    not checked while loading.
+    """
+    raw_conn.execute('PRAGMA foreign_keys = OFF;')
+    try:
+        for table in CSV_TABLES:
+            with open(os.path.join(data_dir, f'{table}.csv'), newline='',
+                      encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader)  # Skip the header row
+                rows = [row for row in reader if row]
+            if rows:
+                placeholders = ', '.join('?' * len(rows[0]))
+                raw_conn.executemany(
+                    f"INSERT INTO {table} VALUES ({placeholders});", rows)
+    finally:
+        raw_conn.execute('PRAGMA foreign_keys = ON;')
+
+# ----------------------------------------------------------------------
+# Backend Selection
+# ----------------------------------------------------------------------
+
+
+def get_backend():
+    """
+    Returns the backend selected by the BEYBLADEDB_BACKEND environment
+    variable (mysql by default).
+    """
+    name = os.environ.get('BEYBLADEDB_BACKEND', 'mysql').lower()
+    if name == 'mysql':
+        return MySQLBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(os.environ.get('BEYBLADEDB_SQLITE_PATH',
+                                            'beybladedb.sqlite3'))
+    raise ValueError(f"Unknown BEYBLADEDB_BACKEND '{name}' "
+                     "(expected 'mysql' or 'sqlite').")
+
+
+def get_replica_backend():
+    """
+    Returns a backend for the read replica of the selected database, or None
+    if no replica is configured. The replica has the same database users as
+    the primary.
+    """
+    name = os.environ.get('BEYBLADEDB_BACKEND', 'mysql').lower()
+    if name == 'mysql' and os.environ.get('BEYBLADEDB_REPLICA_HOST'):
+        return MySQLBackend(os.environ['BEYBLADEDB_REPLICA_HOST'],
+                            os.environ.get('BEYBLADEDB_REPLICA_PORT', '3306'))
+    if name == 'sqlite' and os.environ.get('BEYBLADEDB_SQLITE_REPLICA_PATH'):
+        return SQLiteBackend(os.environ['BEYBLADEDB_SQLITE_REPLICA_PATH'])
+    return None
+
+
+def connect(user, password):
+    """
+    Returns a new connection from the selected backend for the given
+    database user.
+    """
+    return get_backend().connect(user, password)
+
+
+def dialect(conn):
+    """
+    Returns 'sqlite' for SQLite connections and 'mysql' otherwise, for the
+    few queries whose SQL differs between the backends.
+    """
+    return getattr(conn, 'dialect', 'mysql')
+
+
+def main(argv=None):
+    """
+    Command-line entry point: `python backends.py init-sqlite [PATH]`.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != 'init-sqlite':
+        sys.stderr.write('Usage: python backends.py init-sqlite [PATH]\n')
+        sys.exit(1)
+    path = argv[1] if len(argv) > 1 else os.environ.get(
+        'BEYBLADEDB_SQLITE_PATH', 'beybladedb.sqlite3')
+    SQLiteBackend(path).setup()
+    print(f"Created SQLite database '{path}'.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,426 @@
+"""
+This module holds battles in memory in a compact struct-of-arrays layout,
+for analytics done in Python rather than in SQL. A list of row tuples from
+fetchall() costs a few hundred bytes per battle; a BattleStore keeps one
+NumPy array per column instead, about 40 bytes per battle, so ten million
+battles fit in about 400 MB:
+
+  * battle_ID and the player and Beyblade-Player IDs as int32, with NULL_ID
+    for NULL (the winner_ID of a draw),
+  * battle_date as datetime64[s],
+  * tournament_name and location dictionary-encoded: int32 codes plus the
+    list of distinct values (see snapshot.DictColumn).
+
+The store is filled straight from cursor.fetchmany() batches, so the rows
+of only one batch exist as Python objects at a time. Filters are boolean
+masks built on the arrays (string filters compare codes, not strings), and
+groupings are computed with np.unique/np.bincount.
+
+Usage (as any database user):
+
+    $ python battlestore.py
+    $ python battlestore.py --since 2024-01-01 --by location
+    $ python battlestore.py --tournament 'WBBA Prelim' --by user
+
+Works with both backends (see backends.py).
+"""
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from tabulate import tabulate
+
+import backends
+from snapshot import ARCHIVE_TABLES, FETCH_BATCH, NULL_ID, DictColumn
+
+# Columns of a store, in the order they are selected, as (column name, kind)
+# pairs. Kinds: 'int' -> int32, 'datetime' -> datetime64[s],
+# 'str' -> dictionary-encoded int32 codes.
+COLUMNS = [
+    ('battle_ID', 'int'),
+    ('tournament_name', 'str'),
+    ('battle_date', 'datetime'),
+    ('location', 'str'),
+    ('player1_ID', 'int'),
+    ('player2_ID', 'int'),
+    ('player1_beyblade_ID', 'int'),
+    ('player2_beyblade_ID', 'int'),
+    ('winner_ID', 'int'),
+]
+
+_KINDS = dict(COLUMNS)
+_DTYPES = {'int': np.int32, 'str': np.int32, 'datetime': 'datetime64[s]'}
+
+# Growth factor of the arrays when the capacity runs out
+GROWTH = 1.5
+
+# What count_by() and records() group battles by
+GROUPS = ['tournament', 'location', 'day', 'user', 'beyblade']
+
+
+class BattleStore:
+    """
+    Battles held as one NumPy array per column. The arrays have spare
+    capacity at the end; column() returns views of the filled part.
+
+    Arguments:
+        capacity (int) - Number of battles to allocate room for up front.
+    """
+
+    def __init__(self, capacity=0):
+        self.size = 0
+        self._arrays = {name: np.empty(capacity, dtype=_DTYPES[kind])
+                        for name, kind in COLUMNS}
+        # For each string column, the distinct values in code order and the
+        # code of each value
+        self._dictionaries = {name: [] for name, kind in COLUMNS
+                              if kind == 'str'}
+        self._codes = {name: {} for name in self._dictionaries}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self._arrays['battle_ID'])
+
+    @property
+    def nbytes(self):
+        """
+        Returns the memory held by the arrays (capacity included), in bytes.
+        """
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def _reserve(self, capacity):
+        """
+        Grows the arrays to hold at least `capacity` battles.
+        """
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, int(self.capacity * GROWTH))
+        for name, array in self._arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._arrays[name] = grown
+
+    def _encode(self, name, values):
+        """
+        Returns the codes of a batch of strings, giving each value not seen
+        before the next code.
+        """
+        codes = self._codes[name]
+        dictionary = self._dictionaries[name]
+        out = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(dictionary)
+                dictionary.append(value)
+            out.append(code)
+        return out
+
+    def append_rows(self, rows):
+        """
+        Appends a batch of battle rows, tuples with the columns of COLUMNS
+        in order (as returned by fetchmany()).
+        """
+        if not rows:
+            return
+        start, end = self.size, self.size + len(rows)
+        self._reserve(end)
+        for (name, kind), values in zip(COLUMNS, zip(*rows)):
+            target = self._arrays[name][start:end]
+            if kind == 'int':
+                target[:] = [NULL_ID if v is None else v for v in values]
+            elif kind == 'datetime':
+                # None becomes NaT
+                target[:] = np.array(values, dtype='datetime64[s]')
+            else:
+                target[:] = self._encode(name, values)
+        self.size = end
+
+    @classmethod
+    def from_cursor(cls, cursor, capacity=0, batch_size=FETCH_BATCH):
+        """
+        Builds a store from an executed cursor whose rows have the columns of
+        COLUMNS, fetching batch_size rows at a time.
+
+        Arguments:
+            cursor - A cursor on which the battle query has been executed.
+            capacity (int) - Expected number of battles, allocated up front
+                so the arrays are not grown and copied while loading.
+            batch_size (int) - Rows per fetchmany() call.
+
+        Return value: The filled BattleStore.
+        """
+        store = cls(capacity)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            store.append_rows(rows)
+        return store
+
+    @classmethod
+    def load(cls, conn, start_date=None, end_date=None, archive=True,
+             batch_size=FETCH_BATCH):
+        """
+        Loads the battles of a window of days from the database.
+
+        Arguments:
+            conn - An open database connection.
+            start_date (str) - First day to load, 'YYYY-MM-DD' (None: all).
+            end_date (str) - Day after the last day to load (None: all).
+            archive (bool) - Whether to include battles_archive.
+            batch_size (int) - Rows per fetchmany() call.
+
+        Return value: The filled BattleStore.
+        """
+        names = ", ".join(name for name, _ in COLUMNS)
+        conditions, params = [], []
+        if start_date is not None:
+            conditions.append("battle_date >= %s")
+            params.append(start_date)
+        if end_date is not None:
+            conditions.append("battle_date < %s")
+            params.append(end_date)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        tables = ['battles'] + ([ARCHIVE_TABLES['battles']] if archive else [])
+
+        cursor = conn.cursor()
+        try:
+            # Counting first lets the arrays be allocated once, at their
+            # final size
+            cursor.execute(" UNION ALL ".join(
+                f"SELECT COUNT(*) FROM {table}{where}" for table in tables),
+                tuple(params) * len(tables))
+            capacity = sum(row[0] for row in cursor.fetchall())
+            cursor.execute(" UNION ALL ".join(
+                f"SELECT {names} FROM {table}{where}" for table in tables),
+                tuple(params) * len(tables))
+            return cls.from_cursor(cursor, capacity, batch_size)
+        finally:
+            cursor.close()
+
+    def trim(self):
+        """
+        Releases the spare capacity at the end of the arrays.
+        """
+        for name, array in self._arrays.items():
+            if len(array) != self.size:
+                self._arrays[name] = array[:self.size].copy()
+
+    # ------------------------------------------------------------------
+    # Columns
+    # ------------------------------------------------------------------
+
+    def column(self, name):
+        """
+        Returns a column of the stored battles: an array view for numeric
+        columns, a DictColumn for tournament_name and location.
+        """
+        array = self._arrays[name][:self.size]
+        if _KINDS[name] == 'str':
+            return DictColumn(array, self._dictionaries[name])
+        return array
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def select(self, mask):
+        """
+        Returns a new store with the battles selected by a boolean mask (or
+        an array of row positions). String dictionaries are shared.
+        """
+        rows = np.asarray(mask)
+        if rows.dtype == np.bool_:
+            rows = np.flatnonzero(rows)
+        store = BattleStore()
+        store.size = len(rows)
+        store._arrays = {name: array[:self.size][rows]
+                         for name, array in self._arrays.items()}
+        store._dictionaries = self._dictionaries
+        store._codes = self._codes
+        return store
+
+    # ------------------------------------------------------------------
+    # Filtering
+    # ------------------------------------------------------------------
+
+    def mask(self, tournament_name=None, location=None, user_ID=None,
+             user_beyblade_ID=None, start_date=None, end_date=None):
+        """
+        Returns a boolean mask of the battles matching every given filter.
+
+        Arguments:
+            tournament_name (str) - Only battles of this tournament.
+            location (str) - Only battles at this location.
+            user_ID (int) - Only battles this user took part in.
+            user_beyblade_ID (int) - Only battles of this Beyblade-Player.
+            start_date (str) - Only battles on or after this day.
+            end_date (str) - Only battles before this day.
+        """
+        mask = np.ones(self.size, dtype=np.bool_)
+        if tournament_name is not None:
+            mask &= self.column('tournament_name').mask_equal(tournament_name)
+        if location is not None:
+            mask &= self.column('location').mask_equal(location)
+        if user_ID is not None:
+            mask &= ((self.column('player1_ID') == user_ID) |
+                     (self.column('player2_ID') == user_ID))
+        if user_beyblade_ID is not None:
+            mask &= ((self.column('player1_beyblade_ID') == user_beyblade_ID) |
+                     (self.column('player2_beyblade_ID') == user_beyblade_ID))
+        dates = self.column('battle_date')
+        if start_date is not None:
+            mask &= dates >= np.datetime64(start_date, 's')
+        if end_date is not None:
+            mask &= dates < np.datetime64(end_date, 's')
+        return mask
+
+    # ------------------------------------------------------------------
+    # Grouping
+    # ------------------------------------------------------------------
+
+    def _group_keys(self, group, rows):
+        """
+        Returns the (codes, decode) pair of a single-valued grouping: an
+        integer key per selected battle and a function mapping a key to its
+        displayed value.
+        """
+        if group in ('tournament', 'location'):
+            column = self.column('tournament_name' if group == 'tournament'
+                                 else group)
+            return column.codes[rows], column.dictionary.__getitem__
+        if group == 'day':
+            days = self.column('battle_date')[rows].astype('datetime64[D]')
+            return days.astype(np.int64), lambda key: (
+                np.datetime64(int(key), 'D').astype(datetime))
+        raise ValueError(f"Unknown grouping: {group}")
+
+    def count_by(self, group, mask=None):
+        """
+        Counts the battles per tournament, location or day.
+
+        Arguments:
+            group (str) - 'tournament', 'location' or 'day'.
+            mask (ndarray) - Boolean mask of the battles to count (None:
+                all of them).
+
+        Return value: A list of (value, battles) tuples, by decreasing
+                      battles for tournaments and locations and by day for
+                      days.
+        """
+        rows = slice(None) if mask is None else np.flatnonzero(mask)
+        keys, decode = self._group_keys(group, rows)
+        values, counts = np.unique(keys, return_counts=True)
+        result = [(decode(v), int(c)) for v, c in zip(values, counts)]
+        if group != 'day':
+            result.sort(key=lambda row: (-row[1], row[0]))
+        return result
+
+    def records(self, group, mask=None):
+        """
+        Counts the battles, wins and draws of each user or Beyblade-Player
+        (or of each tournament, location or day, where wins are the battles
+        that were not a draw).
+
+        Arguments:
+            group (str) - One of GROUPS.
+            mask (ndarray) - Boolean mask of the battles to count (None:
+                all of them).
+
+        Return value: A list of (key, battles, wins, draws) tuples, by
+                      decreasing wins and then battles (by day for days).
+        """
+        rows = np.arange(self.size) if mask is None else np.flatnonzero(mask)
+        winner = self.column('winner_ID')[rows]
+        draws = winner == NULL_ID
+        if group in ('user', 'beyblade'):
+            # One entry per side of each battle
+            # (winner_ID is the Beyblade-Player ID of the winning Beyblade)
+            b1 = self.column('player1_beyblade_ID')[rows]
+            b2 = self.column('player2_beyblade_ID')[rows]
+            if group == 'user':
+                keys = np.concatenate([self.column('player1_ID')[rows],
+                                       self.column('player2_ID')[rows]])
+            else:
+                keys = np.concatenate([b1, b2])
+            wins = np.concatenate([winner == b1, winner == b2])
+            draws = np.concatenate([draws, draws])
+            decode = int
+        else:
+            keys, decode = self._group_keys(group, rows)
+            wins = ~draws
+        values, inverse = np.unique(keys, return_inverse=True)
+        battles = np.bincount(inverse, minlength=len(values))
+        won = np.bincount(inverse, weights=wins, minlength=len(values))
+        drawn = np.bincount(inverse, weights=draws, minlength=len(values))
+        result = [(decode(v), int(b), int(w), int(d))
+                  for v, b, w, d in zip(values, battles, won, drawn)]
+        if group != 'day':
+            result.sort(key=lambda row: (-row[2], -row[1]))
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load battles into a compact in-memory store and print '
+                    'their records.')
+    parser.add_argument('--by', choices=GROUPS, default='tournament',
+                        help='what to group the battles by '
+                             '(default: tournament)')
+    parser.add_argument('--tournament', help='only battles of this tournament')
+    parser.add_argument('--location', help='only battles at this location')
+    parser.add_argument('--since', metavar='YYYY-MM-DD',
+                        help='only battles on or after this day')
+    parser.add_argument('--until', metavar='YYYY-MM-DD',
+                        help='only battles on or before this day')
+    parser.add_argument('--top', type=int, default=20, metavar='K',
+                        help='rows to print (default: 20)')
+    parser.add_argument('--user', default='jlavin', help='database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    try:
+        end_date = args.until and (
+            datetime.strptime(args.until, '%Y-%m-%d')
+            + timedelta(days=1)).strftime('%Y-%m-%d')
+        if args.since:
+            datetime.strptime(args.since, '%Y-%m-%d')
+    except ValueError:
+        parser.error('dates must be in YYYY-MM-DD form')
+
+    try:
+        conn = backends.connect(args.user, args.password)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        started = time.perf_counter()
+        store = BattleStore.load(conn, args.since, end_date)
+        elapsed = time.perf_counter() - started
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    print(f"Loaded {len(store)} battles in {elapsed:.2f}s "
+          f"({store.nbytes / 1024 / 1024:.1f} MiB, "
+          f"{store.nbytes / max(len(store), 1):.0f} bytes per battle).")
+    mask = store.mask(tournament_name=args.tournament,
+                      location=args.location)
+    rows = store.records(args.by, mask)[:args.top]
+    if rows:
+        print(tabulate(rows, headers=[args.by.capitalize(), 'Battles',
+                                      'Wins', 'Draws'], tablefmt="grid"))
+    else:
+        print('No battles match these filters.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,484 @@
+"""
+This script loads the CSV files of the Beyblade database (users.csv,
+parts.csv, beyblades.csv, beycollection.csv and battles.csv) into the
+database, replacing load-data.sql. Unlike LOAD DATA LOCAL INFILE it needs no
+local_infile setting on the server, and one bad row does not fail the whole
+file:
+
+  * Each CSV file is streamed in chunks of CHUNK_SIZE rows, so files larger
+    than memory load in constant memory.
+  * Every row is validated before it is sent: column count, types (INT,
+    DECIMAL, BOOLEAN, DATETIME, ENUM values, VARCHAR lengths), required
+    values, duplicate keys, and foreign keys, against in-memory sets of the
+    keys already in the database or loaded earlier in the run.
+  * Rows that fail validation, or that the database refuses, are written to
+    a reject file (table, line, error and the original fields) and the rest
+    of the file still loads.
+  * Validated chunks are inserted over several connections in parallel, one
+    transaction and one multi-row INSERT per chunk. Since foreign keys were
+    checked in memory, the MySQL sessions skip the foreign key checks, which
+    with the multi-row INSERTs is where LOAD DATA gets its speed.
+  * Progress (rows, percentage of the file, rows per second) is printed as
+    the chunks commit.
+
+Tables are loaded one after another in foreign key order; the chunks of one
+table are independent of each other. On SQLite, which allows one writer at a
+time, a single connection is used.
+
+Usage (as a BeyAdmin database user, after setup.sql):
+
+    $ python bulkload.py [DATA_DIR] [--tables battles] [--workers 4]
+                         [--chunk-size 5000] [--rejects rejects.csv]
+
+Works with both backends (see backends.py).
+"""
+
+import argparse
+import csv
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+import backends
+
+# Rows validated and inserted per chunk (and per transaction)
+CHUNK_SIZE = 5000
+
+# Connections inserting chunks in parallel (MySQL only)
+WORKERS = 4
+
+# Default reject file
+REJECTS_PATH = 'bulkload-rejects.csv'
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 1.0
+
+# Accepted formats of DATETIME values (hours may have one digit, as in
+# users.csv)
+DATETIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+# Field values read as NULL in nullable columns
+NULL_VALUES = ['', '\\N', 'NULL']
+
+# A table column: its kind ('int', 'str', 'decimal', 'bool', 'datetime' or
+# 'enum'), the kind's limit (VARCHAR length, DECIMAL digits before the
+# point, or ENUM values), whether it may be NULL, and the table whose key
+# it references
+Column = namedtuple('Column', ['name', 'kind', 'limit', 'nullable',
+                               'references'])
+
+
+def _col(name, kind, limit=None, nullable=False, references=None):
+    return Column(name, kind, limit, nullable, references)
+
+
+# Columns of each table in CSV (and table) order, as in setup.sql; the first
+# column is the key. Tables are loaded in this order.
+TABLES = {
+    'users': [
+        _col('user_ID', 'int'),
+        _col('username', 'str', 250),
+        _col('email', 'str', 250),
+        _col('is_admin', 'bool'),
+        _col('date_joined', 'datetime', nullable=True),
+    ],
+    'parts': [
+        _col('part_ID', 'str', 20),
+        _col('part_type', 'enum', ['Face Bolt', 'Energy Ring', 'Fusion Wheel',
+                                   'Spin Track', 'Performance Tip']),
+        _col('weight', 'decimal', 2),
+        _col('description', 'str', 65535, nullable=True),
+    ],
+    'beyblades': [
+        _col('beyblade_ID', 'str', 10),
+        _col('name', 'str', 250),
+        _col('type', 'enum', ['Attack', 'Defense', 'Stamina', 'Balance']),
+        _col('is_custom', 'bool'),
+        _col('series', 'enum', ['Metal Fusion', 'Metal Masters',
+                                'Metal Fury']),
+        _col('face_bolt_ID', 'str', 20, references='parts'),
+        _col('energy_ring_ID', 'str', 20, references='parts'),
+        _col('fusion_wheel_ID', 'str', 20, references='parts'),
+        _col('spin_track_ID', 'str', 20, references='parts'),
+        _col('performance_tip_ID', 'str', 20, references='parts'),
+    ],
+    'beycollection': [
+        _col('user_beyblade_ID', 'int'),
+        _col('user_ID', 'int', references='users'),
+        _col('beyblade_ID', 'str', 10, references='beyblades'),
+        _col('bey_condition', 'str', 100),
+    ],
+    'battles': [
+        _col('battle_ID', 'int'),
+        _col('tournament_name', 'str', 250),
+        _col('battle_date', 'datetime'),
+        _col('location', 'str', 250),
+        _col('player1_ID', 'int', references='users'),
+        _col('player2_ID', 'int', references='users'),
+        _col('player1_beyblade_ID', 'int', references='beycollection'),
+        _col('player2_beyblade_ID', 'int', references='beycollection'),
+        _col('winner_ID', 'int', nullable=True, references='beycollection'),
+    ],
+}
+
+# Tables whose keys other tables reference, and so are kept in memory
+KEYED_TABLES = {c.references for cols in TABLES.values() for c in cols
+                if c.references}
+
+TRUE_VALUES = ['1', 'true', 't', 'y', 'yes']
+FALSE_VALUES = ['0', 'false', 'f', 'n', 'no']
+
+
+def _convert(column, text):
+    """
+    Converts one CSV field to the value inserted into a column.
+
+    Raises ValueError with a message naming the column for a bad value.
+    """
+    if column.nullable and text.strip() in NULL_VALUES:
+        return None
+    if column.kind == 'str':
+        if not text.strip() and not column.nullable:
+            raise ValueError(f"{column.name} is required")
+        if len(text) > column.limit:
+            raise ValueError(f"{column.name} is longer than {column.limit} "
+                             "characters")
+        return text
+    text = text.strip()
+    if not text:
+        raise ValueError(f"{column.name} is required")
+    if column.kind == 'int':
+        try:
+            value = int(text)
+        except ValueError:
+            raise ValueError(f"{column.name} '{text}' is not a whole number")
+        if not -2**31 <= value < 2**31:
+            raise ValueError(f"{column.name} {value} is out of range")
+        return value
+    if column.kind == 'decimal':
+        try:
+            value = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"{column.name} '{text}' is not a number")
+        if not value.is_finite() or abs(value) >= 10 ** column.limit:
+            raise ValueError(f"{column.name} {text} is out of range")
+        return value
+    if column.kind == 'bool':
+        if text.lower() in TRUE_VALUES:
+            return 1
+        if text.lower() in FALSE_VALUES:
+            return 0
+        raise ValueError(f"{column.name} '{text}' is not a boolean")
+    if column.kind == 'enum':
+        if text not in column.limit:
+            raise ValueError(f"{column.name} '{text}' is not one of "
+                             f"{', '.join(column.limit)}")
+        return text
+    if len(text) == 19:  # Fast path for YYYY-MM-DD HH:MM:SS ('datetime')
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"{column.name} '{text}' is not a date "
+                     "(expected YYYY-MM-DD HH:MM:SS)")
+
+
+def validate_row(table, fields, keys, seen):
+    """
+    Validates and converts one CSV row.
+
+    Arguments:
+        table (str) - The table the row is for.
+        fields (list) - The row's fields.
+        keys (dict) - Table name -> set of keys known to exist, for the
+            foreign keys.
+        seen (set) - Keys of the table loaded so far, for duplicates (None
+            to leave duplicate keys to the database).
+
+    Return value: The tuple of values to insert.
+
+    Raises ValueError with the reason the row is rejected.
+    """
+    columns = TABLES[table]
+    if len(fields) != len(columns):
+        raise ValueError(f"expected {len(columns)} fields, found "
+                         f"{len(fields)}")
+    values = tuple(_convert(column, text)
+                   for column, text in zip(columns, fields))
+    if seen is not None and values[0] in seen:
+        raise ValueError(f"duplicate {columns[0].name} {values[0]}")
+    for column, value in zip(columns, values):
+        if (column.references and value is not None and
+                value not in keys[column.references]):
+            raise ValueError(f"{column.name} {value} does not exist in "
+                             f"{column.references}")
+    return values
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Streams a CSV file (after its header row) in chunks.
+
+    Return value: A generator of (chunk, bytes read so far) pairs, where a
+                  chunk is a list of (line number, fields) pairs.
+    """
+    with open(path, 'rb') as raw:
+        lines = (line.decode('utf-8') for line in raw)
+        reader = csv.reader(lines)
+        next(reader, None)  # Skip the header row
+        chunk = []
+        for fields in reader:
+            if not fields:
+                continue
+            chunk.append((reader.line_num, fields))
+            if len(chunk) >= chunk_size:
+                yield chunk, raw.tell()
+                chunk = []
+        if chunk:
+            yield chunk, raw.tell()
+
+
+class BulkLoader:
+    """
+    Loads CSV files into the database with parallel connections.
+
+    Arguments:
+        connect - A function returning a new database connection.
+        workers (int) - Connections inserting in parallel (1 on SQLite).
+        chunk_size (int) - Rows per chunk and transaction.
+        rejects_path (str) - CSV file the rejected rows are written to.
+        progress (file) - Where progress lines go, or None for silence.
+    """
+
+    def __init__(self, connect, workers=WORKERS, chunk_size=CHUNK_SIZE,
+                 rejects_path=REJECTS_PATH, progress=sys.stderr):
+        self._connect = connect
+        self.chunk_size = chunk_size
+        self.rejects_path = rejects_path
+        self.progress = progress
+        self.rejected = 0
+        self._rejects = None
+        self._conns = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = self._conn()
+        self.dialect = backends.dialect(conn)
+        # SQLite allows one writer at a time
+        self.workers = 1 if self.dialect == 'sqlite' else max(workers, 1)
+        self.keys = {table: self._load_keys(conn, table)
+                     for table in KEYED_TABLES}
+
+    def _conn(self):
+        """
+        Returns the calling thread's connection, opening it on first use.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            cursor = conn.cursor()
+            try:
+                # Foreign keys are checked in memory before inserting
+                if backends.dialect(conn) == 'mysql':
+                    cursor.execute("SET SESSION foreign_key_checks = 0;")
+                else:
+                    cursor.execute("PRAGMA foreign_keys = OFF;")
+            finally:
+                cursor.close()
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def _load_keys(self, conn, table):
+        key = TABLES[table][0]
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {key.name} FROM {table};")
+            return {row[0] for row in cursor}
+        finally:
+            cursor.close()
+
+    def reject(self, table, line, fields, error):
+        """
+        Appends a rejected row to the reject file.
+        """
+        with self._lock:
+            if self._rejects is None:
+                f = open(self.rejects_path, 'w', newline='', encoding='utf-8')
+                self._rejects = (f, csv.writer(f))
+                self._rejects[1].writerow(['table', 'line', 'error',
+                                           'fields...'])
+            self._rejects[1].writerow([table, line, str(error)] + fields)
+            self.rejected += 1
+
+    def _insert(self, table, rows):
+        """
+        Inserts a chunk of validated rows in one transaction, run by a
+        worker thread. If the database refuses the chunk (e.g. a duplicate
+        email), it is retried one row per transaction.
+
+        Arguments:
+            rows (list) - (line, fields, values) tuples.
+
+        Return value: The list of (line, fields, values, error) rows
+                      refused.
+        """
+        conn = self._conn()
+        columns = TABLES[table]
+        sql = (f"INSERT INTO {table} ({', '.join(c.name for c in columns)}) "
+               f"VALUES ({', '.join(['%s'] * len(columns))})")
+        cursor = conn.cursor()
+        try:
+            try:
+                cursor.executemany(sql, [values for _, _, values in rows])
+                conn.commit()
+                return []
+            except backends.DataError:
+                conn.rollback()
+            refused = []
+            for line, fields, values in rows:
+                try:
+                    cursor.execute(sql, values)
+                    conn.commit()
+                except backends.DataError as err:
+                    conn.rollback()
+                    refused.append((line, fields, values, err))
+            return refused
+        finally:
+            cursor.close()
+
+    def _report(self, table, loaded, done, size, started, final=False):
+        if self.progress is None:
+            return
+        elapsed = max(time.monotonic() - started, 1e-9)
+        percent = 100 * done / size if size else 100
+        end = '\n' if final else '\r'
+        self.progress.write(f"{table}: {loaded} rows ({percent:.0f}%), "
+                            f"{loaded / elapsed:,.0f} rows/s{' ' * 8}{end}")
+        self.progress.flush()
+
+    def load_table(self, table, path):
+        """
+        Loads one CSV file into its table.
+
+        Return value: A (loaded, rejected) pair of row counts.
+        """
+        keys = self.keys.get(table)
+        seen = keys if keys is not None else None
+        size = os.path.getsize(path)
+        started = last_report = time.monotonic()
+        loaded = rejected = 0
+        pending = []
+
+        def collect(future, rows):
+            nonlocal loaded, rejected
+            refused = future.result()
+            for line, fields, values, error in refused:
+                self.reject(table, line, fields, error)
+                if keys is not None:
+                    # Rows referencing a refused key must be rejected too
+                    keys.discard(values[0])
+            loaded += len(rows) - len(refused)
+            rejected += len(refused)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for chunk, done in read_chunks(path, self.chunk_size):
+                rows = []
+                for line, fields in chunk:
+                    try:
+                        values = validate_row(table, fields, self.keys, seen)
+                    except ValueError as err:
+                        self.reject(table, line, fields, err)
+                        rejected += 1
+                        continue
+                    if keys is not None:
+                        keys.add(values[0])
+                    rows.append((line, fields, values))
+                if rows:
+                    pending.append((pool.submit(self._insert, table, rows),
+                                    rows))
+                # Keep at most two chunks per worker in memory
+                while len(pending) > 2 * self.workers or (
+                        pending and pending[0][0].done()):
+                    collect(*pending.pop(0))
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    self._report(table, loaded, done, size, started)
+                    last_report = time.monotonic()
+            for future, rows in pending:
+                collect(future, rows)
+        self._report(table, loaded, size, size, started, final=True)
+        return loaded, rejected
+
+    def load(self, data_dir, tables=None):
+        """
+        Loads the CSV files of the given tables (default: all of TABLES)
+        from a directory, in foreign key order.
+
+        Return value: A list of (table, loaded, rejected) tuples.
+        """
+        results = []
+        for table in TABLES:
+            if tables is None or table in tables:
+                path = os.path.join(data_dir, f'{table}.csv')
+                results.append((table,) + self.load_table(table, path))
+        return results
+
+    def close(self):
+        if self._rejects is not None:
+            self._rejects[0].close()
+        for conn in self._conns:
+            conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Load the CSV files into the database in parallel '
+                    'chunks, with validation and a reject file.')
+    parser.add_argument('data_dir', nargs='?', default=backends.BASE_DIR,
+                        help='directory holding the CSV files')
+    parser.add_argument('--tables', type=lambda s: s.split(','),
+                        metavar='T1,T2', help='only load these tables')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--rejects', default=REJECTS_PATH, metavar='PATH')
+    parser.add_argument('--user', default='jlavin',
+                        help='BeyAdmin database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+    unknown = [t for t in args.tables or [] if t not in TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+
+    try:
+        loader = BulkLoader(
+            lambda: backends.connect(args.user, args.password),
+            workers=args.workers, chunk_size=args.chunk_size,
+            rejects_path=args.rejects)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        results = loader.load(args.data_dir, args.tables)
+    except (backends.Error + (OSError,)) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        loader.close()
+    for table, loaded, rejected in results:
+        print(f"{table:<14} {loaded} rows loaded, {rejected} rejected")
+    if loader.rejected:
+        print(f"Rejected rows were written to {args.rejects}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+"""
+This module reads the change log: the change_log table, to which triggers
+append one row (change_ID, table, operation, primary key) for every row
+inserted, updated or deleted in battles, beycollection, beyblades, parts and
+users (see setup.sql and setup-routines.sql). Caches, summary tables and other
+downstream components tail it from a checkpoint and refresh only the rows
+that changed, instead of rescanning the tables.
+
+A consumer with a name keeps its checkpoint (the last change_ID it
+processed) in change_log_checkpoints, so it resumes where it stopped after a
+restart; an unnamed consumer (such as the caches of the CLIs) only sees
+changes made after its first poll.
+
+`prune` deletes the changes older than a retention period (default:
+RETENTION), but never one a named consumer has not processed yet. An unnamed
+consumer that falls further behind than that cannot know which changes it
+missed, so it flags them (see ChangeLogConsumer.missed) and its cache drops
+everything.
+
+change_IDs are assigned when a row is written but become visible when its
+transaction commits, so on MySQL a lower change_ID can appear after a higher
+one. A consumer therefore stops at a gap in the change_IDs until the missing
+change commits, or until GAP_TIMEOUT seconds have passed (the transaction
+was rolled back and the change_ID will never be used).
+
+Usage (as a BeyAdmin database user):
+
+    $ python changelog.py status
+    $ python changelog.py tail [--after ID] [--follow]
+    $ python changelog.py prune [--keep-hours HOURS]
+"""
+
+import argparse
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import backends
+
+# Tables with change log triggers and the key column logged as row_key
+CHANGE_TABLES = {
+    'battles': 'battle_ID',
+    'beycollection': 'user_beyblade_ID',
+    'beyblades': 'beyblade_ID',
+    'parts': 'part_ID',
+    'users': 'user_ID',
+}
+
+# Changes read per query
+BATCH_SIZE = 1000
+
+# Seconds a consumer waits for a missing change_ID before skipping it
+GAP_TIMEOUT = 5.0
+
+# Seconds between polls of `tail --follow`
+POLL_INTERVAL = 1.0
+
+# Seconds changes are kept by prune()
+RETENTION = 24 * 3600
+
+Change = namedtuple('Change', ['change_ID', 'table_name', 'operation',
+                               'row_key', 'changed_at'])
+
+
+def latest_change_id(conn):
+    """
+    Returns the newest change_ID, or 0 if the change log is empty.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT MAX(change_ID) FROM change_log;")
+        return cursor.fetchone()[0] or 0
+    finally:
+        cursor.close()
+
+
+def read_changes(conn, after, limit=BATCH_SIZE):
+    """
+    Returns up to `limit` changes with a change_ID greater than `after`, as
+    Change tuples in change_ID order.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT change_ID, table_name, operation, row_key, changed_at "
+            "FROM change_log WHERE change_ID > %s "
+            "ORDER BY change_ID LIMIT %s;", (after, limit))
+        return [Change(*row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def get_checkpoint(conn, consumer):
+    """
+    Returns the last change_ID processed by a named consumer, or None if it
+    has no checkpoint yet.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT change_ID FROM change_log_checkpoints "
+                       "WHERE consumer = %s;", (consumer,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    return None if row is None else row[0]
+
+
+def save_checkpoint(conn, consumer, change_id):
+    """
+    Records the last change_ID processed by a named consumer and commits.
+    """
+    cursor = conn.cursor()
+    try:
+        now = datetime.now().replace(microsecond=0)
+        cursor.execute("UPDATE change_log_checkpoints SET change_ID = %s, "
+                       "updated_at = %s WHERE consumer = %s;",
+                       (change_id, now, consumer))
+        if cursor.rowcount == 0:
+            cursor.execute("INSERT INTO change_log_checkpoints (consumer, "
+                           "change_ID, updated_at) VALUES (%s, %s, %s);",
+                           (consumer, change_id, now))
+        conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def prune(conn, keep=RETENTION):
+    """
+    Deletes the changes older than `keep` seconds that every named consumer
+    has processed, and commits. The newest change and the change at the
+    oldest checkpoint are kept, so change_IDs are never reused.
+
+    Return value: The number of changes deleted.
+    """
+    # changed_at is set by the database, so the cutoff is computed there
+    if backends.dialect(conn) == 'mysql':
+        cutoff = "NOW() - INTERVAL %s SECOND"
+    else:
+        cutoff = "datetime('now', '-' || %s || ' seconds')"
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT MAX(change_ID) FROM change_log "
+                       f"WHERE changed_at < {cutoff};", (int(keep),))
+        expired = cursor.fetchone()[0]
+        if expired is None:
+            return 0
+        cursor.execute("SELECT MIN(change_ID) FROM change_log_checkpoints;")
+        oldest = cursor.fetchone()[0]
+        end = min(expired + 1, latest_change_id(conn))
+        if oldest is not None:
+            end = min(end, oldest)
+        cursor.execute("DELETE FROM change_log WHERE change_ID < %s;",
+                       (end,))
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class ChangeLogConsumer:
+    """
+    Tails the change log from a position, delivering each change once and in
+    change_ID order.
+
+    Arguments:
+        name (str) - Name of the consumer, whose checkpoint is kept in
+            change_log_checkpoints; None for an in-memory position that
+            starts at the newest change.
+        tables (iterable) - Tables whose changes are delivered (default: all
+            of CHANGE_TABLES); changes to other tables are skipped.
+        batch_size (int) - Changes read per query.
+        gap_timeout (float) - Seconds to wait for a missing change_ID.
+
+    `missed` is set when the consumer finds that changes after its position
+    were pruned before it read them; whoever acts on the changes must then
+    assume anything changed, and reset it.
+    """
+
+    def __init__(self, name=None, tables=None, batch_size=BATCH_SIZE,
+                 gap_timeout=GAP_TIMEOUT):
+        self.name = name
+        self.tables = set(tables) if tables is not None else None
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+        self.position = None
+        self.missed = False
+        # (missing change_ID, time first seen) of the gap being waited on
+        self._gap = None
+
+    def _start(self, conn):
+        if self.name is not None:
+            self.position = get_checkpoint(conn, self.name)
+        if self.position is None:
+            if self.name is None:
+                self.position = latest_change_id(conn)
+            else:
+                # Start before the oldest change still in the log, so a
+                # pruned prefix is not mistaken for a gap
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT MIN(change_ID) FROM change_log;")
+                    oldest = cursor.fetchone()[0]
+                finally:
+                    cursor.close()
+                self.position = (oldest or 1) - 1
+
+    def _pruned(self, conn, change_id):
+        """
+        Returns whether a missing change_ID was pruned (rather than not
+        committed yet): pruning only removes the oldest changes.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT MIN(change_ID) FROM change_log;")
+            oldest = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        return oldest is not None and oldest > change_id
+
+    def poll(self, conn):
+        """
+        Returns the changes after the current position (up to batch_size,
+        only those of the consumer's tables) and advances the position past
+        them. A named consumer's checkpoint is saved by commit().
+        """
+        if self.position is None:
+            self._start(conn)
+        changes = []
+        for change in read_changes(conn, self.position, self.batch_size):
+            missing = self.position + 1
+            if change.change_ID != missing:
+                if self._gap is None or self._gap[0] != missing:
+                    if self._pruned(conn, missing):
+                        self.missed = True
+                        self._gap = (missing, float('-inf'))
+                    else:
+                        # A change_ID not committed yet, or rolled back
+                        self._gap = (missing, time.monotonic())
+                if time.monotonic() - self._gap[1] < self.gap_timeout:
+                    break
+            self._gap = None
+            self.position = change.change_ID
+            if self.tables is None or change.table_name in self.tables:
+                changes.append(change)
+        return changes
+
+    def commit(self, conn):
+        """
+        Saves the current position as the checkpoint of a named consumer.
+        """
+        if self.name is not None and self.position is not None:
+            save_checkpoint(conn, self.name, self.position)
+
+    def follow(self, conn, handler, interval=POLL_INTERVAL):
+        """
+        Polls forever, calling handler with each non-empty list of changes
+        and committing the position after the handler returns.
+        """
+        while True:
+            changes = self.poll(conn)
+            if changes:
+                handler(changes)
+            self.commit(conn)
+            # The next poll must see rows committed since this one
+            conn.commit()
+            if len(changes) < self.batch_size:
+                time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Inspect, tail or prune the change log.')
+    parser.add_argument('command', choices=['status', 'tail', 'prune'])
+    parser.add_argument('--after', type=int, default=None, metavar='ID',
+                        help='tail changes after this change_ID '
+                             '(default: the newest 20)')
+    parser.add_argument('--follow', action='store_true',
+                        help='keep printing new changes')
+    parser.add_argument('--keep-hours', type=float,
+                        default=RETENTION / 3600, metavar='HOURS',
+                        help='prune changes older than this (default: '
+                             f'{RETENTION // 3600})')
+    parser.add_argument('--user', default='jlavin',
+                        help='BeyAdmin database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    try:
+        conn = backends.connect(args.user, args.password)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        if args.command == 'status':
+            print(f"Newest change_ID: {latest_change_id(conn)}")
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT consumer, change_ID, updated_at "
+                               "FROM change_log_checkpoints "
+                               "ORDER BY consumer;")
+                for consumer, change_id, updated_at in cursor.fetchall():
+                    print(f"{consumer:<30} {change_id:>10} ({updated_at})")
+            finally:
+                cursor.close()
+        elif args.command == 'prune':
+            print(f"Pruned {prune(conn, args.keep_hours * 3600)} changes.")
+        else:
+            consumer = ChangeLogConsumer()
+            consumer.position = (args.after if args.after is not None
+                                 else max(latest_change_id(conn) - 20, 0))
+
+            def show(changes):
+                for change in changes:
+                    print(f"{change.change_ID:>10} {change.changed_at} "
+                          f"{change.operation:<6} {change.table_name} "
+                          f"{change.row_key}")
+
+            if args.follow:
+                consumer.follow(conn, show)
+            else:
+                show(consumer.poll(conn))
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+This script adds many Beyblades to a Blader's collection at once (e.g. a
+collection kept in a spreadsheet) from a CSV file with the header
+
+    name,type,series,face_bolt_ID,energy_ring_ID,fusion_wheel_ID,
+    spin_track_ID,performance_tip_ID,bey_condition
+
+(on one line). It adds every row like option (b) of app-client.py, but with
+set-based lookups and in one transaction: the user is looked up once, the
+parts of all rows are checked with one query, and the builds (combinations
+of parts) are matched against the beyblades table with one query per
+BATCH_SIZE builds. A build that is not in the table yet is created as a
+custom Beyblade by one sp_add_beyblade call (Bladers cannot insert into
+beyblades directly), and all other rows are added to beycollection with one
+multi-row INSERT. Rows that are not valid (missing fields, unknown type,
+series or parts) are reported with their line number and skipped; if the
+database refuses the import, nothing is added.
+
+Usage (as a Blader database user):
+
+    $ python collection_import.py gokus my-collection.csv
+
+Bladers can also import a file with option (s) of app-client.py.
+"""
+
+import argparse
+import csv
+import sys
+
+import backends
+import rollups
+
+# Number of builds (or part IDs) looked up per query
+BATCH_SIZE = 500
+
+# Columns expected in the CSV file, in the parameter order of
+# sp_add_beyblade after the user_ID
+CSV_COLUMNS = ['name', 'type', 'series', 'face_bolt_ID', 'energy_ring_ID',
+               'fusion_wheel_ID', 'spin_track_ID', 'performance_tip_ID',
+               'bey_condition']
+
+# The part columns of a build and the part_type each must have
+PART_COLUMNS = [('face_bolt_ID', 'Face Bolt'),
+                ('energy_ring_ID', 'Energy Ring'),
+                ('fusion_wheel_ID', 'Fusion Wheel'),
+                ('spin_track_ID', 'Spin Track'),
+                ('performance_tip_ID', 'Performance Tip')]
+
+# Longest values accepted by the beyblades and beycollection tables
+MAX_NAME_LENGTH = 250
+MAX_CONDITION_LENGTH = 100
+
+SQL_COLLECTION = ("INSERT INTO beycollection (user_ID, beyblade_ID, "
+                  "bey_condition) VALUES (%s, %s, %s)")
+
+
+def read_builds_csv(path):
+    """
+    Reads the Beyblades to add from a CSV file.
+
+    Return value: A list of (line number, row dictionary) pairs.
+
+    Raises ValueError if the header is missing one of CSV_COLUMNS.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        header = reader.fieldnames or []
+        missing = [c for c in CSV_COLUMNS if c not in header]
+        if missing:
+            raise ValueError(f"{path} is missing the columns: "
+                             f"{', '.join(missing)}")
+        # Line 1 is the header
+        return [(line, {c: (row.get(c) or '').strip() for c in CSV_COLUMNS})
+                for line, row in enumerate(reader, start=2)]
+
+
+def _validate(row):
+    """
+    Returns an error message for a row that cannot be added, or None.
+    """
+    missing = [c for c in CSV_COLUMNS if not row[c]]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if row['type'] not in rollups.BEYBLADE_TYPES:
+        return f"type must be one of {', '.join(rollups.BEYBLADE_TYPES)}"
+    if row['series'] not in rollups.BEYBLADE_SERIES:
+        return f"series must be one of {', '.join(rollups.BEYBLADE_SERIES)}"
+    if len(row['name']) > MAX_NAME_LENGTH:
+        return f'name is longer than {MAX_NAME_LENGTH} characters'
+    if len(row['bey_condition']) > MAX_CONDITION_LENGTH:
+        return f'condition is longer than {MAX_CONDITION_LENGTH} characters'
+    return None
+
+
+def _parts(cursor, part_ids):
+    """
+    Returns the (part_ID, part_type) of each of the given part IDs that
+    exists, keyed by the lower-cased part ID: MySQL matches them
+    case-insensitively, and the stored part_ID is what the beyblades table
+    refers to.
+    """
+    part_ids = sorted(part_ids)
+    parts = {}
+    for start in range(0, len(part_ids), BATCH_SIZE):
+        chunk = part_ids[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute("SELECT part_ID, part_type FROM parts "
+                       f"WHERE part_ID IN ({placeholders});", chunk)
+        parts.update((part_id.lower(), (part_id, part_type))
+                     for part_id, part_type in cursor.fetchall())
+    return parts
+
+
+def _find_builds(cursor, builds):
+    """
+    Returns the beyblade_ID of each of the given builds (tuples of the five
+    stored part IDs) that is in the beyblades table, matching them
+    BATCH_SIZE at a time with one row-value IN query.
+    """
+    builds = sorted(builds)
+    columns = ', '.join(column for column, _ in PART_COLUMNS)
+    found = {}
+    for start in range(0, len(builds), BATCH_SIZE):
+        chunk = builds[start:start + BATCH_SIZE]
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))
+        # The lowest ID is taken when several Beyblades share the parts
+        cursor.execute(f"SELECT {columns}, MIN(beyblade_ID) FROM beyblades "
+                       f"WHERE ({columns}) IN ({placeholders}) "
+                       f"GROUP BY {columns};",
+                       [part_id for build in chunk for part_id in build])
+        found.update((tuple(row[:5]), row[5]) for row in cursor.fetchall())
+    return found
+
+
+def import_collection(conn, username, rows):
+    """
+    Adds Beyblades to a user's collection in one transaction, skipping and
+    reporting the rows that are not valid.
+
+    Arguments:
+        conn - An open database connection (as the Blader or a BeyAdmin).
+        username (str) - The user whose collection the Beyblades join.
+        rows (list) - (line number, row dictionary) pairs, as returned by
+            read_builds_csv().
+
+    Return value: A (added, created, failures) tuple: the number of
+                  Beyblades added to the collection, how many of them were
+                  new custom Beyblades, and a list of (line, message) tuples
+                  for the rows that were skipped.
+
+    Raises ValueError if the user does not exist.
+    """
+    failures = []
+    valid = []
+    for line, row in rows:
+        error = _validate(row)
+        if error:
+            failures.append((line, error))
+        else:
+            valid.append((line, row))
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT user_ID FROM users WHERE username = %s;",
+                       (username,))
+        user_row = cursor.fetchone()
+        if user_row is None:
+            raise ValueError(f"User '{username}' not found.")
+        user_id = user_row[0]
+
+        parts = _parts(cursor, {row[column] for _, row in valid
+                                for column, _ in PART_COLUMNS})
+        entries = []  # (row, build) pairs
+        for line, row in valid:
+            build = []
+            for column, part_type in PART_COLUMNS:
+                part_id, found = parts.get(row[column].lower(), (None, None))
+                if found != part_type:
+                    failures.append((line, f"'{row[column]}' is not a "
+                                           f"{part_type} part"))
+                    break
+                build.append(part_id)
+            else:
+                entries.append((row, tuple(build)))
+
+        known = _find_builds(cursor, {build for _, build in entries})
+        created = set()
+        inserts, waiting = [], []
+        for row, build in entries:
+            if build in known:
+                inserts.append((user_id, known[build], row['bey_condition']))
+            elif build not in created:
+                # Creates the custom Beyblade and adds this copy of it
+                cursor.execute(
+                    "CALL sp_add_beyblade(%s, %s, %s, %s, %s, %s, %s, %s, "
+                    "%s, %s)", [user_id, row['name'], row['type'],
+                                row['series'], *build, row['bey_condition']])
+                created.add(build)
+            else:
+                waiting.append((row, build))
+        if waiting:
+            # Further copies of the new custom Beyblades, now with IDs
+            known.update(_find_builds(cursor, {b for _, b in waiting}))
+            inserts += [(user_id, known[build], row['bey_condition'])
+                        for row, build in waiting]
+        if inserts:
+            cursor.executemany(SQL_COLLECTION, inserts)
+        conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    failures.sort()
+    return len(inserts) + len(created), len(created), failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Add Beyblades to a Blader's collection in bulk from a "
+                    "CSV file.")
+    parser.add_argument('username', help='the Blader whose collection the '
+                                         'Beyblades join')
+    parser.add_argument('path', help='CSV file with the columns '
+                                     + ','.join(CSV_COLUMNS))
+    parser.add_argument('--user', default='gokus',
+                        help='database user (default: gokus)')
+    parser.add_argument('--password', default='gokuspw')
+    args = parser.parse_args(argv)
+
+    try:
+        rows = read_builds_csv(args.path)
+    except (OSError, ValueError) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        conn = backends.connect(args.user, args.password)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        added, created, failures = import_collection(conn, args.username,
+                                                     rows)
+    except (backends.Error + (ValueError,)) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    for line, message in failures:
+        print(f"line {line}: {message}")
+    print(f"Added {added} Beyblades ({created} new custom builds), "
+          f"{len(failures)} rows failed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+This module provides readline tab-completion of IDs for the prompts of both
+CLIs (part IDs, Beyblade IDs, usernames, tournament names and locations), so
+typos are caught before a query is sent to the database.
+
+The valid values for each kind of prompt are loaded lazily, the first time
+Tab is pressed at such a prompt, and cached in a sorted, lower-cased prefix
+index. Completing a prefix is a binary search plus a scan of the matches
+(capped at MAX_MATCHES), so it stays responsive with hundreds of thousands
+of candidates. The CLIs invalidate a kind after writes that can add values
+to it (e.g. 'username' after adding a user), and before each prompt the
+change log (see changelog.py) is checked for writes made by other sessions,
+which invalidate the kinds loaded from the changed tables.
+
+On platforms without the readline module, prompts fall back to plain input().
+"""
+
+from bisect import bisect_left
+
+import changelog
+
+try:
+    import readline
+except ImportError:  # e.g. Windows without pyreadline
+    readline = None
+
+# Queries returning the valid values for each kind of prompt
+COMPLETION_QUERIES = {
+    'part': "SELECT part_ID FROM parts;",
+    'face_bolt': "SELECT part_ID FROM parts WHERE part_type = 'Face Bolt';",
+    'energy_ring':
+        "SELECT part_ID FROM parts WHERE part_type = 'Energy Ring';",
+    'fusion_wheel':
+        "SELECT part_ID FROM parts WHERE part_type = 'Fusion Wheel';",
+    'spin_track': "SELECT part_ID FROM parts WHERE part_type = 'Spin Track';",
+    'performance_tip':
+        "SELECT part_ID FROM parts WHERE part_type = 'Performance Tip';",
+    'beyblade': "SELECT beyblade_ID FROM beyblades;",
+    'username': "SELECT username FROM users;",
+    'tournament': "SELECT tournament_name FROM battles UNION "
+                  "SELECT tournament_name FROM battle_rollup_tournament "
+                  "UNION SELECT tournament_name FROM tournaments;",
+    'location': "SELECT location FROM battles UNION "
+                "SELECT location FROM battles_archive UNION "
+                "SELECT location FROM tournaments;",
+}
+
+# Kinds that are loaded from the parts table, invalidated together
+PART_KINDS = ('part', 'face_bolt', 'energy_ring', 'fusion_wheel',
+              'spin_track', 'performance_tip')
+
+# Kinds loaded from each table with a change log (see changelog.py)
+TABLE_KINDS = {
+    'parts': PART_KINDS,
+    'beyblades': ('beyblade',),
+    'users': ('username',),
+    'battles': ('tournament', 'location'),
+}
+
+# Maximum number of candidates offered for one Tab press
+MAX_MATCHES = 200
+
+# Rows pulled from the cursor per fetchmany() call while loading
+FETCH_BATCH = 10000
+
+
+class PrefixIndex:
+    """
+    Sorted, case-insensitive index of candidate values supporting prefix
+    lookups by binary search.
+    """
+
+    def __init__(self, values):
+        pairs = sorted({(v.lower(), v) for v in values if v})
+        self._keys = [key for key, _ in pairs]
+        self._values = [value for _, value in pairs]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def complete(self, prefix, limit=MAX_MATCHES):
+        """
+        Returns up to `limit` values starting with `prefix` (ignoring case),
+        in sorted order.
+        """
+        prefix = prefix.lower()
+        i = bisect_left(self._keys, prefix)
+        matches = []
+        while (i < len(self._keys) and len(matches) < limit and
+               self._keys[i].startswith(prefix)):
+            matches.append(self._values[i])
+            i += 1
+        return matches
+
+
+class Completer:
+    """
+    Loads and caches a PrefixIndex per prompt kind and wires it into
+    readline while a prompt is shown.
+
+    Arguments:
+        get_connection - A function returning the open database connection
+            to load candidates with (called only when a kind is loaded).
+    """
+
+    def __init__(self, get_connection):
+        self._get_connection = get_connection
+        self._indexes = {}
+        self._matches = []
+        self._changes = changelog.ChangeLogConsumer(tables=TABLE_KINDS)
+
+    def load(self, kind):
+        """
+        Returns the prefix index for a kind, loading it on first use.
+        """
+        index = self._indexes.get(kind)
+        if index is None:
+            if self._changes.position is None:
+                # Start following the change log before the first load
+                self.sync()
+            values = []
+            cursor = self._get_connection().cursor()
+            try:
+                cursor.execute(COMPLETION_QUERIES[kind])
+                while True:
+                    rows = cursor.fetchmany(FETCH_BATCH)
+                    if not rows:
+                        break
+                    values.extend(row[0] for row in rows)
+            finally:
+                cursor.close()
+            index = self._indexes[kind] = PrefixIndex(values)
+        return index
+
+    def invalidate(self, *kinds):
+        """
+        Drops the cached candidates of the given kinds (or of all kinds if
+        none are given), so they are reloaded on the next Tab press.
+        """
+        if not kinds:
+            self._indexes.clear()
+        for kind in kinds:
+            self._indexes.pop(kind, None)
+
+    def sync(self):
+        """
+        Invalidates the kinds whose tables changed since the last call, as
+        recorded in the change log. Errors (e.g. a database without a
+        change log) leave the cache as it is.
+        """
+        try:
+            changes = self._changes.poll(self._get_connection())
+        except Exception:
+            return
+        if self._changes.missed:
+            # Changes were pruned before they were read
+            self._changes.missed = False
+            self.invalidate()
+            return
+        for table in {change.table_name for change in changes}:
+            self.invalidate(*TABLE_KINDS[table])
+
+    def complete(self, kind, text):
+        """
+        Returns the candidates of a kind starting with text. Database errors
+        yield no candidates rather than breaking the prompt.
+        """
+        try:
+            return self.load(kind).complete(text)
+        except Exception:  # readline silently swallows errors anyway
+            return []
+
+    def input(self, prompt, kind):
+        """
+        Prompts for a value like input(), completing values of the given
+        kind when Tab is pressed.
+        """
+        if kind in self._indexes:
+            self.sync()
+        if readline is None:
+            return input(prompt)
+
+        def complete(text, state):
+            if state == 0:
+                self._matches = self.complete(kind, text)
+            return self._matches[state] if state < len(self._matches) else None
+
+        old_completer = readline.get_completer()
+        old_delims = readline.get_completer_delims()
+        # IDs contain spaces and dashes ('Pegasus II FB', 'BB-70'), so the
+        # whole line is completed rather than the last word
+        readline.set_completer_delims('')
+        readline.set_completer(complete)
+        if 'libedit' in (readline.__doc__ or ''):  # macOS system Python
+            readline.parse_and_bind('bind ^I rl_complete')
+        else:
+            readline.parse_and_bind('tab: complete')
+        try:
+            return input(prompt)
+        finally:
+            readline.set_completer(old_completer)
+            readline.set_completer_delims(old_delims)
@@ -50,6 +50,34 @@ GRANT EXECUTE ON FUNCTION beybladedb.authenticate TO 'midoriyai'@'localhost';
 GRANT SELECT ON beybladedb.battles TO 'gokus'@'localhost';
 GRANT SELECT ON beybladedb.battles TO 'midoriyai'@'localhost';
 
+-- Battles with usernames and Beyblade names, read by the battle views
+GRANT SELECT ON beybladedb.battle_details TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.battle_details TO 'midoriyai'@'localhost';
+
+-- Daily per-Beyblade rollup, read by the leaderboards (see rollups.py)
+GRANT SELECT ON beybladedb.battle_daily_beyblade TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.battle_daily_beyblade TO 'midoriyai'@'localhost';
+
+-- Archived battles and their rollups are read by the battle views and the
+-- leaderboard (see archive.py)
+GRANT SELECT ON beybladedb.battles_archive TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.battles_archive TO 'midoriyai'@'localhost';
+GRANT SELECT ON beybladedb.battle_rollup_beyblade TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.battle_rollup_beyblade TO 'midoriyai'@'localhost';
+GRANT SELECT ON beybladedb.battle_rollup_tournament TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.battle_rollup_tournament 
+    TO 'midoriyai'@'localhost';
+GRANT SELECT ON beybladedb.battle_archive_runs TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.battle_archive_runs TO 'midoriyai'@'localhost';
+
+-- Bladers can view bracket tournaments (see tournaments.py)
+GRANT SELECT ON beybladedb.tournaments TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.tournaments TO 'midoriyai'@'localhost';
+GRANT SELECT ON beybladedb.tournament_entrants TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.tournament_entrants TO 'midoriyai'@'localhost';
+GRANT SELECT ON beybladedb.tournament_matches TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.tournament_matches TO 'midoriyai'@'localhost';
+
 
 GRANT EXECUTE ON PROCEDURE beybladedb.sp_add_user TO 'gokus'@'localhost';
 GRANT EXECUTE ON PROCEDURE beybladedb.sp_add_user TO 'midoriyai'@'localhost';
@@ -61,4 +89,8 @@ GRANT EXECUTE ON FUNCTION beybladedb.udf_heaviest_beyblade_for_type
 GRANT EXECUTE ON FUNCTION beybladedb.udf_heaviest_beyblade_for_type 
     TO 'midoriyai'@'localhost';
 
+-- Bladers' CLIs follow the change log to refresh their tab-completion cache
+GRANT SELECT ON beybladedb.change_log TO 'gokus'@'localhost';
+GRANT SELECT ON beybladedb.change_log TO 'midoriyai'@'localhost';
+
 FLUSH PRIVILEGES;
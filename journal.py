@@ -0,0 +1,390 @@
+"""
+This module provides a durable write-behind journal for recording battle
+results during a live event. Recording a battle appends one line to a local
+append-only file and fsyncs it, so scoring does not wait for the database
+and an entry survives a database outage or a crash of the CLI. A background
+flusher drains the journal to the database in batches, one transaction per
+batch, through the sp_record_journaled_battle procedure.
+
+Every entry carries a client-generated entry ID (a UUID). The database
+remembers the entries it has recorded (battle_journal_applied), so replaying
+the journal after a crash, including entries that were committed just
+before the crash, never records a battle twice.
+
+Files, for a journal at PATH:
+
+    PATH           - One JSON object per line, in the order recorded.
+    PATH.offset    - Byte offset up to which entries have been flushed.
+    PATH.rejected  - Entries the database refused (e.g. an unknown player),
+                     with the error, so they can be fixed and re-recorded.
+
+A journal file is meant to be written by one process at a time. To flush a
+journal left behind by a crashed CLI without starting it, run:
+
+    $ python journal.py flush [PATH]
+    $ python journal.py status [PATH]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import backends
+
+# Default journal file, overridden with BEYBLADEDB_JOURNAL
+JOURNAL_PATH = os.environ.get('BEYBLADEDB_JOURNAL', 'battle-journal.jsonl')
+
+# Entries recorded per database transaction
+FLUSH_BATCH = 100
+
+# Seconds between flushes of the background flusher, and the longest wait
+# between retries while the database is unreachable
+FLUSH_INTERVAL = 1.0
+MAX_RETRY_INTERVAL = 30.0
+
+# Fields of a battle entry, in the parameter order of sp_record_battle
+BATTLE_FIELDS = ['tournament_name', 'battle_date', 'location', 'player1_ID',
+                 'player2_ID', 'player1_beyblade_ID', 'player2_beyblade_ID',
+                 'winner_ID']
+
+# Accepted formats of battle_date
+DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+
+def make_entry(tournament_name, battle_date, location, player1_id,
+               player2_id, player1_beyblade_id, player2_beyblade_id,
+               winner_id=None):
+    """
+    Validates a battle result and returns it as a journal entry with a new
+    entry ID, so malformed input is reported at once rather than when the
+    entry is flushed.
+
+    Raises ValueError for a malformed date or ID.
+    """
+    battle_date = str(battle_date).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            date = datetime.strptime(battle_date, fmt)
+            break
+        except ValueError:
+            pass
+    else:
+        raise ValueError(f"Invalid battle date '{battle_date}' "
+                         "(expected YYYY-MM-DD HH:MM:SS).")
+    if not str(tournament_name).strip() or not str(location).strip():
+        raise ValueError('Tournament name and location are required.')
+    try:
+        ids = [int(player1_id), int(player2_id), int(player1_beyblade_id),
+               int(player2_beyblade_id)]
+        winner = None if winner_id in (None, '') else int(winner_id)
+    except (TypeError, ValueError):
+        raise ValueError('Player, Beyblade and winner IDs must be numbers.')
+    values = ([tournament_name, date.strftime('%Y-%m-%d %H:%M:%S'), location]
+              + ids + [winner])
+    entry = {'entry_ID': uuid.uuid4().hex}
+    entry.update(zip(BATTLE_FIELDS, values))
+    return entry
+
+
+class BattleJournal:
+    """
+    An append-only file of battle entries plus the offset up to which they
+    have been flushed to the database.
+
+    Arguments:
+        path (str) - The journal file, created if it does not exist.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.offset_path = path + '.offset'
+        self.rejected_path = path + '.rejected'
+        self._lock = threading.Lock()
+        self._recover()
+        self._file = open(path, 'ab')
+
+    def _recover(self):
+        """
+        Drops a partially written last line left by a crash during
+        record(), so later entries start on a line of their own.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def record(self, entry):
+        """
+        Appends an entry (see make_entry()) and forces it to disk.
+
+        Return value: The entry ID.
+        """
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return entry['entry_ID']
+
+    def _read_offset(self):
+        try:
+            with open(self.offset_path) as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        # An offset past the end belongs to a journal since truncated
+        return offset if offset <= os.path.getsize(self.path) else 0
+
+    def _write_offset(self, offset):
+        # Losing an offset update only replays entries, which is harmless,
+        # so it is replaced atomically but not fsynced
+        with open(self.offset_path + '.tmp', 'w') as f:
+            f.write(str(offset))
+        os.replace(self.offset_path + '.tmp', self.offset_path)
+
+    def pending(self, limit=None):
+        """
+        Returns up to `limit` unflushed entries as (end offset, entry)
+        pairs, where the end offset is the byte offset just past the entry.
+        Lines that are not valid JSON are returned with entry None.
+        """
+        offset = self._read_offset()
+        entries = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Being written right now
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                entries.append((offset, entry))
+                if limit is not None and len(entries) >= limit:
+                    break
+        return entries
+
+    def pending_count(self):
+        """
+        Returns the number of unflushed entries.
+        """
+        return len(self.pending())
+
+    def mark_flushed(self, offset):
+        """
+        Records that every entry before a byte offset is in the database.
+        Once the whole journal is flushed it is truncated, so it does not
+        grow without bound.
+
+        The size is read under the lock record() appends under, so the
+        journal is only truncated if no entry was recorded after the offset.
+        An offset past the end is stale (the journal was truncated since it
+        was read) and is ignored.
+        """
+        with self._lock:
+            size = os.path.getsize(self.path)
+            if offset > size:
+                return
+            if offset == size:
+                # Reset the offset before truncating: a crash in between
+                # only replays already recorded entries
+                self._write_offset(0)
+                self._file.truncate(0)
+            else:
+                self._write_offset(offset)
+
+    def reject(self, entry, offset, error):
+        """
+        Sets aside an entry the database refused, with the error.
+        """
+        with open(self.rejected_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'entry': entry, 'offset': offset,
+                                'error': str(error),
+                                'rejected_at': time.time()}) + '\n')
+
+    def close(self):
+        self._file.close()
+
+
+def _apply(cursor, entry):
+    """
+    Records one journal entry with sp_record_journaled_battle. The caller
+    commits.
+    """
+    if entry is None:
+        raise ValueError('malformed journal line')
+    cursor.callproc('sp_record_journaled_battle',
+                    [entry['entry_ID']] + [entry[f] for f in BATTLE_FIELDS])
+
+
+def flush_journal(journal, conn, batch_size=FLUSH_BATCH):
+    """
+    Records every pending journal entry in the database, batch_size entries
+    per transaction. A batch that fails is retried one entry at a time, and
+    entries refused because of their values are moved to the rejected file
+    so they do not block the entries after them. Connection errors are
+    raised, leaving the unflushed entries in the journal.
+
+    Arguments:
+        journal (BattleJournal) - The journal to drain.
+        conn - An open database connection (as a BeyAdmin).
+        batch_size (int) - Entries recorded per transaction.
+
+    Return value: A (recorded, rejected) pair of entry counts.
+    """
+    entry_errors = backends.DataError + (ValueError, KeyError)
+    recorded = rejected = 0
+    while True:
+        batch = journal.pending(batch_size)
+        if not batch:
+            return recorded, rejected
+        cursor = conn.cursor()
+        try:
+            for _, entry in batch:
+                _apply(cursor, entry)
+            conn.commit()
+            recorded += len(batch)
+        except entry_errors:
+            conn.rollback()
+            # Find the offending entries one transaction at a time
+            for offset, entry in batch:
+                try:
+                    _apply(cursor, entry)
+                    conn.commit()
+                    recorded += 1
+                except entry_errors as err:
+                    conn.rollback()
+                    journal.reject(entry, offset, err)
+                    rejected += 1
+                journal.mark_flushed(offset)
+        else:
+            journal.mark_flushed(batch[-1][0])
+        finally:
+            cursor.close()
+
+
+class JournalFlusher:
+    """
+    Background thread draining a BattleJournal to the database every
+    FLUSH_INTERVAL seconds (or at once when woken with flush()). It uses its
+    own database connection, reconnecting with a growing delay while the
+    database is unreachable.
+
+    Arguments:
+        journal (BattleJournal) - The journal to drain.
+        connect - A function returning a new database connection.
+        on_flush - Optional function called with the number of entries
+            recorded after each flush that recorded any.
+    """
+
+    def __init__(self, journal, connect, on_flush=None,
+                 interval=FLUSH_INTERVAL, batch_size=FLUSH_BATCH):
+        self.journal = journal
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_error = None
+        self._connect = connect
+        self._on_flush = on_flush
+        self._conn = None
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='battle-journal-flusher')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def flush(self):
+        """
+        Wakes the flusher to drain the journal now.
+        """
+        self._wake.set()
+
+    def stop(self, timeout=10):
+        """
+        Makes a last attempt to drain the journal and stops the thread.
+        Entries still unflushed stay in the journal for the next run.
+        """
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _flush_once(self):
+        if self._conn is None:
+            self._conn = self._connect()
+        recorded, _ = flush_journal(self.journal, self._conn,
+                                    self.batch_size)
+        self.last_error = None
+        if recorded and self._on_flush is not None:
+            self._on_flush(recorded)
+
+    def _run(self):
+        delay = self.interval
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                self._flush_once()
+                delay = self.interval
+            except backends.Error as err:
+                self.last_error = err
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except backends.Error:
+                        pass
+                    self._conn = None
+                delay = min(delay * 2, MAX_RETRY_INTERVAL)
+            except OSError as err:
+                # The journal file itself failed (e.g. disk full); the
+                # entries stay in it and are retried like a lost database
+                self.last_error = err
+                sys.stderr.write(f"\nBattle journal error: {err}\n")
+                delay = min(delay * 2, MAX_RETRY_INTERVAL)
+            if self._stopping:
+                break
+        if self._conn is not None:
+            self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Flush or inspect a battle journal.')
+    parser.add_argument('command', choices=['status', 'flush'])
+    parser.add_argument('path', nargs='?', default=JOURNAL_PATH)
+    parser.add_argument('--user', default='jlavin',
+                        help='BeyAdmin database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    journal = BattleJournal(args.path)
+    try:
+        if args.command == 'flush':
+            conn = backends.connect(args.user, args.password)
+            try:
+                recorded, rejected = flush_journal(journal, conn)
+            finally:
+                conn.close()
+            print(f"Recorded {recorded} battles, rejected {rejected}.")
+        print(f"{journal.pending_count()} entries pending in {args.path}.")
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        journal.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 -- This script will load 5 CSV files into various tables for the Beyblade database (beybladedb).
 -- Ensure that the CSV files are in root directory and propertly formatted before executing.
+-- bulkload.py loads the same files without local_infile, validating each row and writing
+-- the rows that fail to a reject file instead of failing the whole file.
 
 -- Load the data for users table
 LOAD DATA LOCAL INFILE 'users.csv' INTO TABLE users
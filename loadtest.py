@@ -0,0 +1,434 @@
+"""
+This module simulates many Bladers and BeyAdmins using the database at once,
+to see how the schema, triggers and procedures behave under concurrent use
+(e.g. many sp_add_beyblade calls contending for the same build, or reads
+during heavy battle inserts).
+
+Each simulated session is a thread with its own database connection and
+query cache, like one running CLI, that runs operations picked at random
+from a weighted mix until the test ends. The operations are those of the
+CLIs, run through the same code as the HTTP API (api.BeybladeApi):
+
+  client: collection, battles, leaderboard, beyblades, parts, add_beyblade
+  admin:  tournament_battles, leaderboard, record_battle
+
+add_beyblade adds one of --builds part combinations to the session user's
+collection (fewer builds means more contention on the same Beyblade), and
+record_battle records a battle between two random collection Beyblades of
+different users. These writes are real: run the test against a scratch
+database.
+
+The report gives, per operation, the throughput and latency percentiles and
+the operations that failed, split into deadlocks, lock wait timeouts (or
+"database is locked" on SQLite), rejected values and other errors. On MySQL
+it also gives the InnoDB row lock waits and lock time during the test.
+
+Usage:
+
+    $ python loadtest.py --clients 20 --admins 2 --duration 30
+    $ python loadtest.py --clients 50 --mix add_beyblade=5,collection=1 \\
+          --builds 3
+
+A mix that names only client (or only admin) operations leaves the other
+kind of session with its default weights.
+    $ BEYBLADEDB_BACKEND=sqlite python loadtest.py --clients 8
+
+Works with both backends (see backends.py).
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from tabulate import tabulate
+
+import api
+import backends
+import query_cache
+
+# Operations of each kind of session and their default weights
+CLIENT_MIX = {'collection': 20, 'battles': 20, 'leaderboard': 15,
+              'beyblades': 10, 'parts': 10, 'add_beyblade': 5}
+ADMIN_MIX = {'tournament_battles': 20, 'leaderboard': 10,
+             'record_battle': 50}
+
+# MySQL error codes of a deadlock and of a lock wait timeout
+ER_LOCK_DEADLOCK = 1213
+ER_LOCK_WAIT_TIMEOUT = 1205
+
+# Failure kinds, in report order
+FAILURES = ['deadlock', 'lock_timeout', 'rejected', 'error']
+
+# Statuses of the InnoDB row locks compared before and after the test
+LOCK_STATUS_SQL = ("SHOW GLOBAL STATUS WHERE Variable_name IN "
+                   "('Innodb_row_lock_waits', 'Innodb_row_lock_time');")
+
+
+def classify(err):
+    """
+    Returns the failure kind of an exception raised by an operation.
+    """
+    errno = getattr(err, 'errno', None)
+    if errno == ER_LOCK_DEADLOCK:
+        return 'deadlock'
+    if errno == ER_LOCK_WAIT_TIMEOUT or (
+            isinstance(err, sqlite3.OperationalError) and
+            'locked' in str(err)):
+        return 'lock_timeout'
+    if isinstance(err, backends.DataError + (api.ApiError,)):
+        return 'rejected'
+    return 'error'
+
+
+def parse_mix(text, defaults):
+    """
+    Parses 'op=weight,op=weight' into a weight per operation, keeping only
+    the operations in `defaults`. None or '' returns the defaults, and so
+    does a mix that names none of their operations (e.g. a mix of client
+    operations for the admin sessions).
+    """
+    if not text:
+        return dict(defaults)
+    mix = {}
+    named = False
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in CLIENT_MIX and name not in ADMIN_MIX:
+            raise ValueError(f"Unknown operation '{name}'.")
+        try:
+            weight = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f"Invalid weight for '{name}': {weight}")
+        if name in defaults:
+            named = True
+            if weight > 0:
+                mix[name] = weight
+    return mix if named else dict(defaults)
+
+
+class Workload:
+    """
+    The reference data operations pick their arguments from, loaded once
+    before the test: users, collection Beyblades, tournaments and builds.
+    """
+
+    def __init__(self, conn, builds):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT user_ID, username, is_admin FROM users "
+                           "ORDER BY user_ID;")
+            users = cursor.fetchall()
+            cursor.execute("SELECT user_beyblade_ID, user_ID "
+                           "FROM beycollection ORDER BY user_beyblade_ID;")
+            self.collection = cursor.fetchall()
+            cursor.execute("SELECT DISTINCT tournament_name FROM battles;")
+            self.tournaments = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "SELECT name, type, series, face_bolt_ID, energy_ring_ID, "
+                "fusion_wheel_ID, spin_track_ID, performance_tip_ID "
+                "FROM beyblades ORDER BY beyblade_ID;")
+            self.builds = cursor.fetchall()[:builds]
+        finally:
+            cursor.close()
+        known = {user_id for user_id, _, _ in users}
+        self.collection = [(ub, u) for ub, u in self.collection
+                           if u in known]
+        self.clients = [(u, name) for u, name, admin in users if not admin]
+        self.admins = [(u, name) for u, name, admin in users if admin]
+        if not self.tournaments:
+            self.tournaments = ['Load Test Open']
+        if len({u for _, u in self.collection}) < 2:
+            raise ValueError('Recording battles needs collection Beyblades '
+                             'of at least two users.')
+        if not self.builds or not self.clients or not self.admins:
+            raise ValueError('The database needs Beyblades, a Blader and a '
+                             'BeyAdmin to run a load test.')
+
+
+class Session(threading.Thread):
+    """
+    One simulated CLI session running weighted random operations until the
+    deadline.
+
+    Arguments:
+        number (int) - Number of the session (used for its random seed).
+        role (str) - 'client' or 'admin'.
+        user (tuple) - The (user_ID, username) the session acts as.
+        mix (dict) - Weight of each operation.
+        connect - Function returning a new database connection.
+        workload (Workload) - The data operations pick arguments from.
+        results (Results) - Where the outcomes are recorded.
+        deadline (float) - time.monotonic() at which to stop.
+        think (float) - Seconds to pause between operations.
+        seed (int) - Base random seed.
+    """
+
+    def __init__(self, number, role, user, mix, connect, workload, results,
+                 deadline, think=0.0, seed=0):
+        super().__init__(name=f"{role}-{number}", daemon=True)
+        self.role = role
+        self.user = {'user_ID': user[0], 'username': user[1],
+                     'is_admin': role == 'admin'}
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.connect = connect
+        self.workload = workload
+        self.results = results
+        self.deadline = deadline
+        self.think = think
+        self.random = random.Random(seed * 1000 + number)
+        self.api = api.BeybladeApi(query_cache.QueryCache())
+
+    def run(self):
+        try:
+            conn = self.connect()
+        except backends.Error as err:
+            self.results.record('connect', 0.0, classify(err))
+            return
+        try:
+            while time.monotonic() < self.deadline:
+                name = self.random.choices(self.operations,
+                                           self.weights)[0]
+                started = time.perf_counter()
+                failure = None
+                try:
+                    getattr(self, f"op_{name}")(conn)
+                except (backends.Error + (api.ApiError,)) as err:
+                    failure = classify(err)
+                except Exception as err:
+                    # A bug in an operation is counted rather than ending
+                    # the session
+                    failure = 'error'
+                    self.results.record_error(name, err)
+                # Like the API pool after each request, so the next
+                # operation starts with a fresh snapshot
+                try:
+                    conn.rollback()
+                except backends.Error:
+                    pass
+                self.results.record(name, time.perf_counter() - started,
+                                    failure)
+                if self.think:
+                    time.sleep(self.random.uniform(0, 2 * self.think))
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Operations
+    # ------------------------------------------------------------------
+
+    def op_collection(self, conn):
+        self.api.get_collection(conn, self.user, {}, {},
+                                username=self.user['username'])
+
+    def op_battles(self, conn):
+        self.api.list_battles(conn, self.user,
+                              {'user': self.user['username']}, {})
+
+    def op_tournament_battles(self, conn):
+        self.api.list_battles(
+            conn, self.user,
+            {'tournament': self.random.choice(self.workload.tournaments)}, {})
+
+    def op_leaderboard(self, conn):
+        self.api.leaderboard(conn, self.user, {'top': '10'}, {})
+
+    def op_beyblades(self, conn):
+        self.api.list_beyblades(conn, self.user, {}, {})
+
+    def op_parts(self, conn):
+        self.api.list_parts(conn, self.user, {}, {})
+
+    def op_add_beyblade(self, conn):
+        build = self.random.choice(self.workload.builds)
+        body = dict(zip(api.COLLECTION_FIELDS, list(build) + ['New']))
+        self.api.add_to_collection(conn, self.user, {}, body,
+                                   username=self.user['username'])
+
+    def op_record_battle(self, conn):
+        collection = self.workload.collection
+        (bey1, user1), (bey2, user2) = self.random.sample(collection, 2)
+        while user1 == user2:
+            bey2, user2 = self.random.choice(collection)
+        self.api.record_battle(conn, self.user, {}, {
+            'tournament_name': self.random.choice(self.workload.tournaments),
+            'battle_date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'location': 'Load Test Arena', 'player1_ID': user1,
+            'player2_ID': user2, 'player1_beyblade_ID': bey1,
+            'player2_beyblade_ID': bey2,
+            'winner_ID': self.random.choice([bey1, bey2, None])})
+
+
+class Results:
+    """
+    The latencies and failures of every operation, shared by the sessions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(lambda: dict.fromkeys(FAILURES, 0))
+        self.errors = defaultdict(int)
+
+    def record(self, operation, seconds, failure=None):
+        with self._lock:
+            self.latencies[operation].append(seconds)
+            if failure is not None:
+                self.failures[operation][failure] += 1
+
+    def record_error(self, operation, err):
+        """
+        Counts an unexpected exception raised by an operation, by message.
+        """
+        with self._lock:
+            self.errors[f"{operation}: {type(err).__name__}: {err}"] += 1
+
+    def rows(self, elapsed):
+        """
+        Returns the report rows: operation, count, throughput, p50, p95, p99
+        and max latency in ms, then the failures of each kind; the last row
+        totals all operations.
+        """
+        def row(name, latencies, failures):
+            latencies = sorted(latencies)
+
+            def pct(p):
+                return latencies[min(len(latencies) - 1,
+                                     int(p * len(latencies)))] * 1000
+
+            return [name, len(latencies), len(latencies) / elapsed,
+                    pct(0.50), pct(0.95), pct(0.99), latencies[-1] * 1000,
+                    *(failures[kind] for kind in FAILURES)]
+
+        with self._lock:
+            names = sorted(self.latencies)
+            rows = [row(n, self.latencies[n], self.failures[n])
+                    for n in names]
+            every = [s for n in names for s in self.latencies[n]]
+            totals = {kind: sum(self.failures[n][kind] for n in names)
+                      for kind in FAILURES}
+        if every:
+            rows.append(row('(all)', every, totals))
+        return rows
+
+
+def lock_status(conn):
+    """
+    Returns the InnoDB row lock waits and total lock time (ms) so far, or
+    None on SQLite.
+    """
+    if backends.dialect(conn) != 'mysql':
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute(LOCK_STATUS_SQL)
+        status = {name: int(value) for name, value in cursor.fetchall()}
+    finally:
+        cursor.close()
+    return (status.get('Innodb_row_lock_waits', 0),
+            status.get('Innodb_row_lock_time', 0))
+
+
+def run(clients, admins, duration, client_mix, admin_mix, connect_client,
+        connect_admin, builds=5, think=0.0, seed=0):
+    """
+    Runs a load test and returns (Results, elapsed seconds, InnoDB lock
+    waits, InnoDB lock time in ms); the lock figures are None on SQLite.
+    """
+    monitor = connect_admin()
+    try:
+        workload = Workload(monitor, builds)
+        before = lock_status(monitor)
+    finally:
+        monitor.rollback()
+    results = Results()
+    started = time.monotonic()
+    deadline = started + duration
+    sessions = [Session(i, 'client', workload.clients[i %
+                                                     len(workload.clients)],
+                        client_mix, connect_client, workload, results,
+                        deadline, think, seed) for i in range(clients)]
+    sessions += [Session(i, 'admin', workload.admins[i % len(workload.admins)],
+                         admin_mix, connect_admin, workload, results,
+                         deadline, think, seed) for i in range(admins)]
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+    elapsed = time.monotonic() - started
+    try:
+        after = lock_status(monitor)
+    finally:
+        monitor.close()
+    if before is None:
+        return results, elapsed, None, None
+    return results, elapsed, after[0] - before[0], after[1] - before[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Simulate concurrent Blader and BeyAdmin sessions and '
+                    'report throughput, latency and lock contention.')
+    parser.add_argument('--clients', type=int, default=10,
+                        help='simulated Blader sessions (default: 10)')
+    parser.add_argument('--admins', type=int, default=1,
+                        help='simulated BeyAdmin sessions (default: 1)')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='seconds to run (default: 10)')
+    parser.add_argument('--mix', help='operation weights, e.g. '
+                        'add_beyblade=5,collection=1,record_battle=2 '
+                        '(default: ' + ','.join(
+                            f"{k}={v}" for k, v in
+                            {**CLIENT_MIX, **ADMIN_MIX}.items()) + ')')
+    parser.add_argument('--builds', type=int, default=5,
+                        help='distinct builds add_beyblade picks from '
+                             '(default: 5)')
+    parser.add_argument('--think', type=float, default=0.0, metavar='SECONDS',
+                        help='mean pause between the operations of a session')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--client-user', default='gokus',
+                        help='database user of the Blader sessions')
+    parser.add_argument('--client-password', default='gokuspw')
+    parser.add_argument('--user', default='jlavin',
+                        help='database user of the BeyAdmin sessions')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    try:
+        client_mix = parse_mix(args.mix, CLIENT_MIX)
+        admin_mix = parse_mix(args.mix, ADMIN_MIX)
+    except ValueError as err:
+        parser.error(str(err))
+    if args.clients and not client_mix or args.admins and not admin_mix:
+        parser.error('the mix leaves a kind of session without operations')
+
+    try:
+        results, elapsed, lock_waits, lock_ms = run(
+            args.clients, args.admins, args.duration, client_mix, admin_mix,
+            lambda: backends.connect(args.client_user, args.client_password),
+            lambda: backends.connect(args.user, args.password),
+            args.builds, args.think, args.seed)
+    except (backends.Error + (ValueError,)) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+
+    print(f"{args.clients} Blader and {args.admins} BeyAdmin sessions for "
+          f"{elapsed:.1f}s:")
+    print(tabulate(results.rows(elapsed), headers=[
+        'Operation', 'Ops', 'Ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'Max ms',
+        'Deadlocks', 'Lock timeouts', 'Rejected', 'Errors'],
+        tablefmt="grid", floatfmt='.1f'))
+    if lock_waits is not None:
+        print(f"InnoDB row lock waits: {lock_waits} "
+              f"({lock_ms} ms waiting in total)")
+    for message, count in sorted(results.errors.items()):
+        print(f"Unexpected error ({count}x) {message}")
+
+
+if __name__ == '__main__':
+    main()
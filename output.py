@@ -0,0 +1,301 @@
+"""
+This module writes the results of the CLIs' view commands in the output
+format chosen with --format (or the BEYBLADEDB_OUTPUT_FORMAT environment
+variable):
+
+  * grid  - the tabulate grid tables, for reading at the terminal (default),
+  * plain - space-aligned columns, with the widths taken from the first
+            PLAIN_SAMPLE rows (longer values later on widen their cell),
+  * tsv   - tab-separated values with a header line; tabs, newlines and
+            backslashes in values are escaped as \\t, \\n and \\\\,
+  * csv   - comma-separated values with a header line (RFC 4180 quoting),
+  * jsonl - one JSON object per row, keyed by the column names in
+            lower_snake_case.
+
+NULL is written as an empty field in TSV and CSV, and as null in JSON Lines.
+Every format except grid is written incrementally: rows are pulled from the
+cursor FETCH_BATCH at a time and each batch is written as one string, so
+exporting a full battle history never holds the whole result in memory.
+
+With --output FILE the results go to that file and the menus, prompts and
+messages stay on the terminal:
+
+    $ python app-admin.py --format csv --output battles.csv
+    $ python app-client.py --format jsonl --output results.jsonl
+"""
+
+import csv
+import io
+import itertools
+import json
+import os
+import re
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+from tabulate import tabulate
+
+# For output coloring
+import colorama
+from colorama import Fore
+
+colorama.init(autoreset=True)
+
+FORMATS = ['grid', 'plain', 'tsv', 'csv', 'jsonl']
+
+# Formats meant for reading rather than for other programs
+HUMAN_FORMATS = ('grid', 'plain')
+
+DEFAULT_FORMAT = os.environ.get('BEYBLADEDB_OUTPUT_FORMAT', 'grid')
+
+# Rows pulled from the cursor, and written, per batch
+FETCH_BATCH = 1000
+
+# Rows the column widths of the plain format are measured on
+PLAIN_SAMPLE = 1000
+
+_TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n',
+                              '\r': '\\r'})
+_KEY_RE = re.compile(r'[^a-z0-9]+')
+
+
+def cursor_rows(cursor, batch_size=FETCH_BATCH):
+    """
+    Yields the rows of an executed cursor, fetching batch_size at a time.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def json_key(header):
+    """
+    Returns the JSON Lines key of a column header, e.g. 'Player 2 BeyBlade
+    ID' -> 'player_2_beyblade_id'.
+    """
+    return _KEY_RE.sub('_', header.lower()).strip('_')
+
+
+def _text(value):
+    """
+    Returns a value as TSV/CSV text: '' for NULL, ISO dates, and str() of
+    anything else.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return str(value)
+
+
+def json_value(value):
+    """
+    Converts the values JSON cannot encode (dates, Decimals).
+    """
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _batches(rows, size=FETCH_BATCH):
+    """
+    Yields lists of up to `size` rows from any iterable of rows.
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Output:
+    """
+    Where and how the view commands write their results.
+
+    Arguments:
+        format (str) - One of FORMATS.
+        stream - Text file the results are written to (default: stdout).
+    """
+
+    def __init__(self, format=DEFAULT_FORMAT, stream=None):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown output format '{format}'; use one of "
+                             f"{', '.join(FORMATS)}.")
+        self.format = format
+        self.stream = stream
+
+    @property
+    def streaming(self):
+        """
+        Whether results are written incrementally (every format but grid),
+        in which case views read them from the cursor rather than from the
+        query cache.
+        """
+        return self.format != 'grid'
+
+    def title(self, text):
+        """
+        Prints the title of a result, unless the result is being written to
+        stdout for another program.
+        """
+        if self.format in HUMAN_FORMATS or self.stream is not None:
+            print(Fore.BLUE + text)
+
+    def _writer(self):
+        """
+        Returns a function writing text to the output. On stdout it writes
+        to the underlying byte buffer, bypassing the colorama wrapper which
+        would otherwise scan (and, at a terminal, reset the colors after)
+        every write.
+        """
+        if self.stream is not None:
+            return self.stream.write
+        sys.stdout.flush()
+        buffer = getattr(sys.stdout, 'buffer', None)
+        if buffer is None:
+            return sys.stdout.write
+        encoding = sys.stdout.encoding or 'utf-8'
+        return lambda text: buffer.write(text.encode(encoding, 'replace'))
+
+    def write(self, rows, headers, title=None):
+        """
+        Writes result rows with their column headers.
+
+        Arguments:
+            rows (iterable) - The rows (tuples), e.g. a list from the query
+                cache or cursor_rows() of an executed cursor.
+            headers (list) - The column headers.
+            title (str) - Optional title printed (see title()) before the
+                rows.
+
+        Return value: The number of rows written; nothing at all is written
+                      for an empty result, so the caller can print its own
+                      message instead.
+        """
+        if self.format == 'grid':
+            rows = list(rows)
+            if rows:
+                if title is not None:
+                    self.title(title)
+                table = tabulate(rows, headers=headers, tablefmt="grid")
+                if self.stream is not None:
+                    self.stream.write(table + '\n')
+                    self.stream.flush()
+                else:
+                    print(table)
+            return len(rows)
+
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return 0
+        if title is not None:
+            self.title(title)
+        rows = itertools.chain([first], rows)
+        write = self._writer()
+        count = getattr(self, f"_write_{self.format}")(rows, headers, write)
+        if self.stream is not None:
+            self.stream.flush()
+        else:
+            (getattr(sys.stdout, 'buffer', None) or sys.stdout).flush()
+        return count
+
+    def _write_plain(self, rows, headers, write):
+        rows = iter(rows)
+        sample = list(itertools.islice(rows, PLAIN_SAMPLE))
+        if not sample:
+            return 0
+        widths = [len(h) for h in headers]
+        for row in sample:
+            for i, value in enumerate(row):
+                widths[i] = max(widths[i], len(_text(value)))
+        numeric = [all(isinstance(row[i], (int, float, Decimal)) or
+                       row[i] is None for row in sample)
+                   for i in range(len(headers))]
+
+        def line(values, align_numbers=True):
+            return '  '.join(
+                (_text(v).rjust(w) if align_numbers and n else
+                 _text(v).ljust(w))
+                for v, w, n in zip(values, widths, numeric)).rstrip() + '\n'
+
+        write(line(headers, align_numbers=False) +
+              '  '.join('-' * w for w in widths) + '\n')
+        count = 0
+        for batch in _batches(itertools.chain(sample, rows)):
+            write(''.join(line(row) for row in batch))
+            count += len(batch)
+        return count
+
+    def _write_tsv(self, rows, headers, write):
+        def line(row):
+            text = '\t'.join(map(_text, row))
+            # Escaping is only needed (and done) for the rare values with
+            # tabs, line breaks or backslashes in them
+            if (text.count('\t') != len(row) - 1 or '\n' in text or
+                    '\r' in text or '\\' in text):
+                text = '\t'.join(_text(v).translate(_TSV_ESCAPES)
+                                 for v in row)
+            return text + '\n'
+
+        count = 0
+        for batch in _batches(rows):
+            if not count:
+                write(line(headers))
+            write(''.join(map(line, batch)))
+            count += len(batch)
+        return count
+
+    def _write_csv(self, rows, headers, write):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        count = 0
+        for batch in _batches(rows):
+            if not count:
+                writer.writerow(headers)
+            writer.writerows([_text(v) for v in row] for row in batch)
+            write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+            count += len(batch)
+        return count
+
+    def _write_jsonl(self, rows, headers, write):
+        keys = [json_key(h) for h in headers]
+        encoder = json.JSONEncoder(default=json_value, ensure_ascii=False)
+        count = 0
+        for batch in _batches(rows):
+            write(''.join(encoder.encode(dict(zip(keys, row))) + '\n'
+                          for row in batch))
+            count += len(batch)
+        return count
+
+
+def add_arguments(parser):
+    """
+    Adds the --format and --output options to a CLI's argument parser.
+    """
+    parser.add_argument('--format', choices=FORMATS, default=DEFAULT_FORMAT,
+                        help='output format of the view commands '
+                             f"(default: {DEFAULT_FORMAT})")
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the results of the view commands to '
+                             'this file instead of the terminal')
+
+
+def from_args(args):
+    """
+    Returns the Output selected by the options of add_arguments().
+    """
+    stream = None
+    if args.output:
+        stream = open(args.output, 'w', encoding='utf-8', newline='')
+    return Output(args.format, stream)
@@ -0,0 +1,75 @@
+"""
+This module searches the descriptions of parts with the full-text index of
+the selected backend: the FULLTEXT index ft_parts_description in natural
+language mode on MySQL (see setup.sql), and the FTS5 table parts_fts ranked
+by BM25 on SQLite (see setup-sqlite.sql). Both CLIs search with it.
+
+Works with both backends (see backends.py).
+"""
+
+import backends
+
+# Most parts returned by a search
+FULLTEXT_LIMIT = 20
+
+# Columns of the rows returned by search_part_descriptions()
+HEADERS = ['Part ID', 'Part Type', 'Weight (g)', 'Description', 'Relevance']
+
+
+def search_part_descriptions(conn, search_text, part_type=None,
+                             limit=FULLTEXT_LIMIT):
+    """
+    Searches part descriptions with the full-text index, most relevant
+    first.
+
+    Arguments:
+        conn - An open database connection.
+        search_text (str) - Words to look for (e.g. "stamina defense").
+        part_type (str) - Optional part type to restrict the results to
+            (Face Bolt, Energy Ring, Fusion Wheel, Spin Track,
+            Performance Tip).
+        limit (int) - Most parts returned.
+
+    Return value: A list of rows with the columns of HEADERS.
+
+    Raises ValueError if search_text has no words.
+    """
+    words = search_text.replace('"', ' ').split()
+    if not words:
+        raise ValueError("Please enter at least one word to search for.")
+
+    if backends.dialect(conn) == 'sqlite':
+        # FTS5 ANDs bare words, so OR the quoted words together to match
+        # MySQL's natural language mode
+        match = ' OR '.join(f'"{word}"' for word in words)
+        query = """
+        SELECT p.part_ID, p.part_type, p.weight, p.description,
+               -bm25(parts_fts) AS relevance
+        FROM parts_fts
+        JOIN parts p ON p.part_ID = parts_fts.part_ID
+        WHERE parts_fts MATCH %s
+        """
+        params = [match]
+    else:
+        query = """
+        SELECT part_ID, part_type, weight, description,
+               MATCH(description) AGAINST (%s IN NATURAL LANGUAGE MODE)
+               AS relevance
+        FROM parts
+        WHERE MATCH(description) AGAINST (%s IN NATURAL LANGUAGE MODE)
+        """
+        params = [search_text, search_text]
+    if part_type:
+        query += " AND part_type = %s"
+        params.append(part_type)
+    query += " ORDER BY relevance DESC LIMIT %s;"
+    params.append(limit)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        results = cursor.fetchall()
+    finally:
+        cursor.close()
+    return [(part_id, ptype, weight, description, round(relevance, 3))
+            for part_id, ptype, weight, description, relevance in results]
@@ -0,0 +1,167 @@
+"""
+This script maintains the range partitions of the battles table created by
+setup-partitions.sql. Battles are partitioned on battle_date; the last
+partition, p_future, holds everything from the newest bound on
+(VALUES LESS THAN MAXVALUE). Rolling forward splits p_future into monthly
+partitions (pYYYYMM) up to a number of months ahead of today, so new battles
+always land in a partition of their own month and date-bounded queries can
+be pruned to the months they ask for.
+
+Usage (as a BeyAdmin database user):
+
+    $ python partitions.py status
+    $ python partitions.py roll [--months-ahead N]
+
+Partitioning is a MySQL feature; the embedded SQLite backend has no
+partitions, so this script only works with BEYBLADEDB_BACKEND=mysql.
+"""
+
+import argparse
+import sys
+from datetime import date, datetime
+
+import backends
+
+# Name of the catch-all partition that new monthly partitions are split from
+FUTURE_PARTITION = 'p_future'
+
+# Default number of months ahead of the current month to create partitions for
+MONTHS_AHEAD = 3
+
+
+def get_partitions(conn):
+    """
+    Returns the partitions of the battles table as (name, upper bound, rows)
+    tuples in partition order. The upper bound is a date, or None for the
+    MAXVALUE partition. Returns an empty list if battles is not partitioned.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS "
+            "FROM INFORMATION_SCHEMA.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'battles' "
+            "AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION;")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    partitions = []
+    for name, description, table_rows in rows:
+        if description is None or description.upper() == 'MAXVALUE':
+            bound = None
+        else:
+            # RANGE COLUMNS bounds are reported as quoted literals
+            text = description.strip("'")[:10]
+            bound = datetime.strptime(text, '%Y-%m-%d').date()
+        partitions.append((name, bound, table_rows))
+    return partitions
+
+
+def add_months(day, months):
+    """
+    Returns the first day of the month `months` months after `day`'s month.
+    """
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def plan_partitions(partitions, today, months_ahead=MONTHS_AHEAD):
+    """
+    Returns the monthly partitions to split out of p_future as
+    (name, upper bound) pairs: one per month from the newest existing bound
+    through `months_ahead` months after today's month.
+    """
+    bounds = [bound for _, bound, _ in partitions if bound is not None]
+    if not bounds:
+        raise ValueError('battles has no bounded partitions to roll from.')
+    start = max(bounds)
+    # Partitions end on the first day of a month; align odd bounds
+    if start.day != 1:
+        start = add_months(start, 1)
+    last = add_months(today, months_ahead + 1)
+
+    planned = []
+    lower = start
+    while lower < last:
+        upper = add_months(lower, 1)
+        planned.append((f"p{lower.year:04d}{lower.month:02d}", upper))
+        lower = upper
+    return planned
+
+
+def roll_partitions(conn, today=None, months_ahead=MONTHS_AHEAD):
+    """
+    Splits p_future into the monthly partitions returned by
+    plan_partitions(), in one ALTER TABLE ... REORGANIZE PARTITION.
+
+    Return value: The names of the partitions created.
+    """
+    partitions = get_partitions(conn)
+    if not partitions:
+        raise ValueError('battles is not partitioned; run '
+                         'setup-partitions.sql first.')
+    if partitions[-1][0] != FUTURE_PARTITION:
+        raise ValueError(f"The last partition of battles must be "
+                         f"{FUTURE_PARTITION} (VALUES LESS THAN MAXVALUE).")
+
+    planned = plan_partitions(partitions, today or date.today(),
+                              months_ahead)
+    if not planned:
+        return []
+    definitions = ', '.join(
+        f"PARTITION {name} VALUES LESS THAN ('{upper.isoformat()}')"
+        for name, upper in planned)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"ALTER TABLE battles REORGANIZE PARTITION {FUTURE_PARTITION} "
+            f"INTO ({definitions}, PARTITION {FUTURE_PARTITION} "
+            f"VALUES LESS THAN (MAXVALUE));")
+    finally:
+        cursor.close()
+    return [name for name, _ in planned]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Maintain the battle_date partitions of battles.')
+    parser.add_argument('command', choices=['status', 'roll'])
+    parser.add_argument('--months-ahead', type=int, default=MONTHS_AHEAD,
+                        help='months past the current one to create '
+                             f'partitions for (default: {MONTHS_AHEAD})')
+    parser.add_argument('--user', default='jlavin',
+                        help='BeyAdmin database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    backend = backends.get_backend()
+    if backend.name != 'mysql':
+        sys.stderr.write('Partitioning is only supported on MySQL.\n')
+        sys.exit(1)
+
+    try:
+        conn = backend.connect(args.user, args.password)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        if args.command == 'roll':
+            created = roll_partitions(conn, months_ahead=args.months_ahead)
+            if created:
+                print('Created partitions: ' + ', '.join(created))
+            else:
+                print('Partitions are already rolled forward.')
+        for name, bound, table_rows in get_partitions(conn):
+            upper = 'MAXVALUE' if bound is None else bound.isoformat()
+            print(f"{name:<12} < {upper:<12} ~{table_rows} rows")
+    except (backends.Error, ValueError) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
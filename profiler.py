@@ -0,0 +1,388 @@
+"""
+This module profiles the commands of the CLIs, so a slow menu option can be
+looked into without attaching a profiler by hand.
+
+With --profile every command (the handler functions listed in the CLI's
+COMMANDS) runs under cProfile and tracemalloc; with --profile-command NAME
+only the named ones do (the option can be repeated):
+
+    $ python app-admin.py --profile
+    $ python app-client.py --profile-command beyblade_leaderboard
+
+After each profiled command its time and peak memory are printed, and the
+profiles are aggregated over the session and saved in a directory of their
+own under --profile-dir (default: profiles, or BEYBLADEDB_PROFILE_DIR):
+
+  * <command>.prof - the cProfile statistics of every run of the command
+                     (readable with pstats or snakeviz),
+  * session.prof   - those of all the commands together,
+  * memory.json    - runs, time and peak memory of each command, and the
+                     lines that allocated the memory still held when the
+                     commands returned.
+
+On quit a summary is printed: the time spent in the database connector
+(including the SQLite stand-in in backends.py), in tabulate, in our own code
+and elsewhere, the hottest functions and the largest allocations. Time spent
+waiting at input() prompts is counted separately. Saved sessions can be
+summarized (together) later with:
+
+    $ python profiler.py profiles/admin-20240501-140000 [...]
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from functools import wraps
+
+from tabulate import tabulate
+
+DEFAULT_DIR = os.environ.get('BEYBLADEDB_PROFILE_DIR', 'profiles')
+
+# Functions and allocating lines listed in the summary
+TOP = 15
+
+# Frames kept per traced allocation
+TRACE_FRAMES = 1
+
+# Time categories, in report order
+CATEGORIES = ['connector', 'tabulate', 'own', 'other', 'prompt']
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _category(filename, function=''):
+    """
+    Returns the category of code in a file (for built-in functions, whose
+    filename is '~', only the connector and input() are recognized).
+    """
+    if filename == '~':
+        if 'sqlite3' in function or 'mysql' in function:
+            return 'connector'
+        if 'builtins.input' in function:
+            return 'prompt'
+        return None
+    if filename.startswith('<'):  # e.g. <frozen abc>
+        return 'other'
+    path = os.path.abspath(filename)
+    if (f"{os.sep}mysql{os.sep}" in path or f"{os.sep}sqlite3{os.sep}" in path
+            or os.path.basename(path) == 'backends.py'):
+        return 'connector'
+    # wcwidth measures the cell widths for tabulate
+    if any(f"{os.sep}{name}{os.sep}" in path
+           for name in ('tabulate', 'wcwidth')):
+        return 'tabulate'
+    if os.path.dirname(path) == _REPO_DIR:
+        return 'own'
+    return 'other'
+
+
+def _short(filename):
+    """
+    Returns a filename relative to the sys.path entry it is under.
+    """
+    for entry in sorted(filter(None, sys.path), key=len, reverse=True):
+        entry = os.path.join(os.path.abspath(entry), '')
+        if filename.startswith(entry):
+            return filename[len(entry):]
+    return filename
+
+
+def _function(func):
+    """
+    Returns the name of a pstats function key, e.g.
+    'tabulate/__init__.py:988(_type)'.
+    """
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f"{_short(filename)}:{line}({name})"
+
+
+def categorize(stats):
+    """
+    Returns the category of every function of a pstats.Stats. Built-in
+    functions (e.g. socket reads, list.sort) take the category of the caller
+    that spent the most time in them.
+    """
+    categories = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        category = _category(func[0], func[2])
+        if category is None:
+            caller = max(callers, key=lambda c: callers[c][3], default=None)
+            category = 'other'
+            if caller is not None:
+                category = _category(caller[0], caller[2]) or 'other'
+        categories[func] = category
+    return categories
+
+
+class CommandProfiler:
+    """
+    Profiles the commands of a CLI and keeps the aggregated results of the
+    session.
+
+    Arguments:
+        directory (str) - Where the session's profiles are saved.
+        commands (list) - Names of the commands to profile, or None for all.
+        memory (bool) - Whether to trace allocations with tracemalloc.
+        stream - Where messages and the summary are written (default:
+            stderr, which keeps them out of the results of --format).
+    """
+
+    def __init__(self, directory, commands=None, memory=True, stream=None):
+        self.directory = directory
+        self.commands = set(commands) if commands else None
+        self.memory = memory
+        self.stream = stream or sys.stderr
+        self.stats = {}
+        self.runs = defaultdict(lambda: {'calls': 0, 'seconds': 0.0,
+                                         'peak_bytes': 0})
+        self.allocations = defaultdict(lambda: [0, 0])
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def install(self, namespace, names):
+        """
+        Replaces the named functions of a module namespace (e.g. a CLI's
+        globals()) with profiled wrappers; the CLI's menus look handlers up
+        by name, so they then call the wrappers.
+        """
+        unknown = self.commands - set(names) if self.commands else set()
+        if unknown:
+            raise ValueError(f"Unknown commands: {', '.join(sorted(unknown))}"
+                             f"; use one of {', '.join(names)}.")
+        for name in names:
+            if self.commands is None or name in self.commands:
+                namespace[name] = self.wrap(namespace[name])
+
+    def wrap(self, func, name=None):
+        """
+        Returns func wrapped so that each outermost call is profiled.
+        """
+        name = name or func.__name__
+
+        @wraps(func)
+        def profiled(*args, **kwargs):
+            # Commands calling other commands are profiled as one
+            if getattr(self._local, 'active', False):
+                return func(*args, **kwargs)
+            return self._run(name, func, args, kwargs)
+
+        return profiled
+
+    def _run(self, name, func, args, kwargs):
+        self._local.active = True
+        profile = cProfile.Profile()
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start(TRACE_FRAMES)
+        snapshot, peak = None, 0
+        started = time.perf_counter()
+        try:
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+        finally:
+            elapsed = time.perf_counter() - started
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                ])
+                tracemalloc.stop()
+            self._local.active = False
+            self._record(name, profile, elapsed, snapshot, peak)
+
+    def _record(self, name, profile, elapsed, snapshot, peak):
+        with self._lock:
+            if name in self.stats:
+                self.stats[name].add(profile)
+            else:
+                self.stats[name] = pstats.Stats(profile)
+            run = self.runs[name]
+            run['calls'] += 1
+            run['seconds'] += elapsed
+            run['peak_bytes'] = max(run['peak_bytes'], peak)
+            if snapshot is not None:
+                for stat in snapshot.statistics('lineno'):
+                    frame = stat.traceback[0]
+                    totals = self.allocations[(frame.filename, frame.lineno)]
+                    totals[0] += stat.size
+                    totals[1] += stat.count
+        message = f"[profile] {name}: {elapsed * 1000:.1f} ms"
+        if snapshot is not None:
+            message += f", peak {peak / 1024:.0f} KiB"
+        self.stream.write(message + '\n')
+        try:
+            self.save()
+        except OSError as err:
+            self.stream.write(f"[profile] Could not save profiles: {err}\n")
+
+    def save(self):
+        """
+        Writes the session's aggregated profiles to its directory (see the
+        module docstring); called after every profiled command, so a crash
+        loses nothing.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            session = pstats.Stats()
+            for name, stats in self.stats.items():
+                stats.dump_stats(os.path.join(self.directory, f"{name}.prof"))
+                session.add(stats)
+            session.dump_stats(os.path.join(self.directory, 'session.prof'))
+            memory = self._memory()
+        with open(os.path.join(self.directory, 'memory.json'), 'w') as file:
+            json.dump(memory, file, indent=1)
+
+    def _memory(self):
+        """
+        Returns the runs and allocations of the session as saved in
+        memory.json.
+        """
+        return {'commands': {name: dict(run)
+                             for name, run in self.runs.items()},
+                'allocations': [[filename, line, size, count]
+                                for (filename, line), (size, count)
+                                in self.allocations.items()]}
+
+    def report(self, top=TOP):
+        """
+        Writes the summary of the session's profiles, if any command was
+        profiled.
+        """
+        with self._lock:
+            if not self.stats:
+                return
+            stats = pstats.Stats()
+            stats.add(*self.stats.values())
+            memory = self._memory()
+        self.stream.write(summarize(stats, memory, top) +
+                          f"\nProfiles saved in {self.directory}\n")
+
+
+def summarize(stats, memory, top=TOP):
+    """
+    Returns the summary tables of aggregated profiles.
+
+    Arguments:
+        stats (pstats.Stats) - The cProfile statistics.
+        memory (dict) - The contents of memory.json (see CommandProfiler).
+        top (int) - Number of functions and allocating lines to list.
+
+    Return value: The summary text.
+    """
+    categories = categorize(stats)
+    # The self times of all functions add up to the profiled time
+    spent = dict.fromkeys(CATEGORIES, 0.0)
+    for func, (_, _, tottime, _, _) in stats.stats.items():
+        spent[categories[func]] += tottime
+    total = sum(spent.values()) or 1.0
+    parts = []
+
+    parts.append(tabulate(
+        [[name, run['calls'], run['seconds'] * 1000,
+          run['seconds'] * 1000 / run['calls'], run['peak_bytes'] / 1024]
+         for name, run in sorted(memory['commands'].items(),
+                                 key=lambda item: -item[1]['seconds'])],
+        headers=['Command', 'Runs', 'Total ms', 'Mean ms', 'Peak KiB'],
+        tablefmt="grid", floatfmt='.1f'))
+
+    parts.append(tabulate(
+        [[category, spent[category] * 1000, 100 * spent[category] / total]
+         for category in CATEGORIES],
+        headers=['Time in', 'ms', '%'], tablefmt="grid", floatfmt='.1f'))
+
+    hottest = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:top]
+    parts.append(tabulate(
+        [[_function(func), categories[func], nc, tt * 1000,
+          ct * 1000] for func, (_, nc, tt, ct, _) in hottest],
+        headers=['Function', 'In', 'Calls', 'Self ms', 'Cumulative ms'],
+        tablefmt="grid", floatfmt='.1f'))
+
+    allocations = sorted(memory['allocations'], key=lambda a: -a[2])[:top]
+    if allocations:
+        parts.append(tabulate(
+            [[f"{_short(filename)}:{line}", _category(filename), size / 1024, count]
+             for filename, line, size, count in allocations],
+            headers=['Allocated at', 'In', 'Held KiB', 'Blocks'],
+            tablefmt="grid", floatfmt='.1f'))
+    return '\n'.join(parts)
+
+
+def add_arguments(parser):
+    """
+    Adds the --profile, --profile-command and --profile-dir options to a
+    CLI's argument parser.
+    """
+    parser.add_argument('--profile', action='store_true',
+                        help='profile every command (time and memory)')
+    parser.add_argument('--profile-command', action='append', metavar='NAME',
+                        help='profile only this command (can be repeated)')
+    parser.add_argument('--profile-dir', default=DEFAULT_DIR,
+                        help='where profiles are saved (default: '
+                             f"{DEFAULT_DIR})")
+
+
+def from_args(args, prefix):
+    """
+    Returns the CommandProfiler selected by the options of add_arguments(),
+    saving in a new directory named after prefix (e.g. 'admin') and the
+    start time, or None if profiling is off.
+    """
+    if not args.profile and not args.profile_command:
+        return None
+    directory = os.path.join(args.profile_dir,
+                             f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}")
+    return CommandProfiler(directory, args.profile_command)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Summarize the profiles saved by CLI sessions run with '
+                    '--profile.')
+    parser.add_argument('directories', nargs='+', metavar='DIRECTORY',
+                        help='saved session directories (aggregated)')
+    parser.add_argument('--top', type=int, default=TOP)
+    args = parser.parse_args(argv)
+
+    stats = pstats.Stats()
+    runs = {}
+    allocations = defaultdict(lambda: [0, 0])
+    for directory in args.directories:
+        try:
+            with open(os.path.join(directory, 'memory.json')) as file:
+                saved = json.load(file)
+            stats.add(os.path.join(directory, 'session.prof'))
+        except (OSError, ValueError) as err:
+            sys.stderr.write(f"{directory}: {err}\n")
+            sys.exit(1)
+        for name, run in saved['commands'].items():
+            total = runs.setdefault(name, {'calls': 0, 'seconds': 0.0,
+                                           'peak_bytes': 0})
+            total['calls'] += run['calls']
+            total['seconds'] += run['seconds']
+            total['peak_bytes'] = max(total['peak_bytes'], run['peak_bytes'])
+        for filename, line, size, count in saved['allocations']:
+            allocations[(filename, line)][0] += size
+            allocations[(filename, line)][1] += count
+    memory = {'commands': runs,
+              'allocations': [[filename, line, size, count]
+                              for (filename, line), (size, count)
+                              in allocations.items()]}
+    print(summarize(stats, memory, args.top))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+This script creates many user accounts at once (e.g. all registrants of a
+tournament) from a CSV file with the header
+
+    username,email,password,is_admin
+
+For every row it adds the salted password hash to user_info and the user to
+users, like add_user() in app-admin.py, but in batched transactions: salts
+and hashes are generated in Python (no per-character RAND() loop in
+make_salt) and each batch is written with two multi-row INSERTs. Rows that
+fail (duplicate username or email, missing fields, ...) are reported with
+their line number and skipped; the rest of the batch is still created.
+
+Usage (as a BeyAdmin database user):
+
+    $ python provision.py registrants.csv [--batch-size N]
+
+BeyAdmins can also import a file with option (w) of app-admin.py.
+"""
+
+import argparse
+import csv
+import sys
+
+import backends
+
+# Number of users written per transaction
+BATCH_SIZE = 500
+
+# Columns expected in the CSV file
+CSV_COLUMNS = ['username', 'email', 'password', 'is_admin']
+
+# Longest username and password accepted by user_info and sp_add_user
+MAX_USERNAME_LENGTH = 20
+MAX_PASSWORD_LENGTH = 20
+
+# Values of the is_admin column read as true, as in option (e) of app-admin.py
+TRUE_VALUES = ['true', '1', 't', 'y', 'yes']
+
+SQL_USER_INFO = ("INSERT INTO user_info (username, salt, password_hash, "
+                 "is_admin) VALUES (%s, %s, %s, %s)")
+SQL_USERS = "INSERT INTO users (username, email, is_admin) VALUES (%s, %s, %s)"
+
+
+def read_users_csv(path):
+    """
+    Reads the users to create from a CSV file.
+
+    Return value: A list of (line number, row dictionary) pairs.
+
+    Raises ValueError if the header is missing one of CSV_COLUMNS.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        header = reader.fieldnames or []
+        missing = [c for c in CSV_COLUMNS if c not in header]
+        if missing:
+            raise ValueError(f"{path} is missing the columns: "
+                             f"{', '.join(missing)}")
+        # Line 1 is the header
+        return [(line, row) for line, row in enumerate(reader, start=2)]
+
+
+def _validate(row):
+    """
+    Returns an error message for a row that cannot be created, or None.
+    """
+    username = (row.get('username') or '').strip()
+    email = (row.get('email') or '').strip()
+    password = row.get('password') or ''
+    if not username or not email or not password:
+        return 'username, email and password are required'
+    if len(username) > MAX_USERNAME_LENGTH:
+        return f'username is longer than {MAX_USERNAME_LENGTH} characters'
+    if len(password) > MAX_PASSWORD_LENGTH:
+        return f'password is longer than {MAX_PASSWORD_LENGTH} characters'
+    return None
+
+
+def _existing(cursor, column, table, values):
+    """
+    Returns the lower-cased values of a column that already exist in a table.
+    """
+    if not values:
+        return set()
+    placeholders = ', '.join(['%s'] * len(values))
+    cursor.execute(f"SELECT {column} FROM {table} "
+                   f"WHERE {column} IN ({placeholders});", list(values))
+    return {value.lower() for (value,) in cursor.fetchall()}
+
+
+def _insert_batch(conn, cursor, users):
+    """
+    Writes a batch of users in one transaction. If the batch fails (e.g. a
+    username was taken since it was checked), it is rolled back and retried
+    one user per transaction so only the offending rows are lost.
+
+    Arguments:
+        users (list) - (line, username, email, password, is_admin) tuples.
+
+    Return value: A (created, failures) pair, where failures lists
+                  (line, username, message) tuples.
+    """
+    rows = []
+    for line, username, email, password, is_admin in users:
+        salt = backends.make_salt(8)
+        rows.append((line, username, email, salt,
+                     backends.hash_password(salt, password), is_admin))
+    try:
+        cursor.executemany(SQL_USER_INFO, [(u, s, h, a)
+                                           for _, u, _, s, h, a in rows])
+        cursor.executemany(SQL_USERS, [(u, e, a)
+                                       for _, u, e, _, _, a in rows])
+        conn.commit()
+        return len(rows), []
+    except backends.Error:
+        conn.rollback()
+
+    created, failures = 0, []
+    for line, username, email, salt, password_hash, is_admin in rows:
+        try:
+            cursor.execute(SQL_USER_INFO,
+                           (username, salt, password_hash, is_admin))
+            cursor.execute(SQL_USERS, (username, email, is_admin))
+            conn.commit()
+            created += 1
+        except backends.Error as err:
+            conn.rollback()
+            failures.append((line, username, str(err)))
+    return created, failures
+
+
+def provision_users(conn, rows, batch_size=BATCH_SIZE):
+    """
+    Creates users in batches, skipping and reporting the rows that fail.
+
+    Arguments:
+        conn - An open database connection (as a BeyAdmin).
+        rows (list) - (line number, row dictionary) pairs, as returned by
+            read_users_csv().
+        batch_size (int) - Number of users written per transaction.
+
+    Return value: A (created, failures) pair: the number of users created
+                  and a list of (line, username, message) tuples.
+    """
+    created, failures = 0, []
+    # Usernames and emails seen earlier in the file, lower-cased like
+    # MySQL's case-insensitive unique keys compare them
+    seen_usernames, seen_emails = set(), set()
+    cursor = conn.cursor()
+    try:
+        for start in range(0, len(rows), batch_size):
+            batch = []
+            for line, row in rows[start:start + batch_size]:
+                username = (row.get('username') or '').strip()
+                error = _validate(row)
+                if error:
+                    failures.append((line, username, error))
+                    continue
+                email = row['email'].strip()
+                is_admin = int((row.get('is_admin') or '').strip().lower()
+                               in TRUE_VALUES)
+                batch.append((line, username, email, row['password'],
+                              is_admin))
+
+            # One query per table finds the usernames and emails taken
+            taken_usernames = (
+                _existing(cursor, 'username', 'user_info',
+                          {u for _, u, _, _, _ in batch}) |
+                _existing(cursor, 'username', 'users',
+                          {u for _, u, _, _, _ in batch}))
+            taken_emails = _existing(cursor, 'email', 'users',
+                                     {e for _, _, e, _, _ in batch})
+
+            to_insert = []
+            for user in batch:
+                line, username, email = user[0], user[1], user[2]
+                username_key, email_key = username.lower(), email.lower()
+                if (username_key in taken_usernames or
+                        username_key in seen_usernames):
+                    failures.append((line, username,
+                                     f"duplicate username '{username}'"))
+                elif email_key in taken_emails or email_key in seen_emails:
+                    failures.append((line, username,
+                                     f"duplicate email '{email}'"))
+                else:
+                    to_insert.append(user)
+                seen_usernames.add(username_key)
+                seen_emails.add(email_key)
+
+            if to_insert:
+                batch_created, batch_failures = _insert_batch(conn, cursor,
+                                                              to_insert)
+                created += batch_created
+                failures.extend(batch_failures)
+    finally:
+        cursor.close()
+    failures.sort()
+    return created, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Create user accounts in bulk from a CSV file.')
+    parser.add_argument('path', help='CSV file with the columns '
+                                     + ','.join(CSV_COLUMNS))
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'users per transaction (default: {BATCH_SIZE})')
+    parser.add_argument('--user', default='jlavin',
+                        help='BeyAdmin database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    try:
+        rows = read_users_csv(args.path)
+    except (OSError, ValueError) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        conn = backends.connect(args.user, args.password)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        created, failures = provision_users(conn, rows, args.batch_size)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    for line, username, message in failures:
+        print(f"line {line} ({username or '?'}): {message}")
+    print(f"Created {created} users, {len(failures)} rows failed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,9 @@
 -- app_admin queries :
 
--- Query to fetch is_admin status for a user
-SELECT is_admin
-FROM users where username = 'gokus';
-
--- Authentication of username and password. 
-SELECT authenticate('gokus', 'gokuspw');
+-- Login: authenticates the username and password and fetches the user's
+-- is_admin status and user_ID in one query (see session.py)
+SELECT authenticate('gokus', 'gokuspw'), is_admin, user_ID
+FROM users WHERE username = 'gokus';
 
 -- Query to fetch user_ID based on username. 
 SELECT user_ID 
@@ -100,6 +98,17 @@ SELECT part_ID, part_type, weight, description
 FROM parts 
 ORDER BY part_type, part_ID;
 
+-- Full-text search of part descriptions, ranked by relevance and optionally
+-- filtered by part type.
+SELECT part_ID, part_type, weight, description,
+       MATCH(description) AGAINST ('stamina' IN NATURAL LANGUAGE MODE)
+       AS relevance
+FROM parts
+WHERE MATCH(description) AGAINST ('stamina' IN NATURAL LANGUAGE MODE)
+  AND part_type = 'Energy Ring'
+ORDER BY relevance DESC
+LIMIT 20;
+
 -- Select all tournament names.
 SELECT DISTINCT tournament_name 
 FROM battles 
@@ -0,0 +1,266 @@
+"""
+This module provides an in-memory LRU cache of query results for the read
+views of the CLIs (battle results by tournament, location and user, the
+leaderboard, tournament names and locations), which are run over and over
+between battle inserts.
+
+Entries are keyed by the normalized SQL text (comments and extra whitespace
+removed) and the parameters, and tagged with the tables the query reads.
+The cache holds at most max_bytes of results (estimated with
+sys.getsizeof), evicting the least recently used entries first. An entry is
+dropped when a table it read changes:
+
+  * writes made through the CLI call note_write() (see replica.py), and
+  * before a lookup the change log (see changelog.py) is checked, at most
+    every check_interval seconds, for writes made by other sessions.
+
+Only queries whose tables all appear in the change log (or are derived from
+them, like the archive, rollup and battle_details tables) are cached; other queries are
+run directly.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import backends
+import changelog
+
+# Default size limit of the cache, in bytes
+MAX_BYTES = int(os.environ.get('BEYBLADEDB_QUERY_CACHE_BYTES',
+                               str(32 * 1024 * 1024)))
+
+# Seconds between checks of the change log
+CHECK_INTERVAL = 0.5
+
+# Tables without change log triggers that only change together with
+# logged tables (sp_archive_battles, the battle_details triggers), tagged
+# as those tables
+DERIVED_TABLES = {
+    'battles_archive': ('battles',),
+    'battle_rollup_user': ('battles',),
+    'battle_rollup_beyblade': ('battles',),
+    'battle_rollup_tournament': ('battles',),
+    'battle_archive_runs': ('battles',),
+    'battle_daily_beyblade': ('battles',),
+    'battle_trend_daily': ('battles',),
+    'battle_trend_weekly': ('battles',),
+    'battle_details': ('battles', 'users', 'beycollection', 'beyblades'),
+}
+
+# String literals, which normalization leaves untouched
+_STRING_RE = re.compile(r"('(?:[^'\\]|\\.|'')*')")
+_COMMENT_RE = re.compile(r'--[^\n]*')
+_SPACE_RE = re.compile(r'\s+')
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """
+    Returns the SQL text without comments, runs of whitespace and a trailing
+    semicolon, so that the same query written differently shares an entry.
+    """
+    parts = _STRING_RE.split(sql)
+    for i in range(0, len(parts), 2):  # Outside string literals
+        parts[i] = _SPACE_RE.sub(' ', _COMMENT_RE.sub(' ', parts[i]))
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+def query_tables(sql):
+    """
+    Returns the set of tables a normalized query reads (after FROM or JOIN),
+    with the tables of DERIVED_TABLES replaced by the tables they follow.
+    """
+    tables = set()
+    for table in _TABLE_RE.findall(_STRING_RE.sub("''", sql)):
+        table = table.lower()
+        tables.update(DERIVED_TABLES.get(table, (table,)))
+    return tables
+
+
+def _sizeof(rows):
+    """
+    Estimates the memory used by a list of result rows, in bytes.
+    """
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row)
+    return size
+
+
+class QueryCache:
+    """
+    LRU cache of query results, invalidated by table.
+
+    Arguments:
+        max_bytes (int) - Size limit of the cached results.
+        check_interval (float) - Seconds between checks of the change log.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, check_interval=CHECK_INTERVAL):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.bytes = 0
+        self.hits = self.misses = self.uncached = 0
+        self.evictions = self.invalidations = 0
+        # key -> (rows, size, tables), least recently used first
+        self._entries = OrderedDict()
+        # table -> keys of the entries that read it
+        self._by_table = {}
+        self._changes = changelog.ChangeLogConsumer(
+            tables=changelog.CHANGE_TABLES)
+        self._last_check = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _remove(self, key):
+        rows, size, tables = self._entries.pop(key)
+        self.bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def invalidate(self, *tables):
+        """
+        Drops the entries that read any of the given tables (or every entry
+        if no table is given).
+        """
+        with self._lock:
+            if not tables:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._by_table.clear()
+                self.bytes = 0
+                return
+            for table in tables:
+                for tag in DERIVED_TABLES.get(table, (table,)):
+                    for key in list(self._by_table.get(tag, ())):
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def note_write(self):
+        """
+        Called after the session commits a write: the change log is checked
+        before the next lookup, so the write is seen at once.
+        """
+        self._last_check = None
+
+    def _sync(self, conn):
+        """
+        Drops the entries of the tables changed since the last check.
+
+        Return value: False if the change log cannot be read, in which case
+                      nothing can be cached.
+        """
+        now = time.monotonic()
+        if (self._last_check is not None and
+                now - self._last_check < self.check_interval):
+            return True
+        with self._sync_lock:
+            try:
+                while True:
+                    changes = self._changes.poll(conn)
+                    if self._changes.missed:
+                        # Changes were pruned before they were read
+                        self._changes.missed = False
+                        self.invalidate()
+                    elif changes:
+                        self.invalidate(*{c.table_name for c in changes})
+                    if len(changes) < self._changes.batch_size:
+                        break
+            except backends.Error:
+                self.invalidate()
+                return False
+            self._last_check = now
+        return True
+
+    def fetchall(self, conn, sql, params=()):
+        """
+        Returns the rows of a query like cursor.fetchall(), from the cache
+        when possible.
+
+        Arguments:
+            conn - The open connection to run the query on if needed.
+            sql (str) - The query, with %s placeholders.
+            params (tuple) - The values of the placeholders.
+        """
+        normalized = normalize_sql(sql)
+        tables = query_tables(normalized)
+        cacheable = bool(tables) and tables <= set(changelog.CHANGE_TABLES)
+        if cacheable and self._sync(conn):
+            key = (normalized, tuple(params))
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(entry[0])
+                self.misses += 1
+            # A connection to a replica that is behind the changes already
+            # checked could return rows older than them; those are not kept
+            version = changelog.latest_change_id(conn)
+            rows = self._execute(conn, sql, params)
+            if version >= self._changes.position:
+                self._store(key, rows, tables)
+            return rows
+        self.uncached += 1
+        return self._execute(conn, sql, params)
+
+    def _execute(self, conn, sql, params):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, tuple(params))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _store(self, key, rows, tables):
+        size = _sizeof(rows)
+        if size > self.max_bytes:
+            return
+        rows = list(rows)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, size, tables)
+            self.bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Returns the cache statistics as a dictionary: hits, misses, uncached
+        queries, hit rate, entries, bytes used, evictions and invalidations.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'uncached': self.uncached,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def report(self):
+        """
+        Returns the statistics as one line of text.
+        """
+        s = self.stats()
+        return (f"Query cache: {s['hit_rate']:.0%} hit rate ({s['hits']} hits, "
+                f"{s['misses']} misses), {s['entries']} entries using "
+                f"{s['bytes'] / 1024:.0f} of {s['max_bytes'] / 1024:.0f} KiB, "
+                f"{s['evictions']} evictions, {s['invalidations']} "
+                "invalidations")
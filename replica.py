@@ -0,0 +1,245 @@
+"""
+This module splits the database traffic of the CLIs between the primary
+database and a read replica. The view_* functions read from the replica, so
+the heavy battle joins do not load the primary, while add_* functions and
+stored procedures keep writing to the primary.
+
+The replica is configured in backends.py (BEYBLADEDB_REPLICA_HOST and
+BEYBLADEDB_REPLICA_PORT for MySQL, BEYBLADEDB_SQLITE_REPLICA_PATH for a copy
+of an SQLite database). How far behind it is comes from the change log (see
+changelog.py), which replicates like any other table:
+
+  * read-your-writes: after a session commits a write, its reads go to the
+    primary until the replica has the newest change_ID the session saw;
+  * lag fallback: while the oldest change the replica is missing is more
+    than BEYBLADEDB_MAX_REPLICA_LAG seconds old (default: 5), or the replica
+    is unreachable, all reads go to the primary.
+
+Without a replica, every read goes to the primary as before.
+
+To check the replica (as a BeyAdmin database user):
+
+    $ python replica.py status
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import backends
+import changelog
+
+# Longest replica lag, in seconds, at which reads still use the replica
+MAX_REPLICA_LAG = float(os.environ.get('BEYBLADEDB_MAX_REPLICA_LAG', '5'))
+
+# Seconds a measured replica lag is reused before it is measured again
+LAG_CHECK_INTERVAL = 1.0
+
+# Age in seconds of the oldest change after a change_ID, measured on the
+# primary (NULL if there is none)
+LAG_SQL = {
+    'mysql': "SELECT TIMESTAMPDIFF(SECOND, MIN(changed_at), NOW()) "
+             "FROM change_log WHERE change_ID > %s;",
+    'sqlite': "SELECT (julianday('now', 'localtime') - "
+              "julianday(MIN(changed_at))) * 86400 "
+              "FROM change_log WHERE change_ID > %s;",
+}
+
+
+class ReadRouter:
+    """
+    Hands out connections for reads (the replica when it is fresh enough,
+    otherwise the primary) and tracks the writes of the session.
+
+    Arguments:
+        user (str) - Database user, the same on the primary and replica.
+        password (str) - Password of the database user.
+        max_lag (float) - Longest replica lag in seconds accepted for reads.
+    """
+
+    def __init__(self, user, password, max_lag=MAX_REPLICA_LAG,
+                 check_interval=LAG_CHECK_INTERVAL):
+        self.user = user
+        self.password = password
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.replica_backend = backends.get_replica_backend()
+        # Newest change_ID seen on the primary after a write of this session
+        self.write_mark = 0
+        # Reads sent to each server, and why the last primary read was
+        self.reads = {'replica': 0, 'primary': 0}
+        self.last_fallback = None
+        # Functions called after each write of the session (e.g. to drop
+        # cached query results)
+        self.write_listeners = []
+        # Connection to the primary used for the checks, and the last
+        # measured (time, replica change_ID, lag in seconds)
+        self._monitor = None
+        self._measured = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.replica_backend is not None
+
+    def _monitor_conn(self):
+        if self._monitor is None:
+            self._monitor = backends.connect(self.user, self.password)
+            if backends.dialect(self._monitor) == 'mysql':
+                # Each check must see the newest committed changes rather
+                # than the snapshot of an open transaction
+                self._monitor.autocommit = True
+        return self._monitor
+
+    def _drop_monitor(self):
+        if self._monitor is not None:
+            try:
+                self._monitor.close()
+            except backends.Error:
+                pass
+            self._monitor = None
+
+    def note_write(self):
+        """
+        Records that the session committed a write, so its next reads see
+        it. Called by TrackedConnection.commit() and after journal flushes.
+        """
+        for listener in self.write_listeners:
+            listener()
+        if not self.enabled:
+            return
+        with self._lock:
+            try:
+                latest = changelog.latest_change_id(self._monitor_conn())
+                self.write_mark = max(self.write_mark, latest)
+            except backends.Error:
+                self._drop_monitor()
+                # Unknown position: read from the primary until the next
+                # successful check sets the mark
+                self.write_mark = float('inf')
+
+    def replica_lag(self, replica_change_id):
+        """
+        Returns the age in seconds of the oldest change on the primary that
+        the replica does not have yet (0 if it has them all), reusing a
+        measurement taken less than check_interval seconds ago.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (self._measured is not None and
+                    now - self._measured[0] < self.check_interval and
+                    self._measured[1] <= replica_change_id):
+                return self._measured[2]
+            conn = self._monitor_conn()
+            cursor = conn.cursor()
+            try:
+                if self.write_mark == float('inf'):
+                    self.write_mark = changelog.latest_change_id(conn)
+                cursor.execute(LAG_SQL[backends.dialect(conn)],
+                               (replica_change_id,))
+                lag = float(cursor.fetchone()[0] or 0)
+            except backends.Error:
+                self._drop_monitor()
+                raise
+            finally:
+                cursor.close()
+            self._measured = (now, replica_change_id, lag)
+            return lag
+
+    def _fallback(self, reason):
+        self.reads['primary'] += 1
+        self.last_fallback = reason
+        return backends.connect(self.user, self.password)
+
+    def connect_read(self):
+        """
+        Returns a new connection for a read-only view: the replica if it has
+        this session's writes and lags at most max_lag seconds, otherwise
+        the primary. The caller closes it.
+        """
+        if not self.enabled:
+            self.reads['primary'] += 1
+            return backends.connect(self.user, self.password)
+        try:
+            replica = self.replica_backend.connect(self.user, self.password)
+        except backends.Error as err:
+            return self._fallback(f"replica unreachable: {err}")
+        try:
+            replica_change_id = changelog.latest_change_id(replica)
+            if replica_change_id < self.write_mark:
+                reason = 'replica does not have the latest write yet'
+            else:
+                lag = self.replica_lag(replica_change_id)
+                if lag <= self.max_lag:
+                    self.reads['replica'] += 1
+                    return replica
+                reason = f"replica lags {lag:.0f}s"
+        except backends.Error as err:
+            reason = f"replica check failed: {err}"
+        replica.close()
+        return self._fallback(reason)
+
+    def track(self, conn):
+        """
+        Wraps the session's primary connection so that its commits are
+        recorded with note_write().
+        """
+        return TrackedConnection(conn, self)
+
+
+class TrackedConnection:
+    """
+    A primary connection that tells its ReadRouter about each commit, and
+    otherwise behaves like the connection it wraps.
+    """
+
+    def __init__(self, conn, router):
+        self._conn = conn
+        self._router = router
+
+    def commit(self):
+        self._conn.commit()
+        self._router.note_write()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Show the state of the read replica.')
+    parser.add_argument('command', choices=['status'])
+    parser.add_argument('--user', default='jlavin',
+                        help='BeyAdmin database user')
+    parser.add_argument('--password', default='jlavinpw')
+    args = parser.parse_args(argv)
+
+    router = ReadRouter(args.user, args.password)
+    if not router.enabled:
+        print('No read replica configured; reads use the primary.')
+        return
+    try:
+        primary = backends.connect(args.user, args.password)
+        try:
+            print(f"Primary change_ID: {changelog.latest_change_id(primary)}")
+        finally:
+            primary.close()
+        replica = router.replica_backend.connect(args.user, args.password)
+        try:
+            replica_change_id = changelog.latest_change_id(replica)
+        finally:
+            replica.close()
+        lag = router.replica_lag(replica_change_id)
+        print(f"Replica change_ID: {replica_change_id}")
+        print(f"Replica lag: {lag:.1f}s (reads use the "
+              f"{'replica' if lag <= router.max_lag else 'primary'}, "
+              f"limit {router.max_lag:g}s)")
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+"""
+This module reads and rebuilds the time-bucketed rollups of the battles
+table, which triggers keep up to date as battles are recorded, changed or
+deleted (see setup.sql), so statistics over a window of days never scan
+the battles themselves. Battles moved to battles_archive stay counted.
+
+  * battle_daily_beyblade - battles, wins and draws per collection Beyblade
+    per day, split by tournament and location; answers the leaderboards.
+    A board can be filtered by Beyblade type, series, tournament, location
+    and a window of days, and cut to the top K places. Places are ranked
+    with RANK(), so tied Beyblades share a place and a top-K board includes
+    every Beyblade tied for place K.
+  * battle_trend_daily and battle_trend_weekly - battles, wins and draws
+    per day and per week (starting on Monday) for each Beyblade, user,
+    tournament and location; answer the trend charts.
+
+Usage (leaderboard and trend as any database user, backfill as a
+BeyAdmin):
+
+    $ python rollups.py leaderboard
+    $ python rollups.py leaderboard --type Attack --days 30 --top 10
+    $ python rollups.py leaderboard --series 'Metal Fury' --since 2024-01-01
+    $ python rollups.py trend --by user gokus --days 30
+    $ python rollups.py trend --by tournament 'WBBA Prelim' --weekly
+    $ python rollups.py backfill [--since 2024-01-01]
+
+Works with both backends (see backends.py).
+"""
+
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+from tabulate import tabulate
+
+import backends
+
+# Values of the beyblades.type and beyblades.series columns
+BEYBLADE_TYPES = ['Attack', 'Defense', 'Stamina', 'Balance']
+BEYBLADE_SERIES = ['Metal Fusion', 'Metal Masters', 'Metal Fury']
+
+LEADERBOARD_HEADERS = ['Place', 'Beyblade ID', 'Name', 'Type', 'Series',
+                       'Battles', 'Wins', 'Draws']
+
+# What the trend rollups count battles by; the key of a Beyblade is its
+# Beyblade-Player ID and the key of a user their user ID (or username)
+DIMENSIONS = ['beyblade', 'user', 'tournament', 'location']
+
+# Monday of the week of a DATE or DATETIME expression
+WEEK_START_SQL = {
+    'mysql': "DATE_SUB(DATE({0}), INTERVAL WEEKDAY({0}) DAY)",
+    'sqlite': "date({0}, 'weekday 0', '-6 days')",
+}
+
+# Width in characters of the longest bar of a trend chart
+CHART_WIDTH = 40
+
+# One row per Beyblade and user of each battle of a table, with the
+# tournament and location, for rebuilding the rollups
+_SIDES_SQL = """
+    SELECT battle_date, tournament_name, location, player1_ID AS user_ID,
+        player1_beyblade_ID AS user_beyblade_ID,
+        COALESCE(winner_ID = player1_beyblade_ID, 0) AS won,
+        winner_ID IS NULL AS draw, 1 AS first_side
+    FROM {table} WHERE battle_date >= %s
+    UNION ALL
+    SELECT battle_date, tournament_name, location, player2_ID,
+        player2_beyblade_ID, COALESCE(winner_ID = player2_beyblade_ID, 0),
+        winner_ID IS NULL, 0
+    FROM {table} WHERE battle_date >= %s"""
+
+
+def leaderboard_query(beyblade_type=None, series=None, tournament_name=None,
+                      location=None, start_date=None, end_date=None,
+                      top=None):
+    """
+    Builds the leaderboard query for the given filters. Filters left as None
+    (or blank) are not applied.
+
+    Arguments:
+        beyblade_type (str) - One of BEYBLADE_TYPES.
+        series (str) - One of BEYBLADE_SERIES.
+        tournament_name (str) - Only battles of this tournament.
+        location (str) - Only battles at this location.
+        start_date, end_date (str) - 'YYYY-MM-DD' bounds on the battle day
+            (end exclusive).
+        top (int) - Only the first `top` places (ties included).
+
+    Return value: A (sql, params) tuple; the rows are the columns of
+                  LEADERBOARD_HEADERS in place order.
+
+    Raises ValueError for an unknown type or series or a top below 1.
+    """
+    if beyblade_type and beyblade_type not in BEYBLADE_TYPES:
+        raise ValueError(f"Unknown Beyblade type '{beyblade_type}' (expected "
+                         f"one of {', '.join(BEYBLADE_TYPES)}).")
+    if series and series not in BEYBLADE_SERIES:
+        raise ValueError(f"Unknown series '{series}' (expected one of "
+                         f"{', '.join(BEYBLADE_SERIES)}).")
+    if top is not None and int(top) < 1:
+        raise ValueError('The number of places must be at least 1.')
+
+    conditions, params = [], []
+    for sql, value in [('r.battle_day >= %s', start_date),
+                       ('r.battle_day < %s', end_date),
+                       ('r.tournament_name = %s', tournament_name),
+                       ('r.location = %s', location),
+                       ('bb.type = %s', beyblade_type),
+                       ('bb.series = %s', series)]:
+        if value:
+            conditions.append(sql)
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    limit = ''
+    if top is not None:
+        limit = 'WHERE place <= %s'
+        params.append(int(top))
+
+    query = f"""
+    SELECT place, beyblade_ID, name, type, series, battles, wins, draws
+    FROM (
+        SELECT RANK() OVER (ORDER BY SUM(r.wins) DESC) AS place,
+               bb.beyblade_ID, bb.name, bb.type, bb.series,
+               SUM(r.battles) AS battles, SUM(r.wins) AS wins,
+               SUM(r.draws) AS draws
+        FROM battle_daily_beyblade r
+        JOIN beycollection ub ON r.user_beyblade_ID = ub.user_beyblade_ID
+        JOIN beyblades bb ON ub.beyblade_ID = bb.beyblade_ID
+        {where}
+        GROUP BY bb.beyblade_ID, bb.name, bb.type, bb.series
+    ) ranked
+    {limit}
+    ORDER BY place, name;
+    """
+    return query, params
+
+
+def leaderboard(conn, **filters):
+    """
+    Returns the rows of a leaderboard (see leaderboard_query() for the
+    filters).
+    """
+    query, params = leaderboard_query(**filters)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, tuple(params))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def week_start(day):
+    """
+    Returns the Monday of the week of a date, the bucket of its week.
+    """
+    return day - timedelta(days=day.weekday())
+
+
+def backfill(conn, since=None):
+    """
+    Rebuilds the daily and weekly rollups from battles and battles_archive
+    and commits, e.g. after loading battles with the triggers disabled or
+    to repair the rollups. Everything happens in one transaction, so
+    readers see either the old or the new rollups.
+
+    Arguments:
+        conn - An open database connection (as a BeyAdmin).
+        since (date) - Only rebuild the buckets from the week of this day
+            on; None rebuilds everything.
+
+    Return value: The date the rebuilt range starts at (a Monday), or None.
+    """
+    start = week_start(since) if since is not None else None
+    bound = start.isoformat() if start is not None else '0001-01-01'
+    week = WEEK_START_SQL[backends.dialect(conn)]
+    sides = ' UNION ALL '.join(_SIDES_SQL.format(table=table)
+                               for table in ('battles', 'battles_archive'))
+    params = (bound,) * 4
+    cursor = conn.cursor()
+    try:
+        for table, column in [('battle_daily_beyblade', 'battle_day'),
+                              ('battle_trend_daily', 'bucket'),
+                              ('battle_trend_weekly', 'bucket')]:
+            cursor.execute(f"DELETE FROM {table} WHERE {column} >= %s;",
+                           (bound,))
+        cursor.execute(f"""
+            INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+                tournament_name, location, battles, wins, draws)
+            SELECT DATE(battle_date), user_beyblade_ID, tournament_name,
+                location, COUNT(*), SUM(won), SUM(draw)
+            FROM ({sides}) sides
+            GROUP BY DATE(battle_date), user_beyblade_ID, tournament_name,
+                location;""", params)
+        # Each battle appears twice in sides (once per player), so the
+        # tournament and location rows count only the first side
+        cursor.execute(f"""
+            INSERT INTO battle_trend_daily (dimension, dim_key, bucket,
+                battles, wins, draws)
+            SELECT dimension, dim_key, DATE(battle_date), COUNT(*), SUM(won),
+                SUM(draw)
+            FROM (
+                SELECT 'beyblade' AS dimension, user_beyblade_ID AS dim_key,
+                    battle_date, won, draw
+                FROM ({sides}) s1
+                UNION ALL
+                SELECT 'user', user_ID, battle_date, won, draw
+                FROM ({sides}) s2
+                UNION ALL
+                SELECT 'tournament', tournament_name, battle_date, 1 - draw,
+                    draw
+                FROM ({sides}) s3 WHERE first_side = 1
+                UNION ALL
+                SELECT 'location', location, battle_date, 1 - draw, draw
+                FROM ({sides}) s4 WHERE first_side = 1
+            ) dims
+            GROUP BY dimension, dim_key, DATE(battle_date);""", params * 4)
+        cursor.execute(f"""
+            INSERT INTO battle_trend_weekly (dimension, dim_key, bucket,
+                battles, wins, draws)
+            SELECT dimension, dim_key, {week.format('bucket')}, SUM(battles),
+                SUM(wins), SUM(draws)
+            FROM battle_trend_daily WHERE bucket >= %s
+            GROUP BY dimension, dim_key, {week.format('bucket')};""",
+                       (bound,))
+        conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return start
+
+
+def trend(conn, dimension, key, weekly=False, start_date=None,
+          end_date=None):
+    """
+    Returns the battles, wins and draws of one Beyblade, user, tournament
+    or location per day (or per week), as (bucket, battles, wins, draws)
+    rows in date order. Buckets without battles are left out.
+
+    Arguments:
+        conn - An open database connection.
+        dimension (str) - One of DIMENSIONS.
+        key (str) - The Beyblade-Player ID, user ID or username,
+            tournament name or location.
+        weekly (bool) - Weekly buckets instead of daily ones.
+        start_date, end_date (date) - Bounds on the bucket (end
+            exclusive), or None.
+
+    Raises ValueError for an unknown dimension or username.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension '{dimension}' (expected one of "
+                         f"{', '.join(DIMENSIONS)}).")
+    cursor = conn.cursor()
+    try:
+        key = str(key).strip()
+        if dimension == 'user' and not key.isdigit():
+            cursor.execute("SELECT user_ID FROM users WHERE username = %s;",
+                           (key,))
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"Unknown user '{key}'.")
+            key = str(row[0])
+        table = 'battle_trend_weekly' if weekly else 'battle_trend_daily'
+        query = (f"SELECT bucket, battles, wins, draws FROM {table} "
+                 "WHERE dimension = %s AND dim_key = %s")
+        params = [dimension, key]
+        if start_date is not None:
+            query += ' AND bucket >= %s'
+            params.append(start_date.isoformat())
+        if end_date is not None:
+            query += ' AND bucket < %s'
+            params.append(end_date.isoformat())
+        cursor.execute(query + ' ORDER BY bucket;', tuple(params))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def chart_rows(rows, weekly=False, width=CHART_WIDTH):
+    """
+    Turns trend rows into chart rows (bucket, battles, wins, draws, bar),
+    with zero rows for the buckets without battles between the first and
+    last bucket. The bar is scaled so the busiest bucket is `width`
+    characters long, '#' for wins and '.' for the other battles.
+    """
+    if not rows:
+        return []
+    step = timedelta(days=7 if weekly else 1)
+    counts = {}
+    for bucket, battles, wins, draws in rows:
+        if isinstance(bucket, str):  # SQLite without a DATE converter
+            bucket = date.fromisoformat(bucket)
+        counts[bucket] = (int(battles), int(wins), int(draws))
+    busiest = max(battles for battles, _, _ in counts.values()) or 1
+    chart = []
+    bucket, last = min(counts), max(counts)
+    while bucket <= last:
+        battles, wins, draws = counts.get(bucket, (0, 0, 0))
+        length = round(battles * width / busiest)
+        won = round(wins * width / busiest)
+        chart.append((bucket, battles, wins, draws,
+                      '#' * won + '.' * (length - won)))
+        bucket += step
+    return chart
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Print leaderboards and trends from the battle rollups, '
+                    'or rebuild the rollups.')
+    parser.add_argument('command', choices=['leaderboard', 'trend',
+                                            'backfill'])
+    parser.add_argument('key', nargs='?',
+                        help='trend: the Beyblade-Player ID, user ID or '
+                             'username, tournament or location')
+    parser.add_argument('--by', choices=DIMENSIONS, default='beyblade',
+                        help='trend: what the key is (default: beyblade)')
+    parser.add_argument('--weekly', action='store_true',
+                        help='trend: weekly instead of daily buckets')
+    parser.add_argument('--type', choices=BEYBLADE_TYPES)
+    parser.add_argument('--series', choices=BEYBLADE_SERIES)
+    parser.add_argument('--tournament', help='only battles of this tournament')
+    parser.add_argument('--location', help='only battles at this location')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--since', metavar='YYYY-MM-DD',
+                       help='only battles on or after this day')
+    group.add_argument('--days', type=int, metavar='N',
+                       help='only battles of the last N days (today included)')
+    parser.add_argument('--until', metavar='YYYY-MM-DD',
+                        help='only battles on or before this day')
+    parser.add_argument('--top', type=int, metavar='K',
+                        help='only the first K places (ties included)')
+    parser.add_argument('--user', default='jlavin', help='database user')
+    parser.add_argument('--password', default='jlavinpw')
+    # Intermixed, so the key may follow options (trend --by user gokus)
+    args = parser.parse_intermixed_args(argv)
+
+    start_date = end_date = None
+    try:
+        if args.since:
+            start_date = datetime.strptime(args.since, '%Y-%m-%d').date()
+        elif args.days is not None:
+            start_date = date.today() - timedelta(days=args.days - 1)
+        if args.until:
+            end_date = (datetime.strptime(args.until, '%Y-%m-%d').date()
+                        + timedelta(days=1))
+    except ValueError:
+        parser.error('dates must be in YYYY-MM-DD form')
+    if args.command == 'trend' and not args.key:
+        parser.error('trend needs the key of what to chart')
+    if args.weekly and start_date is not None:
+        start_date = week_start(start_date)
+
+    try:
+        conn = backends.connect(args.user, args.password)
+    except backends.Error as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    try:
+        if args.command == 'backfill':
+            start = backfill(conn, start_date)
+            print('Rebuilt the rollups'
+                  + (f" from {start:%Y-%m-%d} on." if start else '.'))
+        elif args.command == 'trend':
+            rows = chart_rows(trend(conn, args.by, args.key, args.weekly,
+                                    start_date, end_date), args.weekly)
+            if rows:
+                print(tabulate(rows, headers=[
+                    'Week of' if args.weekly else 'Day', 'Battles', 'Wins',
+                    'Draws', 'Battles (# = wins)'], tablefmt="grid"))
+            else:
+                print(f"No battles for {args.by} {args.key}.")
+        else:
+            rows = leaderboard(
+                conn, beyblade_type=args.type, series=args.series,
+                tournament_name=args.tournament, location=args.location,
+                start_date=start_date and start_date.isoformat(),
+                end_date=end_date and end_date.isoformat(), top=args.top)
+            if rows:
+                print(tabulate(rows, headers=LEADERBOARD_HEADERS,
+                               tablefmt="grid"))
+            else:
+                print('No battles match these filters.')
+    except (backends.Error + (ValueError,)) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+This module provides an in-memory fuzzy search index over the Beyblade
+catalog: part IDs, part types and descriptions from the parts table, and
+Beyblade IDs and names from the beyblades table. It lets Bladers find
+'Pegasus II FB' or 'BB-70' by typing 'pegasus' or 'bb70' instead of dumping
+the whole parts table.
+
+The index is a trigram (3-character n-gram) inverted index: every word of
+every indexed field is broken into overlapping trigrams, and each trigram
+maps to the documents (parts or Beyblades) containing it and the weight of
+the best field it occurs in. A query is broken into trigrams the same way,
+and documents are ranked by the weighted share of query trigrams they
+contain, with bonuses for exact and prefix matches on the ID or name. Only
+documents sharing at least one trigram with the query are ever scored.
+
+The index is maintained incrementally: upsert_part(), upsert_beyblade() and
+remove() touch only the postings of one document, and refresh() re-reads
+the catalog but re-indexes only rows whose contents changed.
+"""
+
+import re
+import time
+from collections import defaultdict
+
+# Field weights: matches on IDs and names rank above matches in descriptions
+ID_WEIGHT = 3.0
+NAME_WEIGHT = 2.0
+TYPE_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+
+# Bonuses added on top of the trigram score
+EXACT_BONUS = 4.0
+PREFIX_BONUS = 2.0
+SUBSTRING_BONUS = 1.0
+
+# Documents must contain more than this share of the query's trigrams to be
+# returned, which filters out hits on only a shared prefix such as 'BB-'
+# (e.g. 'BB-70' shares exactly half of its trigrams with 'BB-104')
+MIN_MATCH = 0.5
+
+# Splits text into words for trigram extraction
+_WORD_RE = re.compile(r'[0-9a-z]+')
+
+
+def normalize(text):
+    """
+    Lower-cases text and drops punctuation, so 'BB-70' and 'bb70' compare
+    equal.
+    """
+    return ''.join(_WORD_RE.findall((text or '').lower()))
+
+
+def trigrams(text):
+    """
+    Returns the set of trigrams of the words in a piece of text. Each word
+    is padded with two leading spaces and one trailing space (as pg_trgm
+    does), so short words and word starts still produce trigrams.
+    """
+    grams = set()
+    for word in _WORD_RE.findall((text or '').lower()):
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class SearchResult:
+    """
+    One ranked search hit.
+    """
+    __slots__ = ('kind', 'key', 'label', 'detail', 'score')
+
+    def __init__(self, kind, key, label, detail, score):
+        self.kind = kind
+        self.key = key
+        self.label = label
+        self.detail = detail
+        self.score = score
+
+
+class CatalogIndex:
+    """
+    Trigram index over parts and Beyblades. Documents are keyed by
+    (kind, ID), where kind is 'Part' or 'Beyblade'.
+    """
+
+    def __init__(self):
+        # trigram -> {document key: weight}
+        self._postings = defaultdict(dict)
+        # document key -> (label, detail, {trigram: weight}, signature)
+        self._documents = {}
+        self.last_refresh = None
+
+    def __len__(self):
+        return len(self._documents)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def _index(self, key, label, detail, fields, signature):
+        """
+        (Re)indexes one document given its (text, weight) fields.
+        """
+        if key in self._documents:
+            if self._documents[key][3] == signature:
+                return
+            self.remove(*key)
+        grams = {}
+        for text, weight in fields:
+            for gram in trigrams(text):
+                if weight > grams.get(gram, 0):
+                    grams[gram] = weight
+        for gram, weight in grams.items():
+            self._postings[gram][key] = weight
+        self._documents[key] = (label, detail, grams, signature)
+
+    def upsert_part(self, part_id, part_type, description):
+        """
+        Adds or updates a part in the index.
+        """
+        self._index(('Part', part_id), part_type, description or '',
+                    [(part_id, ID_WEIGHT), (part_type, TYPE_WEIGHT),
+                     (description, DESCRIPTION_WEIGHT)],
+                    (part_type, description))
+
+    def upsert_beyblade(self, beyblade_id, name, type):
+        """
+        Adds or updates a Beyblade in the index.
+        """
+        self._index(('Beyblade', beyblade_id), name, type,
+                    [(beyblade_id, ID_WEIGHT), (name, NAME_WEIGHT),
+                     (type, TYPE_WEIGHT)],
+                    (name, type))
+
+    def remove(self, kind, key):
+        """
+        Removes a document from the index, if present.
+        """
+        document = self._documents.pop((kind, key), None)
+        if document is None:
+            return
+        for gram in document[2]:
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.pop((kind, key), None)
+                if not postings:
+                    del self._postings[gram]
+
+    def refresh(self, conn):
+        """
+        Re-reads parts and beyblades from the database and updates the index
+        in place. Unchanged rows are skipped and deleted rows are removed.
+
+        Arguments:
+            conn - An open database connection.
+
+        Return value: The number of documents added, updated or removed.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT part_ID, part_type, description "
+                           "FROM parts;")
+            parts = cursor.fetchall()
+            cursor.execute("SELECT beyblade_ID, name, type FROM beyblades;")
+            beyblades = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        seen = set()
+        changed = 0
+        for part_id, part_type, description in parts:
+            key = ('Part', part_id)
+            seen.add(key)
+            if (key not in self._documents or
+                    self._documents[key][3] != (part_type, description)):
+                changed += 1
+            self.upsert_part(part_id, part_type, description)
+        for beyblade_id, name, type in beyblades:
+            key = ('Beyblade', beyblade_id)
+            seen.add(key)
+            if (key not in self._documents or
+                    self._documents[key][3] != (name, type)):
+                changed += 1
+            self.upsert_beyblade(beyblade_id, name, type)
+        for key in [k for k in self._documents if k not in seen]:
+            self.remove(*key)
+            changed += 1
+        self.last_refresh = time.time()
+        return changed
+
+    # ------------------------------------------------------------------
+    # Searching
+    # ------------------------------------------------------------------
+
+    def search(self, query, limit=10, kind=None):
+        """
+        Returns the best matches for a query, best first.
+
+        Arguments:
+            query (str) - Free text, e.g. 'pegasus fb' or 'bb70'.
+            limit (int) - Maximum number of results.
+            kind (str) - Optionally restrict results to 'Part' or 'Beyblade'.
+
+        Return value: A list of SearchResult objects.
+        """
+        grams = trigrams(query)
+        if not grams:
+            return []
+        scores = defaultdict(float)
+        matches = defaultdict(int)
+        for gram in grams:
+            for key, weight in self._postings.get(gram, {}).items():
+                scores[key] += weight
+                matches[key] += 1
+
+        needle = normalize(query)
+        results = []
+        for key, score in scores.items():
+            if kind is not None and key[0] != kind:
+                continue
+            if matches[key] <= MIN_MATCH * len(grams):
+                continue
+            # Share of the query's trigrams found, weighted by field
+            score /= len(grams)
+            label, detail = self._documents[key][:2]
+            for text in (key[1], label if key[0] == 'Beyblade' else ''):
+                target = normalize(text)
+                if not target:
+                    continue
+                if target == needle:
+                    score += EXACT_BONUS
+                elif target.startswith(needle):
+                    score += PREFIX_BONUS
+                elif needle in target:
+                    score += SUBSTRING_BONUS
+            results.append(SearchResult(key[0], key[1], label, detail,
+                                        score))
+        results.sort(key=lambda r: (-r.score, r.kind, r.key))
+        return results[:limit]
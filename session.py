@@ -0,0 +1,200 @@
+"""
+This module handles logging in to both CLIs: one parameterized query that
+checks the password and returns the user's role and user_ID together, and a
+short-lived local session so that repeated (e.g. scripted) runs of a CLI do
+not re-prompt, re-hash the password and query the database at every start.
+
+Sessions are stored as small JSON files in BEYBLADEDB_SESSION_DIR (default:
+~/.beybladedb), one per CLI role ('admin' or 'client'), readable only by the
+owner. A session holds a random token, the user, the backend it was made
+for and an expiry time; it lasts BEYBLADEDB_SESSION_TTL seconds (default:
+900). Setting BEYBLADEDB_SESSION_TTL=0 disables sessions.
+
+Each session is signed with an HMAC-SHA256 under a random key made once per
+install (session.key in the same directory, also owner-only), and a session
+whose signature does not match is ignored: editing a session file (e.g. to
+change the user or the role) or copying one from another install does not
+log anybody in. Anyone who can read the key can still sign sessions, so the
+directory must stay private to its owner.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+import backends
+
+# Directory holding the session files
+SESSION_DIR = os.environ.get(
+    'BEYBLADEDB_SESSION_DIR',
+    os.path.join(os.path.expanduser('~'), '.beybladedb'))
+
+# Lifetime of a session in seconds
+SESSION_TTL = int(os.environ.get('BEYBLADEDB_SESSION_TTL', '900'))
+
+# Checks the password with authenticate() and fetches the role and user_ID
+# in the same round trip. Rows only exist for users in the users table.
+LOGIN_SQL = ("SELECT authenticate(%s, %s), is_admin, user_ID "
+             "FROM users WHERE username = %s;")
+
+
+def authenticate_user(conn, username, password):
+    """
+    Checks a username and password against the database.
+
+    Arguments:
+        conn - An open database connection.
+        username (str) - The username entered at login.
+        password (str) - The password entered at login.
+
+    Return value: An (is_admin, user_ID) tuple if the username and password
+                  are correct, and None otherwise.
+    """
+    # A prepared statement is parsed once per connection on MySQL
+    cursor = conn.cursor(prepared=True)
+    try:
+        cursor.execute(LOGIN_SQL, (username, password, username))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if row is None or row[0] != 1:
+        return None
+    return bool(row[1]), row[2]
+
+
+def _key_path():
+    """
+    Returns the path of the key the sessions are signed with.
+    """
+    return os.path.join(SESSION_DIR, 'session.key')
+
+
+def _session_key(create=False):
+    """
+    Returns the key the sessions are signed with, making it first if
+    `create` is true; None if there is none (or it cannot be read or made).
+    """
+    path = _key_path()
+    try:
+        with open(path, 'rb') as f:
+            key = f.read()
+        if len(key) >= 32:
+            return key
+    except OSError:
+        pass
+    if not create:
+        return None
+    key = secrets.token_bytes(32)
+    try:
+        os.makedirs(SESSION_DIR, mode=0o700, exist_ok=True)
+        fd = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        return None
+    return key
+
+
+def _signature(key, data):
+    """
+    Returns the HMAC of every field of a session but the signature itself.
+    """
+    fields = {k: v for k, v in data.items() if k != 'signature'}
+    message = json.dumps(fields, sort_keys=True).encode('utf-8')
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+def _session_path(role):
+    """
+    Returns the path of the session file of a CLI role.
+    """
+    return os.path.join(SESSION_DIR, f"session-{role}.json")
+
+
+def _backend_key():
+    """
+    Identifies the selected database, so a session made against one
+    database is not reused for another.
+    """
+    backend = backends.get_backend()
+    if backend.name == 'sqlite':
+        return f"sqlite:{os.path.abspath(backend.path)}"
+    return f"mysql:{backend.host}:{backend.port}/{backend.database}"
+
+
+def load_session(role):
+    """
+    Returns the unexpired session of a CLI role as a dictionary (with keys
+    token, username, is_admin, user_ID, backend, expires and signature), or
+    None if there is none or its signature does not match.
+    """
+    if SESSION_TTL <= 0:
+        return None
+    key = _session_key()
+    if key is None:
+        return None
+    try:
+        with open(_session_path(role)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(data, dict)
+            or not isinstance(data.get('signature'), str)
+            or not hmac.compare_digest(data['signature'],
+                                       _signature(key, data))):
+        return None
+    if (data.get('expires', 0) < time.time()
+            or data.get('backend') != _backend_key()):
+        return None
+    return data
+
+
+def save_session(role, username, is_admin, user_id):
+    """
+    Starts a session for a CLI role after a successful login, replacing any
+    previous one.
+
+    Return value: The new session token, or None if sessions are disabled
+                  or the session could not be written.
+    """
+    if SESSION_TTL <= 0:
+        return None
+    key = _session_key(create=True)
+    if key is None:
+        return None
+    data = {
+        'token': secrets.token_hex(16),
+        'username': username,
+        'is_admin': bool(is_admin),
+        'user_ID': user_id,
+        'backend': _backend_key(),
+        'expires': time.time() + SESSION_TTL,
+    }
+    data['signature'] = _signature(key, data)
+    path = _session_path(role)
+    try:
+        os.makedirs(SESSION_DIR, mode=0o700, exist_ok=True)
+        # Created with owner-only permissions before anything is written
+        fd = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        return None
+    return data['token']
+
+
+def clear_session(role):
+    """
+    Ends the session of a CLI role, if there is one.
+    """
+    try:
+        os.remove(_session_path(role))
+    except OSError:
+        pass
@@ -0,0 +1,285 @@
+-- Converts the battles table to a layout range-partitioned on battle_date, so
+-- that queries bounded by date (e.g. recent tournaments) only read the
+-- partitions covering that range (partition pruning). Run it after
+-- setup.sql, load-data.sql and setup-routines.sql:
+--
+--     mysql> SOURCE setup-partitions.sql;
+--
+-- and then keep monthly partitions rolled forward with
+--
+--     $ python partitions.py roll
+--
+-- MySQL does not support foreign keys on partitioned tables, and requires
+-- the partitioning column to be part of every unique key. So the partitioned
+-- battles table has PRIMARY KEY (battle_ID, battle_date) and no foreign keys;
+-- the integrity the foreign keys of setup.sql provided is enforced by the
+-- triggers at the end of this file instead:
+--   * players must exist in users, and the Beyblades used (and the winner)
+--     must exist in beycollection,
+--   * deleting a user deletes their battles (was ON DELETE CASCADE),
+--   * a beycollection entry used in a battle cannot be deleted, and neither
+--     can a Beyblade whose collection entries were used in one.
+
+DROP TABLE IF EXISTS battles_partitioned;
+
+CREATE TABLE battles_partitioned (
+    -- Unique identifier for each Battle
+    battle_ID INT NOT NULL AUTO_INCREMENT,
+    -- Name of the tournament the battle is from
+    tournament_name VARCHAR(250) NOT NULL,
+    -- Date of the battle (the partitioning column)
+    battle_date DATETIME NOT NULL,
+    -- Location of the battle
+    location VARCHAR(250) NOT NULL,
+    -- References to the players and their Beyblades involved in the battle,
+    -- checked by trg_battles_check_insert/update instead of foreign keys
+    player1_ID INT NOT NULL,
+    player2_ID INT NOT NULL,
+    player1_beyblade_ID INT NOT NULL,
+    player2_beyblade_ID INT NOT NULL,
+    winner_ID INT, -- Can be NULL if battle was draw
+    PRIMARY KEY (battle_ID, battle_date),
+    -- Date-bounded lookups by tournament, location and player
+    INDEX idx_battles_tournament_date (tournament_name, battle_date),
+    INDEX idx_battles_location_date (location, battle_date),
+    INDEX idx_battles_player1_date (player1_ID, battle_date),
+    INDEX idx_battles_player2_date (player2_ID, battle_date),
+    INDEX idx_battles_winner (winner_ID)
+)
+-- Yearly partitions for history; python partitions.py roll adds monthly
+-- partitions by splitting p_future
+PARTITION BY RANGE COLUMNS (battle_date) (
+    PARTITION p2022 VALUES LESS THAN ('2023-01-01'),
+    PARTITION p2023 VALUES LESS THAN ('2024-01-01'),
+    PARTITION p2024 VALUES LESS THAN ('2025-01-01'),
+    PARTITION p2025 VALUES LESS THAN ('2026-01-01'),
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+-- Copy the existing battles and swap the tables atomically
+INSERT INTO battles_partitioned SELECT * FROM battles;
+RENAME TABLE battles TO battles_unpartitioned,
+    battles_partitioned TO battles;
+DROP TABLE battles_unpartitioned;
+
+
+-- Trigger-level integrity checks replacing the foreign keys of battles.
+-- SQLSTATE 23000 is the integrity constraint violation class, the same
+-- class MySQL reports for foreign key failures.
+DROP PROCEDURE IF EXISTS sp_check_battle_references;
+DROP TRIGGER IF EXISTS trg_battles_check_insert;
+DROP TRIGGER IF EXISTS trg_battles_check_update;
+DROP TRIGGER IF EXISTS trg_users_delete_battles;
+DROP TRIGGER IF EXISTS trg_beycollection_protect_battles;
+DROP TRIGGER IF EXISTS trg_beyblades_protect_battles;
+-- Battles are deleted by trg_users_delete_battles instead of a cascade, and
+-- those deletes fire trg_battles_rollup_delete
+DROP TRIGGER IF EXISTS trg_users_rollup_delete;
+DELIMITER !
+
+CREATE PROCEDURE sp_check_battle_references(
+    IN _player1_ID INT,
+    IN _player2_ID INT,
+    IN _player1_beyblade_ID INT,
+    IN _player2_beyblade_ID INT,
+    IN _winner_ID INT
+)
+BEGIN
+    IF (SELECT COUNT(*) FROM users
+        WHERE user_ID IN (_player1_ID, _player2_ID))
+        < IF(_player1_ID = _player2_ID, 1, 2) THEN
+        SIGNAL SQLSTATE '23000'
+            SET MESSAGE_TEXT = 'Battle player does not exist in users';
+    END IF;
+    IF (SELECT COUNT(*) FROM beycollection
+        WHERE user_beyblade_ID IN (_player1_beyblade_ID, _player2_beyblade_ID))
+        < IF(_player1_beyblade_ID = _player2_beyblade_ID, 1, 2) THEN
+        SIGNAL SQLSTATE '23000'
+            SET MESSAGE_TEXT = 'Battle Beyblade does not exist in beycollection';
+    END IF;
+    IF _winner_ID IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM beycollection WHERE user_beyblade_ID = _winner_ID) THEN
+        SIGNAL SQLSTATE '23000'
+            SET MESSAGE_TEXT = 'Battle winner does not exist in beycollection';
+    END IF;
+END !
+
+CREATE TRIGGER trg_battles_check_insert
+BEFORE INSERT ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_check_battle_references(NEW.player1_ID, NEW.player2_ID,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID);
+END !
+
+CREATE TRIGGER trg_battles_check_update
+BEFORE UPDATE ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_check_battle_references(NEW.player1_ID, NEW.player2_ID,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID);
+END !
+
+-- Replaces ON DELETE CASCADE from users: a deleted user's battles go too
+CREATE TRIGGER trg_users_delete_battles
+AFTER DELETE ON users
+FOR EACH ROW
+BEGIN
+    DELETE FROM battles
+    WHERE player1_ID = OLD.user_ID OR player2_ID = OLD.user_ID;
+END !
+
+-- Replaces the restricting foreign keys from battles to beycollection
+CREATE TRIGGER trg_beycollection_protect_battles
+BEFORE DELETE ON beycollection
+FOR EACH ROW
+BEGIN
+    IF EXISTS (SELECT 1 FROM battles
+               WHERE player1_beyblade_ID = OLD.user_beyblade_ID
+                  OR player2_beyblade_ID = OLD.user_beyblade_ID
+                  OR winner_ID = OLD.user_beyblade_ID) THEN
+        SIGNAL SQLSTATE '23000'
+            SET MESSAGE_TEXT = 'Beyblade is referenced by a battle';
+    END IF;
+END !
+
+-- Deleting a Beyblade cascades to its beycollection entries, but rows
+-- deleted by a foreign key cascade do not fire triggers, so the check above
+-- is repeated for all of the Beyblade's entries before the cascade
+CREATE TRIGGER trg_beyblades_protect_battles
+BEFORE DELETE ON beyblades
+FOR EACH ROW
+BEGIN
+    IF EXISTS (SELECT 1 FROM beycollection c
+               JOIN battles b
+                 ON b.player1_beyblade_ID = c.user_beyblade_ID
+                 OR b.player2_beyblade_ID = c.user_beyblade_ID
+                 OR b.winner_ID = c.user_beyblade_ID
+               WHERE c.beyblade_ID = OLD.beyblade_ID) THEN
+        SIGNAL SQLSTATE '23000'
+            SET MESSAGE_TEXT = 'Beyblade is referenced by a battle';
+    END IF;
+END !
+
+DELIMITER ;
+
+
+-- The change log triggers of setup-routines.sql were dropped with the old
+-- battles table; recreate them on the partitioned one.
+DROP TRIGGER IF EXISTS trg_battles_log_insert;
+DROP TRIGGER IF EXISTS trg_battles_log_update;
+DROP TRIGGER IF EXISTS trg_battles_log_delete;
+DELIMITER !
+
+CREATE TRIGGER trg_battles_log_insert
+AFTER INSERT ON battles
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'insert', NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_log_update
+AFTER UPDATE ON battles
+FOR EACH ROW
+BEGIN
+    IF OLD.battle_ID <> NEW.battle_ID THEN
+        INSERT INTO change_log (table_name, operation, row_key)
+        VALUES ('battles', 'delete', OLD.battle_ID);
+    END IF;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'update', NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_log_delete
+AFTER DELETE ON battles
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'delete', OLD.battle_ID);
+END !
+
+DELIMITER ;
+
+
+-- Likewise for the battle_details triggers of setup-routines.sql
+DROP TRIGGER IF EXISTS trg_battles_details_insert;
+DROP TRIGGER IF EXISTS trg_battles_details_update;
+DROP TRIGGER IF EXISTS trg_battles_details_delete;
+DELIMITER !
+
+CREATE TRIGGER trg_battles_details_insert
+AFTER INSERT ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_battle_details(NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_details_update
+AFTER UPDATE ON battles
+FOR EACH ROW
+BEGIN
+    DELETE FROM battle_details WHERE battle_ID = OLD.battle_ID;
+    CALL sp_refresh_battle_details(NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_details_delete
+AFTER DELETE ON battles
+FOR EACH ROW
+BEGIN
+    DELETE FROM battle_details WHERE battle_ID = OLD.battle_ID;
+END !
+
+DELIMITER ;
+
+
+-- And the daily and trend rollup triggers of setup-routines.sql
+DROP TRIGGER IF EXISTS trg_battles_rollup_insert;
+DROP TRIGGER IF EXISTS trg_battles_rollup_update;
+DROP TRIGGER IF EXISTS trg_battles_rollup_delete;
+DELIMITER !
+
+CREATE TRIGGER trg_battles_rollup_insert
+AFTER INSERT ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_rollup_battle(NEW.battle_date, NEW.tournament_name, NEW.location,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+    CALL sp_rollup_battle_trends(NEW.battle_date, NEW.tournament_name,
+        NEW.location, NEW.player1_ID, NEW.player2_ID, NEW.player1_beyblade_ID,
+        NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+END !
+
+CREATE TRIGGER trg_battles_rollup_update
+AFTER UPDATE ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_rollup_battle(OLD.battle_date, OLD.tournament_name, OLD.location,
+        OLD.player1_beyblade_ID, OLD.player2_beyblade_ID, OLD.winner_ID, -1);
+    CALL sp_rollup_battle_trends(OLD.battle_date, OLD.tournament_name,
+        OLD.location, OLD.player1_ID, OLD.player2_ID, OLD.player1_beyblade_ID,
+        OLD.player2_beyblade_ID, OLD.winner_ID, -1);
+    CALL sp_rollup_battle(NEW.battle_date, NEW.tournament_name, NEW.location,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+    CALL sp_rollup_battle_trends(NEW.battle_date, NEW.tournament_name,
+        NEW.location, NEW.player1_ID, NEW.player2_ID, NEW.player1_beyblade_ID,
+        NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+END !
+
+CREATE TRIGGER trg_battles_rollup_delete
+AFTER DELETE ON battles
+FOR EACH ROW
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM battles_archive
+                   WHERE battle_ID = OLD.battle_ID) THEN
+        CALL sp_rollup_battle(OLD.battle_date, OLD.tournament_name,
+            OLD.location, OLD.player1_beyblade_ID, OLD.player2_beyblade_ID,
+            OLD.winner_ID, -1);
+        CALL sp_rollup_battle_trends(OLD.battle_date, OLD.tournament_name,
+            OLD.location, OLD.player1_ID, OLD.player2_ID,
+            OLD.player1_beyblade_ID, OLD.player2_beyblade_ID, OLD.winner_ID,
+            -1);
+    END IF;
+END !
+
+DELIMITER ;
@@ -160,3 +160,918 @@ BEGIN
 END !
 
 DELIMITER ;
+
+
+-- Procedure: sp_archive_battles
+-- Description: Moves every battle dated before _cutoff from 'battles' into
+--              the compressed 'battles_archive' table, and adds those battles
+--              to the per-user, per-Beyblade and per-tournament rollups so
+--              the leaderboard and statistics stay exact. Everything happens
+--              in one transaction; the run is logged in battle_archive_runs.
+-- Parameters:
+--    _cutoff DATETIME: Battles strictly before this date are archived.
+
+DROP PROCEDURE IF EXISTS sp_archive_battles;
+DELIMITER !
+
+CREATE PROCEDURE sp_archive_battles(IN _cutoff DATETIME)
+BEGIN
+    DECLARE _archived INT;
+
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        ROLLBACK;
+        RESIGNAL;
+    END;
+
+    START TRANSACTION;
+
+    -- Copying the battles locks them (and the range) until the transaction
+    -- ends, so the rollups and the DELETE below see the same rows
+    INSERT INTO battles_archive (battle_ID, tournament_name, battle_date,
+        location, player1_ID, player2_ID, player1_beyblade_ID,
+        player2_beyblade_ID, winner_ID)
+    SELECT battle_ID, tournament_name, battle_date, location, player1_ID,
+        player2_ID, player1_beyblade_ID, player2_beyblade_ID, winner_ID
+    FROM battles
+    WHERE battle_date < _cutoff;
+    SET _archived = ROW_COUNT();
+
+    INSERT INTO battle_rollup_user (user_ID, battles, wins, draws)
+    SELECT * FROM (
+        SELECT user_ID, COUNT(*) AS n_battles, SUM(won) AS n_wins,
+            SUM(draw) AS n_draws
+        FROM (
+            SELECT player1_ID AS user_ID,
+                COALESCE(winner_ID = player1_beyblade_ID, 0) AS won,
+                winner_ID IS NULL AS draw
+            FROM battles WHERE battle_date < _cutoff
+            UNION ALL
+            SELECT player2_ID,
+                COALESCE(winner_ID = player2_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM battles WHERE battle_date < _cutoff
+        ) AS players
+        GROUP BY user_ID
+    ) AS r
+    ON DUPLICATE KEY UPDATE battles = battles + n_battles,
+        wins = wins + n_wins, draws = draws + n_draws;
+
+    INSERT INTO battle_rollup_beyblade (user_beyblade_ID, battles, wins)
+    SELECT * FROM (
+        SELECT user_beyblade_ID, COUNT(*) AS n_battles, SUM(won) AS n_wins
+        FROM (
+            SELECT player1_beyblade_ID AS user_beyblade_ID,
+                COALESCE(winner_ID = player1_beyblade_ID, 0) AS won
+            FROM battles WHERE battle_date < _cutoff
+            UNION ALL
+            SELECT player2_beyblade_ID,
+                COALESCE(winner_ID = player2_beyblade_ID, 0)
+            FROM battles WHERE battle_date < _cutoff
+        ) AS beys
+        GROUP BY user_beyblade_ID
+    ) AS r
+    ON DUPLICATE KEY UPDATE battles = battles + n_battles,
+        wins = wins + n_wins;
+
+    INSERT INTO battle_rollup_tournament (tournament_name, battles, draws,
+        first_battle, last_battle)
+    SELECT * FROM (
+        SELECT tournament_name, COUNT(*) AS n_battles,
+            SUM(winner_ID IS NULL) AS n_draws, MIN(battle_date) AS n_first,
+            MAX(battle_date) AS n_last
+        FROM battles WHERE battle_date < _cutoff
+        GROUP BY tournament_name
+    ) AS r
+    ON DUPLICATE KEY UPDATE battles = battles + n_battles,
+        draws = draws + n_draws,
+        first_battle = LEAST(first_battle, n_first),
+        last_battle = GREATEST(last_battle, n_last);
+
+    DELETE FROM battles WHERE battle_date < _cutoff;
+
+    INSERT INTO battle_archive_runs (cutoff, battles_archived, run_at)
+    VALUES (_cutoff, _archived, NOW());
+
+    COMMIT;
+END !
+
+DELIMITER ;
+
+
+-- Procedure: sp_record_journaled_battle
+-- Description: Records a battle from the battle journal (see journal.py)
+--              with sp_record_battle, unless the journal entry was already
+--              recorded. Replaying the same entry after a crash is therefore
+--              a no-op. The caller commits, so a batch of entries can share
+--              one transaction.
+-- Parameters:
+--    _entry_ID CHAR(32): The client-generated ID of the journal entry.
+--    The remaining parameters are those of sp_record_battle.
+
+DROP PROCEDURE IF EXISTS sp_record_journaled_battle;
+DELIMITER !
+
+CREATE PROCEDURE sp_record_journaled_battle(
+    IN _entry_ID CHAR(32),
+    IN _tournament_name VARCHAR(250),
+    IN _battle_date DATETIME,
+    IN _location VARCHAR(250),
+    IN _player1_ID INT,
+    IN _player2_ID INT,
+    IN _player1_beyblade_ID INT,
+    IN _player2_beyblade_ID INT,
+    IN _winner_ID INT
+)
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM battle_journal_applied
+                   WHERE entry_ID = _entry_ID) THEN
+        CALL sp_record_battle(_tournament_name, _battle_date, _location,
+            _player1_ID, _player2_ID, _player1_beyblade_ID,
+            _player2_beyblade_ID, _winner_ID);
+        INSERT INTO battle_journal_applied (entry_ID, battle_ID, applied_at)
+        VALUES (_entry_ID, LAST_INSERT_ID(), NOW());
+    END IF;
+END !
+
+DELIMITER ;
+
+
+-- Procedure: sp_record_round
+-- Description: Records a whole round of battles given as a JSON array,
+--              instead of one sp_record_battle call per battle. Every battle
+--              is checked in one query: all fields given, two different
+--              players, each Beyblade-Player ID in its player's collection
+--              (and the player a registered user), and the winner one of the
+--              two Beyblades. The battles that fail are left in the temporary
+--              table round_errors (row_no, error), numbered from 1 in array
+--              order; if there are none, all battles are inserted with one
+--              INSERT ... SELECT. The caller reads round_errors and commits
+--              or rolls back, so the round is recorded in one transaction.
+-- Parameters:
+--    _battles JSON: An array of objects with the fields of sp_record_battle
+--    (tournament_name, battle_date, location, player1_ID, player2_ID,
+--    player1_beyblade_ID, player2_beyblade_ID, winner_ID); winner_ID is
+--    null or missing for a draw.
+
+DROP PROCEDURE IF EXISTS sp_record_round;
+DELIMITER !
+
+CREATE PROCEDURE sp_record_round(IN _battles JSON)
+BEGIN
+    DROP TEMPORARY TABLE IF EXISTS round_battles;
+    DROP TEMPORARY TABLE IF EXISTS round_errors;
+
+    -- Values missing from an object or of the wrong type become NULL
+    CREATE TEMPORARY TABLE round_battles AS
+    SELECT * FROM JSON_TABLE(_battles, '$[*]' COLUMNS (
+        row_no FOR ORDINALITY,
+        tournament_name VARCHAR(250) PATH '$.tournament_name',
+        battle_date DATETIME PATH '$.battle_date',
+        location VARCHAR(250) PATH '$.location',
+        player1_ID INT PATH '$.player1_ID',
+        player2_ID INT PATH '$.player2_ID',
+        player1_beyblade_ID INT PATH '$.player1_beyblade_ID',
+        player2_beyblade_ID INT PATH '$.player2_beyblade_ID',
+        winner_ID INT PATH '$.winner_ID')) AS r;
+
+    CREATE TEMPORARY TABLE round_errors AS
+    SELECT row_no, error FROM (
+        SELECT r.row_no, CASE
+            WHEN r.tournament_name IS NULL OR r.battle_date IS NULL
+                OR r.location IS NULL OR r.player1_ID IS NULL
+                OR r.player2_ID IS NULL OR r.player1_beyblade_ID IS NULL
+                OR r.player2_beyblade_ID IS NULL
+                OR TRIM(r.tournament_name) = '' OR TRIM(r.location) = ''
+                THEN 'Missing or invalid fields.'
+            WHEN r.player1_ID = r.player2_ID
+                THEN 'The two players must be different Bladers.'
+            WHEN c1.user_beyblade_ID IS NULL
+                THEN CONCAT('Beyblade-Player ID ', r.player1_beyblade_ID,
+                            ' is not in the collection of player 1 (',
+                            r.player1_ID, ').')
+            WHEN c2.user_beyblade_ID IS NULL
+                THEN CONCAT('Beyblade-Player ID ', r.player2_beyblade_ID,
+                            ' is not in the collection of player 2 (',
+                            r.player2_ID, ').')
+            WHEN r.winner_ID IS NOT NULL AND r.winner_ID NOT IN
+                (r.player1_beyblade_ID, r.player2_beyblade_ID)
+                THEN 'The winner must be one of the two Beyblade-Player IDs.'
+        END AS error
+        FROM round_battles r
+        LEFT JOIN beycollection c1
+            ON c1.user_beyblade_ID = r.player1_beyblade_ID
+            AND c1.user_ID = r.player1_ID
+            AND c1.user_ID IN (SELECT user_ID FROM users)
+        LEFT JOIN beycollection c2
+            ON c2.user_beyblade_ID = r.player2_beyblade_ID
+            AND c2.user_ID = r.player2_ID
+            AND c2.user_ID IN (SELECT user_ID FROM users)
+    ) AS checked
+    WHERE error IS NOT NULL;
+
+    IF NOT EXISTS (SELECT 1 FROM round_errors) THEN
+        INSERT INTO battles (tournament_name, battle_date, location,
+            player1_ID, player2_ID, player1_beyblade_ID, player2_beyblade_ID,
+            winner_ID)
+        SELECT tournament_name, battle_date, location, player1_ID,
+            player2_ID, player1_beyblade_ID, player2_beyblade_ID, winner_ID
+        FROM round_battles
+        ORDER BY row_no;
+    END IF;
+    DROP TEMPORARY TABLE round_battles;
+END !
+
+DELIMITER ;
+
+
+-- Change log triggers: every row inserted, updated or deleted in battles,
+-- beycollection, beyblades, parts and users is appended to change_log with
+-- its primary key (see changelog.py). An update changing a row's key is
+-- logged as a delete of the old key and an update of the new one.
+-- Note: rows deleted by ON DELETE CASCADE do not fire triggers in MySQL, so
+-- consumers treat a deleted user as deleting their collection and battles.
+DROP TRIGGER IF EXISTS trg_battles_log_insert;
+DROP TRIGGER IF EXISTS trg_battles_log_update;
+DROP TRIGGER IF EXISTS trg_battles_log_delete;
+DROP TRIGGER IF EXISTS trg_beycollection_log_insert;
+DROP TRIGGER IF EXISTS trg_beycollection_log_update;
+DROP TRIGGER IF EXISTS trg_beycollection_log_delete;
+DROP TRIGGER IF EXISTS trg_beyblades_log_insert;
+DROP TRIGGER IF EXISTS trg_beyblades_log_update;
+DROP TRIGGER IF EXISTS trg_beyblades_log_delete;
+DROP TRIGGER IF EXISTS trg_parts_log_insert;
+DROP TRIGGER IF EXISTS trg_parts_log_update;
+DROP TRIGGER IF EXISTS trg_parts_log_delete;
+DROP TRIGGER IF EXISTS trg_users_log_insert;
+DROP TRIGGER IF EXISTS trg_users_log_update;
+DROP TRIGGER IF EXISTS trg_users_log_delete;
+DELIMITER !
+
+CREATE TRIGGER trg_battles_log_insert
+AFTER INSERT ON battles
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'insert', NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_log_update
+AFTER UPDATE ON battles
+FOR EACH ROW
+BEGIN
+    IF OLD.battle_ID <> NEW.battle_ID THEN
+        INSERT INTO change_log (table_name, operation, row_key)
+        VALUES ('battles', 'delete', OLD.battle_ID);
+    END IF;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'update', NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_log_delete
+AFTER DELETE ON battles
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'delete', OLD.battle_ID);
+END !
+
+CREATE TRIGGER trg_beycollection_log_insert
+AFTER INSERT ON beycollection
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beycollection', 'insert', NEW.user_beyblade_ID);
+END !
+
+CREATE TRIGGER trg_beycollection_log_update
+AFTER UPDATE ON beycollection
+FOR EACH ROW
+BEGIN
+    IF OLD.user_beyblade_ID <> NEW.user_beyblade_ID THEN
+        INSERT INTO change_log (table_name, operation, row_key)
+        VALUES ('beycollection', 'delete', OLD.user_beyblade_ID);
+    END IF;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beycollection', 'update', NEW.user_beyblade_ID);
+END !
+
+CREATE TRIGGER trg_beycollection_log_delete
+AFTER DELETE ON beycollection
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beycollection', 'delete', OLD.user_beyblade_ID);
+END !
+
+CREATE TRIGGER trg_beyblades_log_insert
+AFTER INSERT ON beyblades
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beyblades', 'insert', NEW.beyblade_ID);
+END !
+
+CREATE TRIGGER trg_beyblades_log_update
+AFTER UPDATE ON beyblades
+FOR EACH ROW
+BEGIN
+    IF OLD.beyblade_ID <> NEW.beyblade_ID THEN
+        INSERT INTO change_log (table_name, operation, row_key)
+        VALUES ('beyblades', 'delete', OLD.beyblade_ID);
+    END IF;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beyblades', 'update', NEW.beyblade_ID);
+END !
+
+CREATE TRIGGER trg_beyblades_log_delete
+AFTER DELETE ON beyblades
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beyblades', 'delete', OLD.beyblade_ID);
+END !
+
+CREATE TRIGGER trg_parts_log_insert
+AFTER INSERT ON parts
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('parts', 'insert', NEW.part_ID);
+END !
+
+CREATE TRIGGER trg_parts_log_update
+AFTER UPDATE ON parts
+FOR EACH ROW
+BEGIN
+    IF OLD.part_ID <> NEW.part_ID THEN
+        INSERT INTO change_log (table_name, operation, row_key)
+        VALUES ('parts', 'delete', OLD.part_ID);
+    END IF;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('parts', 'update', NEW.part_ID);
+END !
+
+CREATE TRIGGER trg_parts_log_delete
+AFTER DELETE ON parts
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('parts', 'delete', OLD.part_ID);
+END !
+
+CREATE TRIGGER trg_users_log_insert
+AFTER INSERT ON users
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('users', 'insert', NEW.user_ID);
+END !
+
+CREATE TRIGGER trg_users_log_update
+AFTER UPDATE ON users
+FOR EACH ROW
+BEGIN
+    IF OLD.user_ID <> NEW.user_ID THEN
+        INSERT INTO change_log (table_name, operation, row_key)
+        VALUES ('users', 'delete', OLD.user_ID);
+    END IF;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('users', 'update', NEW.user_ID);
+END !
+
+CREATE TRIGGER trg_users_log_delete
+AFTER DELETE ON users
+FOR EACH ROW
+BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('users', 'delete', OLD.user_ID);
+END !
+
+DELIMITER ;
+
+
+-- Procedure: sp_refresh_battle_details
+-- Description: Rewrites the battle_details row of one battle (see setup.sql)
+--              from battles, users, beycollection and beyblades, or deletes
+--              it if the battle no longer exists.
+-- Parameters:
+--    _battle_ID INT: The battle to refresh.
+
+DROP PROCEDURE IF EXISTS sp_refresh_battle_details;
+DELIMITER !
+
+CREATE PROCEDURE sp_refresh_battle_details(IN _battle_ID INT)
+BEGIN
+    DELETE FROM battle_details WHERE battle_ID = _battle_ID;
+    INSERT INTO battle_details (battle_ID, tournament_name, battle_date,
+        location, player1_ID, player2_ID, player1_username, player2_username,
+        player1_beyblade_ID, player2_beyblade_ID, player1_beyblade_name,
+        player2_beyblade_name, winner_ID)
+    SELECT b.battle_ID, b.tournament_name, b.battle_date, b.location,
+        b.player1_ID, b.player2_ID, u1.username, u2.username,
+        b.player1_beyblade_ID, b.player2_beyblade_ID, bb1.name, bb2.name,
+        b.winner_ID
+    FROM battles b
+    JOIN users u1 ON b.player1_ID = u1.user_ID
+    JOIN users u2 ON b.player2_ID = u2.user_ID
+    JOIN beycollection ub1 ON b.player1_beyblade_ID = ub1.user_beyblade_ID
+    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
+    JOIN beycollection ub2 ON b.player2_beyblade_ID = ub2.user_beyblade_ID
+    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID
+    WHERE b.battle_ID = _battle_ID;
+END !
+
+DELIMITER ;
+
+-- Fill battle_details with the battles loaded so far (load-data.sql);
+-- the triggers below keep it up to date afterwards
+DELETE FROM battle_details;
+INSERT INTO battle_details (battle_ID, tournament_name, battle_date,
+    location, player1_ID, player2_ID, player1_username, player2_username,
+    player1_beyblade_ID, player2_beyblade_ID, player1_beyblade_name,
+    player2_beyblade_name, winner_ID)
+SELECT b.battle_ID, b.tournament_name, b.battle_date, b.location,
+    b.player1_ID, b.player2_ID, u1.username, u2.username,
+    b.player1_beyblade_ID, b.player2_beyblade_ID, bb1.name, bb2.name,
+    b.winner_ID
+FROM battles b
+JOIN users u1 ON b.player1_ID = u1.user_ID
+JOIN users u2 ON b.player2_ID = u2.user_ID
+JOIN beycollection ub1 ON b.player1_beyblade_ID = ub1.user_beyblade_ID
+JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
+JOIN beycollection ub2 ON b.player2_beyblade_ID = ub2.user_beyblade_ID
+JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID;
+
+
+-- battle_details triggers: battles are copied with their usernames and
+-- Beyblade names, and renaming a user or Beyblade updates the copies.
+-- Battles deleted by ON DELETE CASCADE from users do not fire triggers in
+-- MySQL, so deleting a user deletes their copies directly.
+DROP TRIGGER IF EXISTS trg_battles_details_insert;
+DROP TRIGGER IF EXISTS trg_battles_details_update;
+DROP TRIGGER IF EXISTS trg_battles_details_delete;
+DROP TRIGGER IF EXISTS trg_users_details_update;
+DROP TRIGGER IF EXISTS trg_users_details_delete;
+DROP TRIGGER IF EXISTS trg_beyblades_details_update;
+DROP TRIGGER IF EXISTS trg_beycollection_details_update;
+DELIMITER !
+
+CREATE TRIGGER trg_battles_details_insert
+AFTER INSERT ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_refresh_battle_details(NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_details_update
+AFTER UPDATE ON battles
+FOR EACH ROW
+BEGIN
+    DELETE FROM battle_details WHERE battle_ID = OLD.battle_ID;
+    CALL sp_refresh_battle_details(NEW.battle_ID);
+END !
+
+CREATE TRIGGER trg_battles_details_delete
+AFTER DELETE ON battles
+FOR EACH ROW
+BEGIN
+    DELETE FROM battle_details WHERE battle_ID = OLD.battle_ID;
+END !
+
+CREATE TRIGGER trg_users_details_update
+AFTER UPDATE ON users
+FOR EACH ROW
+BEGIN
+    IF OLD.username <> NEW.username THEN
+        UPDATE battle_details SET player1_username = NEW.username
+        WHERE player1_ID = NEW.user_ID;
+        UPDATE battle_details SET player2_username = NEW.username
+        WHERE player2_ID = NEW.user_ID;
+    END IF;
+END !
+
+CREATE TRIGGER trg_users_details_delete
+AFTER DELETE ON users
+FOR EACH ROW
+BEGIN
+    DELETE FROM battle_details
+    WHERE player1_ID = OLD.user_ID OR player2_ID = OLD.user_ID;
+END !
+
+CREATE TRIGGER trg_beyblades_details_update
+AFTER UPDATE ON beyblades
+FOR EACH ROW
+BEGIN
+    IF OLD.name <> NEW.name THEN
+        UPDATE battle_details d
+        JOIN beycollection ub ON d.player1_beyblade_ID = ub.user_beyblade_ID
+        SET d.player1_beyblade_name = NEW.name
+        WHERE ub.beyblade_ID = NEW.beyblade_ID;
+        UPDATE battle_details d
+        JOIN beycollection ub ON d.player2_beyblade_ID = ub.user_beyblade_ID
+        SET d.player2_beyblade_name = NEW.name
+        WHERE ub.beyblade_ID = NEW.beyblade_ID;
+    END IF;
+END !
+
+CREATE TRIGGER trg_beycollection_details_update
+AFTER UPDATE ON beycollection
+FOR EACH ROW
+BEGIN
+    IF OLD.beyblade_ID <> NEW.beyblade_ID THEN
+        UPDATE battle_details SET player1_beyblade_name =
+            (SELECT name FROM beyblades WHERE beyblade_ID = NEW.beyblade_ID)
+        WHERE player1_beyblade_ID = NEW.user_beyblade_ID;
+        UPDATE battle_details SET player2_beyblade_name =
+            (SELECT name FROM beyblades WHERE beyblade_ID = NEW.beyblade_ID)
+        WHERE player2_beyblade_ID = NEW.user_beyblade_ID;
+    END IF;
+END !
+
+DELIMITER ;
+
+
+-- Procedure: sp_rollup_battle
+-- Description: Adds a battle to (or with _sign = -1, removes it from) the
+--              daily per-Beyblade rollup battle_daily_beyblade, for both of
+--              its Beyblades. Called by the trg_battles_rollup_* triggers.
+-- Parameters:
+--    _battle_date, _tournament_name, _location, _player1_beyblade_ID,
+--    _player2_beyblade_ID, _winner_ID: The battle's columns.
+--    _sign INT: 1 to add the battle, -1 to remove it.
+
+DROP PROCEDURE IF EXISTS sp_rollup_battle;
+DELIMITER !
+
+CREATE PROCEDURE sp_rollup_battle(
+    IN _battle_date DATETIME,
+    IN _tournament_name VARCHAR(250),
+    IN _location VARCHAR(250),
+    IN _player1_beyblade_ID INT,
+    IN _player2_beyblade_ID INT,
+    IN _winner_ID INT,
+    IN _sign INT
+)
+BEGIN
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES
+        (DATE(_battle_date), _player1_beyblade_ID, _tournament_name,
+         _location, _sign,
+         _sign * COALESCE(_winner_ID = _player1_beyblade_ID, 0),
+         _sign * (_winner_ID IS NULL)),
+        (DATE(_battle_date), _player2_beyblade_ID, _tournament_name,
+         _location, _sign,
+         _sign * COALESCE(_winner_ID = _player2_beyblade_ID, 0),
+         _sign * (_winner_ID IS NULL))
+    ON DUPLICATE KEY UPDATE battles = battles + VALUES(battles),
+        wins = wins + VALUES(wins), draws = draws + VALUES(draws);
+
+    IF _sign < 0 THEN
+        DELETE FROM battle_daily_beyblade
+        WHERE battle_day = DATE(_battle_date)
+          AND user_beyblade_ID IN (_player1_beyblade_ID, _player2_beyblade_ID)
+          AND tournament_name = _tournament_name AND location = _location
+          AND battles <= 0;
+    END IF;
+END !
+
+DELIMITER ;
+
+-- Fill the rollup with the battles loaded so far (load-data.sql); the
+-- triggers below keep it up to date afterwards
+DELETE FROM battle_daily_beyblade;
+INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+    tournament_name, location, battles, wins, draws)
+SELECT DATE(battle_date), user_beyblade_ID, tournament_name, location,
+    COUNT(*), SUM(won), SUM(draw)
+FROM (
+    SELECT battle_date, tournament_name, location,
+        player1_beyblade_ID AS user_beyblade_ID,
+        COALESCE(winner_ID = player1_beyblade_ID, 0) AS won,
+        winner_ID IS NULL AS draw
+    FROM battles
+    UNION ALL
+    SELECT battle_date, tournament_name, location, player2_beyblade_ID,
+        COALESCE(winner_ID = player2_beyblade_ID, 0), winner_ID IS NULL
+    FROM battles
+) AS beys
+GROUP BY DATE(battle_date), user_beyblade_ID, tournament_name, location;
+
+
+
+-- Procedure: sp_rollup_battle_trends
+-- Description: Adds a battle to (or with _sign = -1, removes it from) the
+--              daily and weekly trend rollups battle_trend_daily and
+--              battle_trend_weekly, for its two Beyblades, two users,
+--              tournament and location. Called by the trg_battles_rollup_*
+--              triggers.
+-- Parameters:
+--    _battle_date, _tournament_name, _location, _player1_ID, _player2_ID,
+--    _player1_beyblade_ID, _player2_beyblade_ID, _winner_ID: The battle's
+--    columns.
+--    _sign INT: 1 to add the battle, -1 to remove it.
+
+DROP PROCEDURE IF EXISTS sp_rollup_battle_trends;
+DELIMITER !
+
+CREATE PROCEDURE sp_rollup_battle_trends(
+    IN _battle_date DATETIME,
+    IN _tournament_name VARCHAR(250),
+    IN _location VARCHAR(250),
+    IN _player1_ID INT,
+    IN _player2_ID INT,
+    IN _player1_beyblade_ID INT,
+    IN _player2_beyblade_ID INT,
+    IN _winner_ID INT,
+    IN _sign INT
+)
+BEGIN
+    -- Weeks start on Monday
+    DECLARE _day DATE DEFAULT DATE(_battle_date);
+    DECLARE _week DATE DEFAULT
+        DATE_SUB(DATE(_battle_date), INTERVAL WEEKDAY(_battle_date) DAY);
+    DECLARE _draws INT DEFAULT _sign * (_winner_ID IS NULL);
+
+    INSERT INTO battle_trend_daily (dimension, dim_key, bucket, battles, wins,
+        draws)
+    VALUES
+        ('beyblade', _player1_beyblade_ID, _day, _sign,
+         _sign * COALESCE(_winner_ID = _player1_beyblade_ID, 0), _draws),
+        ('beyblade', _player2_beyblade_ID, _day, _sign,
+         _sign * COALESCE(_winner_ID = _player2_beyblade_ID, 0), _draws),
+        ('user', _player1_ID, _day, _sign,
+         _sign * COALESCE(_winner_ID = _player1_beyblade_ID, 0), _draws),
+        ('user', _player2_ID, _day, _sign,
+         _sign * COALESCE(_winner_ID = _player2_beyblade_ID, 0), _draws),
+        ('tournament', _tournament_name, _day, _sign,
+         _sign * (_winner_ID IS NOT NULL), _draws),
+        ('location', _location, _day, _sign,
+         _sign * (_winner_ID IS NOT NULL), _draws)
+    ON DUPLICATE KEY UPDATE battles = battles + VALUES(battles),
+        wins = wins + VALUES(wins), draws = draws + VALUES(draws);
+
+    INSERT INTO battle_trend_weekly (dimension, dim_key, bucket, battles, wins,
+        draws)
+    VALUES
+        ('beyblade', _player1_beyblade_ID, _week, _sign,
+         _sign * COALESCE(_winner_ID = _player1_beyblade_ID, 0), _draws),
+        ('beyblade', _player2_beyblade_ID, _week, _sign,
+         _sign * COALESCE(_winner_ID = _player2_beyblade_ID, 0), _draws),
+        ('user', _player1_ID, _week, _sign,
+         _sign * COALESCE(_winner_ID = _player1_beyblade_ID, 0), _draws),
+        ('user', _player2_ID, _week, _sign,
+         _sign * COALESCE(_winner_ID = _player2_beyblade_ID, 0), _draws),
+        ('tournament', _tournament_name, _week, _sign,
+         _sign * (_winner_ID IS NOT NULL), _draws),
+        ('location', _location, _week, _sign,
+         _sign * (_winner_ID IS NOT NULL), _draws)
+    ON DUPLICATE KEY UPDATE battles = battles + VALUES(battles),
+        wins = wins + VALUES(wins), draws = draws + VALUES(draws);
+
+    IF _sign < 0 THEN
+        DELETE FROM battle_trend_daily WHERE bucket = _day AND battles <= 0;
+        DELETE FROM battle_trend_weekly WHERE bucket = _week AND battles <= 0;
+    END IF;
+END !
+
+DELIMITER ;
+
+-- Fill the trend rollups with the battles loaded so far (load-data.sql);
+-- `python rollups.py backfill` rebuilds them the same way later on
+DELETE FROM battle_trend_daily;
+INSERT INTO battle_trend_daily (dimension, dim_key, bucket, battles, wins,
+    draws)
+SELECT dimension, dim_key, DATE(battle_date), COUNT(*), SUM(won), SUM(draw)
+FROM (
+    SELECT 'beyblade' AS dimension, player1_beyblade_ID AS dim_key,
+        battle_date, COALESCE(winner_ID = player1_beyblade_ID, 0) AS won,
+        winner_ID IS NULL AS draw
+    FROM battles
+    UNION ALL
+    SELECT 'beyblade', player2_beyblade_ID, battle_date,
+        COALESCE(winner_ID = player2_beyblade_ID, 0), winner_ID IS NULL
+    FROM battles
+    UNION ALL
+    SELECT 'user', player1_ID, battle_date,
+        COALESCE(winner_ID = player1_beyblade_ID, 0), winner_ID IS NULL
+    FROM battles
+    UNION ALL
+    SELECT 'user', player2_ID, battle_date,
+        COALESCE(winner_ID = player2_beyblade_ID, 0), winner_ID IS NULL
+    FROM battles
+    UNION ALL
+    SELECT 'tournament', tournament_name, battle_date,
+        winner_ID IS NOT NULL, winner_ID IS NULL
+    FROM battles
+    UNION ALL
+    SELECT 'location', location, battle_date, winner_ID IS NOT NULL,
+        winner_ID IS NULL
+    FROM battles
+) AS dims
+GROUP BY dimension, dim_key, DATE(battle_date);
+
+-- Weeks are summed from the days
+DELETE FROM battle_trend_weekly;
+INSERT INTO battle_trend_weekly (dimension, dim_key, bucket, battles, wins,
+    draws)
+SELECT dimension, dim_key, DATE_SUB(bucket, INTERVAL WEEKDAY(bucket) DAY),
+    SUM(battles), SUM(wins), SUM(draws)
+FROM battle_trend_daily
+GROUP BY dimension, dim_key, DATE_SUB(bucket, INTERVAL WEEKDAY(bucket) DAY);
+
+
+-- Daily and trend rollup triggers. A battle deleted by sp_archive_battles is
+-- already in battles_archive and stays counted. Battles deleted by ON DELETE
+-- CASCADE from users do not fire triggers in MySQL, so deleting a user
+-- removes their battles from the rollups before the cascade.
+DROP TRIGGER IF EXISTS trg_battles_rollup_insert;
+DROP TRIGGER IF EXISTS trg_battles_rollup_update;
+DROP TRIGGER IF EXISTS trg_battles_rollup_delete;
+DROP TRIGGER IF EXISTS trg_users_rollup_delete;
+DELIMITER !
+
+CREATE TRIGGER trg_battles_rollup_insert
+AFTER INSERT ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_rollup_battle(NEW.battle_date, NEW.tournament_name, NEW.location,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+    CALL sp_rollup_battle_trends(NEW.battle_date, NEW.tournament_name,
+        NEW.location, NEW.player1_ID, NEW.player2_ID, NEW.player1_beyblade_ID,
+        NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+END !
+
+CREATE TRIGGER trg_battles_rollup_update
+AFTER UPDATE ON battles
+FOR EACH ROW
+BEGIN
+    CALL sp_rollup_battle(OLD.battle_date, OLD.tournament_name, OLD.location,
+        OLD.player1_beyblade_ID, OLD.player2_beyblade_ID, OLD.winner_ID, -1);
+    CALL sp_rollup_battle_trends(OLD.battle_date, OLD.tournament_name,
+        OLD.location, OLD.player1_ID, OLD.player2_ID, OLD.player1_beyblade_ID,
+        OLD.player2_beyblade_ID, OLD.winner_ID, -1);
+    CALL sp_rollup_battle(NEW.battle_date, NEW.tournament_name, NEW.location,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+    CALL sp_rollup_battle_trends(NEW.battle_date, NEW.tournament_name,
+        NEW.location, NEW.player1_ID, NEW.player2_ID, NEW.player1_beyblade_ID,
+        NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+END !
+
+CREATE TRIGGER trg_battles_rollup_delete
+AFTER DELETE ON battles
+FOR EACH ROW
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM battles_archive
+                   WHERE battle_ID = OLD.battle_ID) THEN
+        CALL sp_rollup_battle(OLD.battle_date, OLD.tournament_name,
+            OLD.location, OLD.player1_beyblade_ID, OLD.player2_beyblade_ID,
+            OLD.winner_ID, -1);
+        CALL sp_rollup_battle_trends(OLD.battle_date, OLD.tournament_name,
+            OLD.location, OLD.player1_ID, OLD.player2_ID,
+            OLD.player1_beyblade_ID, OLD.player2_beyblade_ID, OLD.winner_ID,
+            -1);
+    END IF;
+END !
+
+CREATE TRIGGER trg_users_rollup_delete
+BEFORE DELETE ON users
+FOR EACH ROW
+BEGIN
+    UPDATE battle_daily_beyblade r
+    JOIN (
+        SELECT DATE(battle_date) AS battle_day, user_beyblade_ID,
+            tournament_name, location, COUNT(*) AS battles, SUM(won) AS wins,
+            SUM(draw) AS draws
+        FROM (
+            SELECT battle_date, tournament_name, location,
+                player1_beyblade_ID AS user_beyblade_ID,
+                COALESCE(winner_ID = player1_beyblade_ID, 0) AS won,
+                winner_ID IS NULL AS draw
+            FROM battles b
+            WHERE (player1_ID = OLD.user_ID OR player2_ID = OLD.user_ID)
+              AND NOT EXISTS (SELECT 1 FROM battles_archive a
+                              WHERE a.battle_ID = b.battle_ID)
+            UNION ALL
+            SELECT battle_date, tournament_name, location,
+                player2_beyblade_ID,
+                COALESCE(winner_ID = player2_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM battles b
+            WHERE (player1_ID = OLD.user_ID OR player2_ID = OLD.user_ID)
+              AND NOT EXISTS (SELECT 1 FROM battles_archive a
+                              WHERE a.battle_ID = b.battle_ID)
+        ) AS beys
+        GROUP BY DATE(battle_date), user_beyblade_ID, tournament_name,
+            location
+    ) AS removed
+      ON r.battle_day = removed.battle_day
+     AND r.user_beyblade_ID = removed.user_beyblade_ID
+     AND r.tournament_name = removed.tournament_name
+     AND r.location = removed.location
+    SET r.battles = r.battles - removed.battles,
+        r.wins = r.wins - removed.wins, r.draws = r.draws - removed.draws;
+    DELETE FROM battle_daily_beyblade WHERE battles <= 0;
+
+    UPDATE battle_trend_daily r
+    JOIN (
+        WITH user_battles AS (
+            SELECT * FROM battles b
+            WHERE (player1_ID = OLD.user_ID OR player2_ID = OLD.user_ID)
+              AND NOT EXISTS (SELECT 1 FROM battles_archive a
+                              WHERE a.battle_ID = b.battle_ID)
+        )
+        SELECT dimension, dim_key, DATE(battle_date) AS bucket,
+            COUNT(*) AS battles, SUM(won) AS wins, SUM(draw) AS draws
+        FROM (
+            SELECT 'beyblade' AS dimension, player1_beyblade_ID AS dim_key,
+                battle_date,
+                COALESCE(winner_ID = player1_beyblade_ID, 0) AS won,
+                winner_ID IS NULL AS draw
+            FROM user_battles
+            UNION ALL
+            SELECT 'beyblade', player2_beyblade_ID, battle_date,
+                COALESCE(winner_ID = player2_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'user', player1_ID, battle_date,
+                COALESCE(winner_ID = player1_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'user', player2_ID, battle_date,
+                COALESCE(winner_ID = player2_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'tournament', tournament_name, battle_date,
+                winner_ID IS NOT NULL, winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'location', location, battle_date, winner_ID IS NOT NULL,
+                winner_ID IS NULL
+            FROM user_battles
+        ) AS dims
+        GROUP BY dimension, dim_key, DATE(battle_date)
+    ) AS removed
+      ON r.dimension = removed.dimension AND r.dim_key = removed.dim_key
+     AND r.bucket = removed.bucket
+    SET r.battles = r.battles - removed.battles,
+        r.wins = r.wins - removed.wins, r.draws = r.draws - removed.draws;
+    DELETE FROM battle_trend_daily WHERE battles <= 0;
+
+    -- Weeks start on Monday, as in sp_rollup_battle_trends
+    UPDATE battle_trend_weekly r
+    JOIN (
+        WITH user_battles AS (
+            SELECT * FROM battles b
+            WHERE (player1_ID = OLD.user_ID OR player2_ID = OLD.user_ID)
+              AND NOT EXISTS (SELECT 1 FROM battles_archive a
+                              WHERE a.battle_ID = b.battle_ID)
+        )
+        SELECT dimension, dim_key, DATE_SUB(DATE(battle_date),
+            INTERVAL WEEKDAY(battle_date) DAY) AS bucket,
+            COUNT(*) AS battles, SUM(won) AS wins, SUM(draw) AS draws
+        FROM (
+            SELECT 'beyblade' AS dimension, player1_beyblade_ID AS dim_key,
+                battle_date,
+                COALESCE(winner_ID = player1_beyblade_ID, 0) AS won,
+                winner_ID IS NULL AS draw
+            FROM user_battles
+            UNION ALL
+            SELECT 'beyblade', player2_beyblade_ID, battle_date,
+                COALESCE(winner_ID = player2_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'user', player1_ID, battle_date,
+                COALESCE(winner_ID = player1_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'user', player2_ID, battle_date,
+                COALESCE(winner_ID = player2_beyblade_ID, 0),
+                winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'tournament', tournament_name, battle_date,
+                winner_ID IS NOT NULL, winner_ID IS NULL
+            FROM user_battles
+            UNION ALL
+            SELECT 'location', location, battle_date, winner_ID IS NOT NULL,
+                winner_ID IS NULL
+            FROM user_battles
+        ) AS dims
+        GROUP BY dimension, dim_key, DATE_SUB(DATE(battle_date),
+            INTERVAL WEEKDAY(battle_date) DAY)
+    ) AS removed
+      ON r.dimension = removed.dimension AND r.dim_key = removed.dim_key
+     AND r.bucket = removed.bucket
+    SET r.battles = r.battles - removed.battles,
+        r.wins = r.wins - removed.wins, r.draws = r.draws - removed.draws;
+    DELETE FROM battle_trend_weekly WHERE battles <= 0;
+END !
+
+DELIMITER ;
@@ -0,0 +1,680 @@
+-- SQLite version of setup.sql and the user_info table of setup-passwords.sql,
+-- used by the embedded SQLite backend (see backends.py). The stored
+-- procedures and functions of setup-routines.sql and setup-passwords.sql
+-- (sp_add_beyblade, sp_record_battle, sp_record_round, sp_add_user,
+-- sp_change_password, authenticate, udf_heaviest_beyblade_for_type) are
+-- implemented in Python by the backend, since SQLite has no stored routines.
+--
+-- ENUM columns become CHECK constraints, AUTO_INCREMENT becomes INTEGER
+-- PRIMARY KEY, and the trg_update_date_joined trigger is an AFTER INSERT
+-- trigger because SQLite triggers cannot assign to NEW.
+
+PRAGMA foreign_keys = ON;
+
+-- Remove existing tables to prevent errors on creation
+DROP VIEW IF EXISTS battle_trend_changes;
+DROP TABLE IF EXISTS parts_fts;
+DROP TABLE IF EXISTS change_log_checkpoints;
+DROP TABLE IF EXISTS change_log;
+DROP TABLE IF EXISTS tournament_matches;
+DROP TABLE IF EXISTS tournament_entrants;
+DROP TABLE IF EXISTS tournaments;
+DROP TABLE IF EXISTS battle_journal_applied;
+DROP TABLE IF EXISTS battle_archive_runs;
+DROP TABLE IF EXISTS battle_trend_weekly;
+DROP TABLE IF EXISTS battle_trend_daily;
+DROP TABLE IF EXISTS battle_daily_beyblade;
+DROP TABLE IF EXISTS battle_rollup_tournament;
+DROP TABLE IF EXISTS battle_rollup_beyblade;
+DROP TABLE IF EXISTS battle_rollup_user;
+DROP TABLE IF EXISTS battle_details;
+DROP TABLE IF EXISTS battles_archive;
+DROP TABLE IF EXISTS battles;
+DROP TABLE IF EXISTS beycollection;
+DROP TABLE IF EXISTS beyblades;
+DROP TABLE IF EXISTS parts;
+DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS user_info;
+
+-- Table for storing user informaiton
+CREATE TABLE users (
+    user_ID INTEGER PRIMARY KEY,
+    username VARCHAR(250) NOT NULL UNIQUE,
+    email VARCHAR(250) NOT NULL UNIQUE,
+    is_admin BOOLEAN NOT NULL,
+    -- Set by trg_update_date_joined
+    date_joined DATETIME
+);
+
+-- Table for storing compilation of beyblade parts
+CREATE TABLE parts (
+    part_ID VARCHAR(20) PRIMARY KEY,
+    part_type VARCHAR(20) NOT NULL CHECK (part_type IN ('Face Bolt',
+        'Energy Ring', 'Fusion Wheel', 'Spin Track', 'Performance Tip')),
+    weight DECIMAL(4,2) NOT NULL,
+    description TEXT
+);
+
+-- Table for storing parts and aspects that make up a single beyblade
+CREATE TABLE beyblades (
+    beyblade_ID VARCHAR(10) PRIMARY KEY,
+    name VARCHAR(250) NOT NULL,
+    type VARCHAR(10) NOT NULL CHECK (type IN ('Attack', 'Defense', 'Stamina',
+        'Balance')),
+    is_custom BOOLEAN NOT NULL,
+    series VARCHAR(20) NOT NULL CHECK (series IN ('Metal Fusion',
+        'Metal Masters', 'Metal Fury')),
+    face_bolt_ID VARCHAR(20) NOT NULL REFERENCES parts(part_ID),
+    energy_ring_ID VARCHAR(20) NOT NULL REFERENCES parts(part_ID),
+    fusion_wheel_ID VARCHAR(20) NOT NULL REFERENCES parts(part_ID),
+    spin_track_ID VARCHAR(20) NOT NULL REFERENCES parts(part_ID),
+    performance_tip_ID VARCHAR(20) NOT NULL REFERENCES parts(part_ID)
+);
+
+-- Table for linking users with their Beyblades
+CREATE TABLE beycollection (
+    user_beyblade_ID INTEGER PRIMARY KEY,
+    user_ID INT NOT NULL REFERENCES users(user_ID) ON DELETE CASCADE,
+    beyblade_ID VARCHAR(10) NOT NULL REFERENCES beyblades(beyblade_ID)
+        ON DELETE CASCADE,
+    bey_condition VARCHAR(100) NOT NULL
+);
+
+-- Table for storing battle results
+CREATE TABLE battles (
+    battle_ID INTEGER PRIMARY KEY,
+    tournament_name VARCHAR(250) NOT NULL,
+    battle_date DATETIME NOT NULL,
+    location VARCHAR(250) NOT NULL,
+    player1_ID INT NOT NULL REFERENCES users(user_ID) ON DELETE CASCADE,
+    player2_ID INT NOT NULL REFERENCES users(user_ID) ON DELETE CASCADE,
+    player1_beyblade_ID INT NOT NULL
+        REFERENCES beycollection(user_beyblade_ID),
+    player2_beyblade_ID INT NOT NULL
+        REFERENCES beycollection(user_beyblade_ID),
+    -- Can be NULL if battle was draw
+    winner_ID INT REFERENCES beycollection(user_beyblade_ID)
+);
+
+-- Archived battles and their rollups (see setup.sql). SQLite has no row
+-- compression, so battles_archive is a plain table here.
+CREATE TABLE battles_archive (
+    battle_ID INTEGER PRIMARY KEY,
+    tournament_name VARCHAR(250) NOT NULL,
+    battle_date DATETIME NOT NULL,
+    location VARCHAR(250) NOT NULL,
+    player1_ID INT NOT NULL,
+    player2_ID INT NOT NULL,
+    player1_beyblade_ID INT NOT NULL,
+    player2_beyblade_ID INT NOT NULL,
+    winner_ID INT
+);
+CREATE INDEX idx_battles_archive_date ON battles_archive(battle_date);
+
+-- Denormalized battles with usernames and Beyblade names (see setup.sql),
+-- maintained by the trg_*_details_* triggers at the end of this file. SQLite
+-- has no key length limit, so the lookup indexes cover the columns the
+-- battle views read.
+CREATE TABLE battle_details (
+    battle_ID INTEGER PRIMARY KEY,
+    tournament_name VARCHAR(250) NOT NULL,
+    battle_date DATETIME NOT NULL,
+    location VARCHAR(250) NOT NULL,
+    player1_ID INT NOT NULL,
+    player2_ID INT NOT NULL,
+    player1_username VARCHAR(250) NOT NULL,
+    player2_username VARCHAR(250) NOT NULL,
+    player1_beyblade_ID INT NOT NULL,
+    player2_beyblade_ID INT NOT NULL,
+    player1_beyblade_name VARCHAR(250) NOT NULL,
+    player2_beyblade_name VARCHAR(250) NOT NULL,
+    winner_ID INT
+);
+CREATE INDEX idx_battle_details_tournament ON battle_details(
+    tournament_name, battle_date, location, player1_username,
+    player2_username, player1_beyblade_name, player2_beyblade_name,
+    player1_beyblade_ID, player2_beyblade_ID, winner_ID);
+CREATE INDEX idx_battle_details_location ON battle_details(
+    location, battle_date, tournament_name, player1_username,
+    player2_username, player1_beyblade_name, player2_beyblade_name,
+    player1_beyblade_ID, player2_beyblade_ID, winner_ID);
+CREATE INDEX idx_battle_details_player1 ON battle_details(
+    player1_username, battle_date, tournament_name, location,
+    player2_username, player1_beyblade_name, player2_beyblade_name,
+    player1_beyblade_ID, player2_beyblade_ID, winner_ID);
+CREATE INDEX idx_battle_details_player2 ON battle_details(
+    player2_username, battle_date, tournament_name, location,
+    player1_username, player1_beyblade_name, player2_beyblade_name,
+    player1_beyblade_ID, player2_beyblade_ID, winner_ID);
+CREATE INDEX idx_battle_details_player1_id ON battle_details(player1_ID);
+CREATE INDEX idx_battle_details_player2_id ON battle_details(player2_ID);
+CREATE INDEX idx_battle_details_beyblade1
+    ON battle_details(player1_beyblade_ID);
+CREATE INDEX idx_battle_details_beyblade2
+    ON battle_details(player2_beyblade_ID);
+
+CREATE TABLE battle_rollup_user (
+    user_ID INTEGER PRIMARY KEY,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL
+);
+
+CREATE TABLE battle_rollup_beyblade (
+    user_beyblade_ID INTEGER PRIMARY KEY,
+    battles INT NOT NULL,
+    wins INT NOT NULL
+);
+
+CREATE TABLE battle_rollup_tournament (
+    tournament_name VARCHAR(250) PRIMARY KEY,
+    battles INT NOT NULL,
+    draws INT NOT NULL,
+    first_battle DATETIME NOT NULL,
+    last_battle DATETIME NOT NULL
+);
+
+-- Daily per-Beyblade rollup (see setup.sql), maintained by the
+-- trg_battles_rollup_* triggers at the end of this file
+CREATE TABLE battle_daily_beyblade (
+    battle_day DATE NOT NULL,
+    user_beyblade_ID INT NOT NULL,
+    tournament_name VARCHAR(250) NOT NULL,
+    location VARCHAR(250) NOT NULL,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL,
+    PRIMARY KEY (battle_day, user_beyblade_ID, tournament_name, location)
+);
+
+-- Daily and weekly trend rollups (see setup.sql), maintained by the
+-- trg_battles_rollup_* triggers at the end of this file
+CREATE TABLE battle_trend_daily (
+    dimension VARCHAR(10) NOT NULL CHECK (dimension IN ('beyblade', 'user',
+        'tournament', 'location')),
+    dim_key VARCHAR(250) NOT NULL,
+    bucket DATE NOT NULL,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL,
+    PRIMARY KEY (dimension, dim_key, bucket)
+);
+
+CREATE TABLE battle_trend_weekly (
+    dimension VARCHAR(10) NOT NULL CHECK (dimension IN ('beyblade', 'user',
+        'tournament', 'location')),
+    dim_key VARCHAR(250) NOT NULL,
+    bucket DATE NOT NULL,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL,
+    PRIMARY KEY (dimension, dim_key, bucket)
+);
+
+CREATE TABLE battle_archive_runs (
+    run_ID INTEGER PRIMARY KEY,
+    cutoff DATETIME NOT NULL,
+    battles_archived INT NOT NULL,
+    run_at DATETIME NOT NULL
+);
+
+-- Journal entries already recorded in battles (see setup.sql)
+CREATE TABLE battle_journal_applied (
+    entry_ID CHAR(32) PRIMARY KEY,
+    battle_ID INT NOT NULL,
+    applied_at DATETIME NOT NULL
+);
+
+-- Tournaments run with the bracket engine (see setup.sql and tournaments.py)
+CREATE TABLE tournaments (
+    tournament_ID INTEGER PRIMARY KEY,
+    tournament_name VARCHAR(250) NOT NULL UNIQUE,
+    location VARCHAR(250) NOT NULL,
+    format VARCHAR(20) NOT NULL CHECK (format IN ('single_elimination',
+        'double_elimination', 'swiss')),
+    swiss_rounds INT,
+    current_round INT NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'registration' CHECK (status IN
+        ('registration', 'running', 'finished')),
+    created_at DATETIME NOT NULL
+);
+
+CREATE TABLE tournament_entrants (
+    tournament_ID INT NOT NULL REFERENCES tournaments(tournament_ID)
+        ON DELETE CASCADE,
+    user_beyblade_ID INT NOT NULL REFERENCES beycollection(user_beyblade_ID),
+    user_ID INT NOT NULL,
+    seed INT NOT NULL,
+    wins INT NOT NULL DEFAULT 0,
+    losses INT NOT NULL DEFAULT 0,
+    draws INT NOT NULL DEFAULT 0,
+    byes INT NOT NULL DEFAULT 0,
+    points INT NOT NULL DEFAULT 0,
+    eliminated BOOLEAN NOT NULL DEFAULT 0,
+    PRIMARY KEY (tournament_ID, user_beyblade_ID),
+    UNIQUE (tournament_ID, user_ID)
+);
+CREATE INDEX idx_tournament_entrants_standings
+    ON tournament_entrants(tournament_ID, eliminated, points, wins);
+
+CREATE TABLE tournament_matches (
+    match_ID INTEGER PRIMARY KEY,
+    tournament_ID INT NOT NULL REFERENCES tournaments(tournament_ID)
+        ON DELETE CASCADE,
+    round INT NOT NULL,
+    match_number INT NOT NULL,
+    bracket VARCHAR(10) NOT NULL,
+    entrant1_ID INT NOT NULL,
+    entrant2_ID INT,
+    battle_ID INT,
+    winner_ID INT,
+    recorded BOOLEAN NOT NULL DEFAULT 0,
+    UNIQUE (tournament_ID, round, match_number)
+);
+
+-- Change log of battles, beycollection, beyblades, parts and users (see
+-- setup.sql and changelog.py). AUTOINCREMENT keeps change_IDs from being
+-- reused after the newest rows are pruned.
+CREATE TABLE change_log (
+    change_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name VARCHAR(20) NOT NULL,
+    operation VARCHAR(6) NOT NULL
+        CHECK (operation IN ('insert', 'update', 'delete')),
+    row_key VARCHAR(250) NOT NULL,
+    changed_at DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE change_log_checkpoints (
+    consumer VARCHAR(100) PRIMARY KEY,
+    change_ID BIGINT NOT NULL,
+    updated_at DATETIME NOT NULL
+);
+
+CREATE INDEX idx_beycollection_user_id ON beycollection(user_ID);
+CREATE INDEX idx_beycollection_beyblade_id ON beycollection(beyblade_ID);
+-- SQLite has no partitioning; date-bounded battle queries use this index
+CREATE INDEX idx_battles_battle_date ON battles(battle_date);
+
+-- Full-text index over part descriptions, the FTS5 counterpart of
+-- ft_parts_description in setup.sql, kept in sync by the triggers below. It
+-- keeps its own copy of the descriptions keyed by part_ID: parts has a text
+-- primary key, so its implicit rowid (which an external-content table would
+-- refer to) can be renumbered by VACUUM.
+CREATE VIRTUAL TABLE parts_fts USING fts5(part_ID UNINDEXED, description);
+
+CREATE TRIGGER trg_parts_fts_insert AFTER INSERT ON parts BEGIN
+    INSERT INTO parts_fts(part_ID, description)
+    VALUES (NEW.part_ID, NEW.description);
+END;
+
+CREATE TRIGGER trg_parts_fts_delete AFTER DELETE ON parts BEGIN
+    DELETE FROM parts_fts WHERE part_ID = OLD.part_ID;
+END;
+
+CREATE TRIGGER trg_parts_fts_update AFTER UPDATE ON parts BEGIN
+    DELETE FROM parts_fts WHERE part_ID = OLD.part_ID;
+    INSERT INTO parts_fts(part_ID, description)
+    VALUES (NEW.part_ID, NEW.description);
+END;
+
+-- Table holding salted password hashes (see setup-passwords.sql)
+CREATE TABLE user_info (
+    username VARCHAR(20) PRIMARY KEY,
+    salt CHAR(8) NOT NULL,
+    password_hash CHAR(64) NOT NULL,
+    is_admin BOOLEAN NOT NULL
+);
+
+-- Sets date_joined to the current time whenever a new user is inserted,
+-- like trg_update_date_joined in setup-routines.sql
+CREATE TRIGGER trg_update_date_joined
+AFTER INSERT ON users
+FOR EACH ROW
+BEGIN
+    UPDATE users SET date_joined = datetime('now', 'localtime')
+    WHERE user_ID = NEW.user_ID;
+END;
+
+-- Change log triggers, like the trg_*_log_* triggers of setup-routines.sql.
+-- An update changing a row's key is logged as a delete of the old key and an
+-- update of the new one. The update setting a new user's date_joined (above)
+-- is part of the insert, so updates of date_joined alone are not logged.
+CREATE TRIGGER trg_battles_log_insert AFTER INSERT ON battles BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'insert', NEW.battle_ID);
+END;
+
+CREATE TRIGGER trg_battles_log_update AFTER UPDATE ON battles BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    SELECT 'battles', 'delete', OLD.battle_ID WHERE OLD.battle_ID <> NEW.battle_ID;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'update', NEW.battle_ID);
+END;
+
+CREATE TRIGGER trg_battles_log_delete AFTER DELETE ON battles BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('battles', 'delete', OLD.battle_ID);
+END;
+
+CREATE TRIGGER trg_beycollection_log_insert AFTER INSERT ON beycollection BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beycollection', 'insert', NEW.user_beyblade_ID);
+END;
+
+CREATE TRIGGER trg_beycollection_log_update AFTER UPDATE ON beycollection BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    SELECT 'beycollection', 'delete', OLD.user_beyblade_ID WHERE OLD.user_beyblade_ID <> NEW.user_beyblade_ID;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beycollection', 'update', NEW.user_beyblade_ID);
+END;
+
+CREATE TRIGGER trg_beycollection_log_delete AFTER DELETE ON beycollection BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beycollection', 'delete', OLD.user_beyblade_ID);
+END;
+
+CREATE TRIGGER trg_beyblades_log_insert AFTER INSERT ON beyblades BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beyblades', 'insert', NEW.beyblade_ID);
+END;
+
+CREATE TRIGGER trg_beyblades_log_update AFTER UPDATE ON beyblades BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    SELECT 'beyblades', 'delete', OLD.beyblade_ID WHERE OLD.beyblade_ID <> NEW.beyblade_ID;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beyblades', 'update', NEW.beyblade_ID);
+END;
+
+CREATE TRIGGER trg_beyblades_log_delete AFTER DELETE ON beyblades BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('beyblades', 'delete', OLD.beyblade_ID);
+END;
+
+CREATE TRIGGER trg_parts_log_insert AFTER INSERT ON parts BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('parts', 'insert', NEW.part_ID);
+END;
+
+CREATE TRIGGER trg_parts_log_update AFTER UPDATE ON parts BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    SELECT 'parts', 'delete', OLD.part_ID WHERE OLD.part_ID <> NEW.part_ID;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('parts', 'update', NEW.part_ID);
+END;
+
+CREATE TRIGGER trg_parts_log_delete AFTER DELETE ON parts BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('parts', 'delete', OLD.part_ID);
+END;
+
+CREATE TRIGGER trg_users_log_insert AFTER INSERT ON users BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('users', 'insert', NEW.user_ID);
+END;
+
+CREATE TRIGGER trg_users_log_update AFTER UPDATE ON users
+WHEN OLD.user_ID <> NEW.user_ID OR OLD.username <> NEW.username
+    OR OLD.email <> NEW.email OR OLD.is_admin <> NEW.is_admin BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    SELECT 'users', 'delete', OLD.user_ID WHERE OLD.user_ID <> NEW.user_ID;
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('users', 'update', NEW.user_ID);
+END;
+
+CREATE TRIGGER trg_users_log_delete AFTER DELETE ON users BEGIN
+    INSERT INTO change_log (table_name, operation, row_key)
+    VALUES ('users', 'delete', OLD.user_ID);
+END;
+
+
+-- battle_details triggers, like the trg_*_details_* triggers of
+-- setup-routines.sql: battles are copied with their usernames and Beyblade
+-- names, and renaming a user or Beyblade updates the copies.
+CREATE TRIGGER trg_battles_details_insert AFTER INSERT ON battles BEGIN
+    INSERT INTO battle_details (battle_ID, tournament_name, battle_date,
+        location, player1_ID, player2_ID, player1_username, player2_username,
+        player1_beyblade_ID, player2_beyblade_ID, player1_beyblade_name,
+        player2_beyblade_name, winner_ID)
+    SELECT b.battle_ID, b.tournament_name, b.battle_date, b.location,
+        b.player1_ID, b.player2_ID, u1.username, u2.username,
+        b.player1_beyblade_ID, b.player2_beyblade_ID, bb1.name, bb2.name,
+        b.winner_ID
+    FROM battles b
+    JOIN users u1 ON b.player1_ID = u1.user_ID
+    JOIN users u2 ON b.player2_ID = u2.user_ID
+    JOIN beycollection ub1 ON b.player1_beyblade_ID = ub1.user_beyblade_ID
+    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
+    JOIN beycollection ub2 ON b.player2_beyblade_ID = ub2.user_beyblade_ID
+    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID
+    WHERE b.battle_ID = NEW.battle_ID;
+END;
+
+CREATE TRIGGER trg_battles_details_update AFTER UPDATE ON battles BEGIN
+    DELETE FROM battle_details WHERE battle_ID = OLD.battle_ID;
+    INSERT INTO battle_details (battle_ID, tournament_name, battle_date,
+        location, player1_ID, player2_ID, player1_username, player2_username,
+        player1_beyblade_ID, player2_beyblade_ID, player1_beyblade_name,
+        player2_beyblade_name, winner_ID)
+    SELECT b.battle_ID, b.tournament_name, b.battle_date, b.location,
+        b.player1_ID, b.player2_ID, u1.username, u2.username,
+        b.player1_beyblade_ID, b.player2_beyblade_ID, bb1.name, bb2.name,
+        b.winner_ID
+    FROM battles b
+    JOIN users u1 ON b.player1_ID = u1.user_ID
+    JOIN users u2 ON b.player2_ID = u2.user_ID
+    JOIN beycollection ub1 ON b.player1_beyblade_ID = ub1.user_beyblade_ID
+    JOIN beyblades bb1 ON ub1.beyblade_ID = bb1.beyblade_ID
+    JOIN beycollection ub2 ON b.player2_beyblade_ID = ub2.user_beyblade_ID
+    JOIN beyblades bb2 ON ub2.beyblade_ID = bb2.beyblade_ID
+    WHERE b.battle_ID = NEW.battle_ID;
+END;
+
+CREATE TRIGGER trg_battles_details_delete AFTER DELETE ON battles BEGIN
+    DELETE FROM battle_details WHERE battle_ID = OLD.battle_ID;
+END;
+
+CREATE TRIGGER trg_users_details_update AFTER UPDATE OF username ON users
+BEGIN
+    UPDATE battle_details SET player1_username = NEW.username
+    WHERE player1_ID = NEW.user_ID;
+    UPDATE battle_details SET player2_username = NEW.username
+    WHERE player2_ID = NEW.user_ID;
+END;
+
+CREATE TRIGGER trg_beyblades_details_update AFTER UPDATE OF name ON beyblades
+BEGIN
+    UPDATE battle_details SET player1_beyblade_name = NEW.name
+    WHERE player1_beyblade_ID IN (SELECT user_beyblade_ID FROM beycollection
+                                  WHERE beyblade_ID = NEW.beyblade_ID);
+    UPDATE battle_details SET player2_beyblade_name = NEW.name
+    WHERE player2_beyblade_ID IN (SELECT user_beyblade_ID FROM beycollection
+                                  WHERE beyblade_ID = NEW.beyblade_ID);
+END;
+
+CREATE TRIGGER trg_beycollection_details_update
+AFTER UPDATE OF beyblade_ID ON beycollection BEGIN
+    UPDATE battle_details SET player1_beyblade_name =
+        (SELECT name FROM beyblades WHERE beyblade_ID = NEW.beyblade_ID)
+    WHERE player1_beyblade_ID = NEW.user_beyblade_ID;
+    UPDATE battle_details SET player2_beyblade_name =
+        (SELECT name FROM beyblades WHERE beyblade_ID = NEW.beyblade_ID)
+    WHERE player2_beyblade_ID = NEW.user_beyblade_ID;
+END;
+
+
+-- SQLite has no stored procedures, so the trend rollup updates of
+-- sp_rollup_battle_trends (setup-routines.sql) run when a battle and a sign
+-- (1 to add it, -1 to remove it) are inserted into this view
+CREATE VIEW battle_trend_changes AS
+SELECT battle_date, tournament_name, location, player1_ID, player2_ID,
+    player1_beyblade_ID, player2_beyblade_ID, winner_ID, 1 AS sign
+FROM battles WHERE 0;
+
+CREATE TRIGGER trg_battle_trend_changes
+INSTEAD OF INSERT ON battle_trend_changes BEGIN
+    INSERT INTO battle_trend_daily (dimension, dim_key, bucket, battles, wins,
+        draws)
+    SELECT dimension, dim_key, date(NEW.battle_date), NEW.sign, NEW.sign * won,
+        NEW.sign * (NEW.winner_ID IS NULL)
+    FROM (
+        SELECT 'beyblade' AS dimension, NEW.player1_beyblade_ID AS dim_key,
+            COALESCE(NEW.winner_ID = NEW.player1_beyblade_ID, 0) AS won
+        UNION ALL
+        SELECT 'beyblade', NEW.player2_beyblade_ID,
+            COALESCE(NEW.winner_ID = NEW.player2_beyblade_ID, 0)
+        UNION ALL
+        SELECT 'user', NEW.player1_ID,
+            COALESCE(NEW.winner_ID = NEW.player1_beyblade_ID, 0)
+        UNION ALL
+        SELECT 'user', NEW.player2_ID,
+            COALESCE(NEW.winner_ID = NEW.player2_beyblade_ID, 0)
+        UNION ALL
+        SELECT 'tournament', NEW.tournament_name, NEW.winner_ID IS NOT NULL
+        UNION ALL
+        SELECT 'location', NEW.location, NEW.winner_ID IS NOT NULL
+    ) WHERE true
+    ON CONFLICT (dimension, dim_key, bucket)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    INSERT INTO battle_trend_weekly (dimension, dim_key, bucket, battles, wins,
+        draws)
+    SELECT dimension, dim_key,
+        date(NEW.battle_date, 'weekday 0', '-6 days'), NEW.sign,
+        NEW.sign * won, NEW.sign * (NEW.winner_ID IS NULL)
+    FROM (
+        SELECT 'beyblade' AS dimension, NEW.player1_beyblade_ID AS dim_key,
+            COALESCE(NEW.winner_ID = NEW.player1_beyblade_ID, 0) AS won
+        UNION ALL
+        SELECT 'beyblade', NEW.player2_beyblade_ID,
+            COALESCE(NEW.winner_ID = NEW.player2_beyblade_ID, 0)
+        UNION ALL
+        SELECT 'user', NEW.player1_ID,
+            COALESCE(NEW.winner_ID = NEW.player1_beyblade_ID, 0)
+        UNION ALL
+        SELECT 'user', NEW.player2_ID,
+            COALESCE(NEW.winner_ID = NEW.player2_beyblade_ID, 0)
+        UNION ALL
+        SELECT 'tournament', NEW.tournament_name, NEW.winner_ID IS NOT NULL
+        UNION ALL
+        SELECT 'location', NEW.location, NEW.winner_ID IS NOT NULL
+    ) WHERE true
+    ON CONFLICT (dimension, dim_key, bucket)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    DELETE FROM battle_trend_daily WHERE battles <= 0
+        AND bucket = date(NEW.battle_date);
+    DELETE FROM battle_trend_weekly WHERE battles <= 0
+        AND bucket = date(NEW.battle_date, 'weekday 0', '-6 days');
+END;
+
+
+-- Daily and trend rollup triggers, like the trg_battles_rollup_* triggers
+-- of setup-routines.sql. A battle deleted by sp_archive_battles is already in
+-- battles_archive and stays counted.
+CREATE TRIGGER trg_battles_rollup_insert AFTER INSERT ON battles BEGIN
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(NEW.battle_date), NEW.player1_beyblade_ID,
+        NEW.tournament_name, NEW.location, 1,
+        COALESCE(NEW.winner_ID = NEW.player1_beyblade_ID, 0),
+        (NEW.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(NEW.battle_date), NEW.player2_beyblade_ID,
+        NEW.tournament_name, NEW.location, 1,
+        COALESCE(NEW.winner_ID = NEW.player2_beyblade_ID, 0),
+        (NEW.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    INSERT INTO battle_trend_changes VALUES (NEW.battle_date,
+        NEW.tournament_name, NEW.location, NEW.player1_ID, NEW.player2_ID,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+END;
+
+CREATE TRIGGER trg_battles_rollup_update
+AFTER UPDATE OF battle_date, tournament_name, location, player1_ID,
+    player2_ID, player1_beyblade_ID, player2_beyblade_ID, winner_ID
+ON battles BEGIN
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(OLD.battle_date), OLD.player1_beyblade_ID,
+        OLD.tournament_name, OLD.location, -1,
+        -COALESCE(OLD.winner_ID = OLD.player1_beyblade_ID, 0),
+        -(OLD.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(OLD.battle_date), OLD.player2_beyblade_ID,
+        OLD.tournament_name, OLD.location, -1,
+        -COALESCE(OLD.winner_ID = OLD.player2_beyblade_ID, 0),
+        -(OLD.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    DELETE FROM battle_daily_beyblade WHERE battles <= 0
+        AND battle_day = date(OLD.battle_date)
+        AND user_beyblade_ID IN (OLD.player1_beyblade_ID,
+            OLD.player2_beyblade_ID)
+        AND tournament_name = OLD.tournament_name AND location = OLD.location;
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(NEW.battle_date), NEW.player1_beyblade_ID,
+        NEW.tournament_name, NEW.location, 1,
+        COALESCE(NEW.winner_ID = NEW.player1_beyblade_ID, 0),
+        (NEW.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(NEW.battle_date), NEW.player2_beyblade_ID,
+        NEW.tournament_name, NEW.location, 1,
+        COALESCE(NEW.winner_ID = NEW.player2_beyblade_ID, 0),
+        (NEW.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    INSERT INTO battle_trend_changes VALUES (OLD.battle_date,
+        OLD.tournament_name, OLD.location, OLD.player1_ID, OLD.player2_ID,
+        OLD.player1_beyblade_ID, OLD.player2_beyblade_ID, OLD.winner_ID, -1);
+    INSERT INTO battle_trend_changes VALUES (NEW.battle_date,
+        NEW.tournament_name, NEW.location, NEW.player1_ID, NEW.player2_ID,
+        NEW.player1_beyblade_ID, NEW.player2_beyblade_ID, NEW.winner_ID, 1);
+END;
+
+CREATE TRIGGER trg_battles_rollup_delete AFTER DELETE ON battles
+WHEN NOT EXISTS (SELECT 1 FROM battles_archive WHERE battle_ID = OLD.battle_ID)
+BEGIN
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(OLD.battle_date), OLD.player1_beyblade_ID,
+        OLD.tournament_name, OLD.location, -1,
+        -COALESCE(OLD.winner_ID = OLD.player1_beyblade_ID, 0),
+        -(OLD.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    INSERT INTO battle_daily_beyblade (battle_day, user_beyblade_ID,
+        tournament_name, location, battles, wins, draws)
+    VALUES (date(OLD.battle_date), OLD.player2_beyblade_ID,
+        OLD.tournament_name, OLD.location, -1,
+        -COALESCE(OLD.winner_ID = OLD.player2_beyblade_ID, 0),
+        -(OLD.winner_ID IS NULL))
+    ON CONFLICT (battle_day, user_beyblade_ID, tournament_name, location)
+    DO UPDATE SET battles = battles + excluded.battles,
+        wins = wins + excluded.wins, draws = draws + excluded.draws;
+    DELETE FROM battle_daily_beyblade WHERE battles <= 0
+        AND battle_day = date(OLD.battle_date)
+        AND user_beyblade_ID IN (OLD.player1_beyblade_ID,
+            OLD.player2_beyblade_ID)
+        AND tournament_name = OLD.tournament_name AND location = OLD.location;
+    INSERT INTO battle_trend_changes VALUES (OLD.battle_date,
+        OLD.tournament_name, OLD.location, OLD.player1_ID, OLD.player2_ID,
+        OLD.player1_beyblade_ID, OLD.player2_beyblade_ID, OLD.winner_ID, -1);
+END;
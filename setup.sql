@@ -1,4 +1,19 @@
 -- Remove existing tables to prevent errors on creation
+DROP TABLE IF EXISTS change_log_checkpoints;
+DROP TABLE IF EXISTS change_log;
+DROP TABLE IF EXISTS tournament_matches;
+DROP TABLE IF EXISTS tournament_entrants;
+DROP TABLE IF EXISTS tournaments;
+DROP TABLE IF EXISTS battle_journal_applied;
+DROP TABLE IF EXISTS battle_archive_runs;
+DROP TABLE IF EXISTS battle_trend_weekly;
+DROP TABLE IF EXISTS battle_trend_daily;
+DROP TABLE IF EXISTS battle_daily_beyblade;
+DROP TABLE IF EXISTS battle_rollup_tournament;
+DROP TABLE IF EXISTS battle_rollup_beyblade;
+DROP TABLE IF EXISTS battle_rollup_user;
+DROP TABLE IF EXISTS battle_details;
+DROP TABLE IF EXISTS battles_archive;
 DROP TABLE IF EXISTS battles;
 DROP TABLE IF EXISTS beycollection;
 DROP TABLE IF EXISTS beyblades;
@@ -105,5 +120,237 @@ CREATE TABLE battles (
     FOREIGN KEY (winner_ID) REFERENCES beycollection(user_beyblade_ID)
 );
 
+-- Cold storage for battles moved out of the battles table by
+-- sp_archive_battles (see setup-routines.sql). Rows are stored compressed and
+-- without foreign keys, since they are history that is rarely read.
+CREATE TABLE battles_archive (
+    battle_ID INT PRIMARY KEY,
+    tournament_name VARCHAR(250) NOT NULL,
+    battle_date DATETIME NOT NULL,
+    location VARCHAR(250) NOT NULL,
+    player1_ID INT NOT NULL,
+    player2_ID INT NOT NULL,
+    player1_beyblade_ID INT NOT NULL,
+    player2_beyblade_ID INT NOT NULL,
+    winner_ID INT,
+    INDEX idx_battles_archive_date (battle_date)
+) ROW_FORMAT=COMPRESSED;
+
+-- Denormalized copy of battles with the players' usernames and Beyblade
+-- names, so the battle result views by tournament, location and player read
+-- one index range of one table instead of joining users, beycollection and
+-- beyblades twice per row. It is maintained by the trg_*_details_* triggers
+-- of setup-routines.sql and holds the same rows as battles (archived battles
+-- leave it with them). Covering indexes (holding every column a view reads)
+-- are deliberately not built: the six VARCHAR(250) columns alone take 6000
+-- bytes in utf8mb4, beyond InnoDB's 3072-byte key limit. So each lookup is
+-- an index range on one of the (..., battle_date) indexes followed by a
+-- primary key read per row of the same table.
+CREATE TABLE battle_details (
+    battle_ID INT PRIMARY KEY,
+    tournament_name VARCHAR(250) NOT NULL,
+    battle_date DATETIME NOT NULL,
+    location VARCHAR(250) NOT NULL,
+    player1_ID INT NOT NULL,
+    player2_ID INT NOT NULL,
+    player1_username VARCHAR(250) NOT NULL,
+    player2_username VARCHAR(250) NOT NULL,
+    player1_beyblade_ID INT NOT NULL,
+    player2_beyblade_ID INT NOT NULL,
+    player1_beyblade_name VARCHAR(250) NOT NULL,
+    player2_beyblade_name VARCHAR(250) NOT NULL,
+    winner_ID INT,
+    INDEX idx_battle_details_tournament (tournament_name, battle_date),
+    INDEX idx_battle_details_location (location, battle_date),
+    INDEX idx_battle_details_player1 (player1_username, battle_date),
+    INDEX idx_battle_details_player2 (player2_username, battle_date),
+    -- For propagating changes of users and Beyblades
+    INDEX idx_battle_details_player1_id (player1_ID),
+    INDEX idx_battle_details_player2_id (player2_ID),
+    INDEX idx_battle_details_beyblade1 (player1_beyblade_ID),
+    INDEX idx_battle_details_beyblade2 (player2_beyblade_ID)
+);
+
+-- Summary rollups of the archived battles, so the leaderboard and battle
+-- statistics stay exact without reading battles_archive. Each is updated
+-- by sp_archive_battles in the same transaction that archives the battles.
+
+-- Battles, wins and draws per user over the archived battles
+CREATE TABLE battle_rollup_user (
+    user_ID INT PRIMARY KEY,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL
+);
+
+-- Battles and wins per collection Beyblade (Beyblade-Player ID) over the
+-- archived battles
+CREATE TABLE battle_rollup_beyblade (
+    user_beyblade_ID INT PRIMARY KEY,
+    battles INT NOT NULL,
+    wins INT NOT NULL
+);
+
+-- Battles, draws and date span per tournament over the archived battles
+CREATE TABLE battle_rollup_tournament (
+    tournament_name VARCHAR(250) PRIMARY KEY,
+    battles INT NOT NULL,
+    draws INT NOT NULL,
+    first_battle DATETIME NOT NULL,
+    last_battle DATETIME NOT NULL
+);
+
+-- Battles, wins and draws per collection Beyblade per day, split by
+-- tournament and location, over all battles (archived ones included). Kept
+-- up to date by the trg_battles_rollup_* triggers of setup-routines.sql, so
+-- filtered and windowed leaderboards (see rollups.py) read a few rows per
+-- day instead of scanning the battles.
+CREATE TABLE battle_daily_beyblade (
+    battle_day DATE NOT NULL,
+    user_beyblade_ID INT NOT NULL,
+    tournament_name VARCHAR(250) NOT NULL,
+    location VARCHAR(250) NOT NULL,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL,
+    PRIMARY KEY (battle_day, user_beyblade_ID, tournament_name, location)
+);
+
+-- Battles, wins and draws per day (battle_trend_daily) and per week
+-- starting on Monday (battle_trend_weekly) for each Beyblade
+-- (Beyblade-Player ID), user (user ID), tournament and location, over all
+-- battles (archived ones included). For tournaments and locations, wins
+-- counts the battles that had a winner. Kept up to date by the
+-- trg_battles_rollup_* triggers of setup-routines.sql and rebuilt with
+-- `python rollups.py backfill`; `python rollups.py trend` charts them.
+CREATE TABLE battle_trend_daily (
+    dimension ENUM('beyblade', 'user', 'tournament', 'location') NOT NULL,
+    dim_key VARCHAR(250) NOT NULL,
+    bucket DATE NOT NULL,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL,
+    PRIMARY KEY (dimension, dim_key, bucket)
+);
+
+CREATE TABLE battle_trend_weekly (
+    dimension ENUM('beyblade', 'user', 'tournament', 'location') NOT NULL,
+    dim_key VARCHAR(250) NOT NULL,
+    bucket DATE NOT NULL,
+    battles INT NOT NULL,
+    wins INT NOT NULL,
+    draws INT NOT NULL,
+    PRIMARY KEY (dimension, dim_key, bucket)
+);
+
+-- One row per archival run; MAX(cutoff) is the date before which battles
+-- may be in battles_archive
+CREATE TABLE battle_archive_runs (
+    run_ID INT AUTO_INCREMENT PRIMARY KEY,
+    cutoff DATETIME NOT NULL,
+    battles_archived INT NOT NULL,
+    run_at DATETIME NOT NULL
+);
+
+-- Entries of the battle journal (see journal.py) already recorded in
+-- battles, keyed by the client-generated entry ID, so that replaying the
+-- journal after a crash never records a battle twice
+CREATE TABLE battle_journal_applied (
+    entry_ID CHAR(32) PRIMARY KEY,
+    -- The battle recorded for the entry
+    battle_ID INT NOT NULL,
+    applied_at DATETIME NOT NULL
+);
+
+-- Tournaments run with the bracket engine (see tournaments.py)
+CREATE TABLE tournaments (
+    tournament_ID INT AUTO_INCREMENT PRIMARY KEY,
+    -- Stored as battles.tournament_name on the battles of the tournament
+    tournament_name VARCHAR(250) NOT NULL UNIQUE,
+    location VARCHAR(250) NOT NULL,
+    format ENUM('single_elimination', 'double_elimination', 'swiss')
+        NOT NULL,
+    -- Number of rounds of a Swiss tournament, NULL for elimination
+    swiss_rounds INT,
+    -- The round being played (0 while registering entrants)
+    current_round INT NOT NULL DEFAULT 0,
+    status ENUM('registration', 'running', 'finished') NOT NULL
+        DEFAULT 'registration',
+    created_at DATETIME NOT NULL
+);
+
+-- Beyblades (beycollection entries) registered for a tournament, with their
+-- standings. The standings are updated with every recorded round, so they
+-- never need to be recomputed from battles.
+CREATE TABLE tournament_entrants (
+    tournament_ID INT NOT NULL,
+    user_beyblade_ID INT NOT NULL,
+    -- Owner of the Beyblade; each user enters a tournament once
+    user_ID INT NOT NULL,
+    -- Registration order, used for seeding and as the last tie-break
+    seed INT NOT NULL,
+    wins INT NOT NULL DEFAULT 0,
+    losses INT NOT NULL DEFAULT 0,
+    draws INT NOT NULL DEFAULT 0,
+    byes INT NOT NULL DEFAULT 0,
+    points INT NOT NULL DEFAULT 0,
+    eliminated BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (tournament_ID, user_beyblade_ID),
+    UNIQUE (tournament_ID, user_ID),
+    INDEX idx_tournament_entrants_standings (tournament_ID, eliminated,
+        points, wins),
+    FOREIGN KEY (tournament_ID) REFERENCES tournaments(tournament_ID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (user_beyblade_ID) REFERENCES beycollection(user_beyblade_ID)
+);
+
+-- Pairings of each round. entrant2_ID is NULL for a bye. battle_ID links
+-- the recorded battle (no foreign key, since battles may be partitioned or
+-- archived).
+CREATE TABLE tournament_matches (
+    match_ID INT AUTO_INCREMENT PRIMARY KEY,
+    tournament_ID INT NOT NULL,
+    round INT NOT NULL,
+    -- Position of the match in the round; elimination brackets pair the
+    -- winners of neighbouring matches in the next round
+    match_number INT NOT NULL,
+    -- 'main', or 'winners'/'losers'/'final' for double elimination
+    bracket VARCHAR(10) NOT NULL,
+    entrant1_ID INT NOT NULL,
+    entrant2_ID INT,
+    battle_ID INT,
+    -- NULL for a draw (or while the match is unplayed)
+    winner_ID INT,
+    recorded BOOLEAN NOT NULL DEFAULT FALSE,
+    UNIQUE (tournament_ID, round, match_number),
+    FOREIGN KEY (tournament_ID) REFERENCES tournaments(tournament_ID)
+        ON DELETE CASCADE
+);
+
+-- Append-only log of the rows written in battles, beycollection, beyblades,
+-- parts and users, filled by the trg_*_log_* triggers of setup-routines.sql.
+-- change_ID only increases, so consumers (see changelog.py) read what changed
+-- since the last change_ID they processed instead of rescanning the tables.
+CREATE TABLE change_log (
+    change_ID BIGINT AUTO_INCREMENT PRIMARY KEY,
+    -- The table written and the kind of write
+    table_name VARCHAR(20) NOT NULL,
+    operation ENUM('insert', 'update', 'delete') NOT NULL,
+    -- Primary key of the changed row (battle_ID, part_ID, ...) as text
+    row_key VARCHAR(250) NOT NULL,
+    changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Last change_ID processed by each named change log consumer
+CREATE TABLE change_log_checkpoints (
+    consumer VARCHAR(100) PRIMARY KEY,
+    change_ID BIGINT NOT NULL,
+    updated_at DATETIME NOT NULL
+);
+
 CREATE INDEX idx_beycollection_user_id ON beycollection(user_ID);
 CREATE INDEX idx_beycollection_beyblade_id ON beycollection(beyblade_ID);
+
+-- Full-text index for searching part descriptions by relevance (e.g. "parts
+-- good for stamina") without a LIKE '%...%' scan of the whole table
+CREATE FULLTEXT INDEX ft_parts_description ON parts(description);
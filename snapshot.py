@@ -0,0 +1,625 @@
+"""
+This module exports the Beyblade database ('beybladedb') into a compact columnar
+snapshot on disk and answers the heavy analytics commands (leaderboard and
+battle filters) from that snapshot, so they no longer compete with Bladers'
+interactive reads on the MySQL server.
+
+Every column of every exported table is written as its own NumPy .npy file
+which is memory-mapped when the snapshot is opened. Numeric columns are stored
+as fixed-width arrays, DATETIME columns as datetime64[s], and string columns
+are dictionary-encoded: an int32 code array plus a JSON list of the distinct
+values. A manifest.json file records the row counts and the export time.
+
+Offline analytics mode (no MySQL connection is made):
+
+    $ python snapshot.py SNAPSHOT_DIR leaderboard
+    $ python snapshot.py SNAPSHOT_DIR tournaments
+    $ python snapshot.py SNAPSHOT_DIR locations
+    $ python snapshot.py SNAPSHOT_DIR tournament 'WBBA Prelim'
+    $ python snapshot.py SNAPSHOT_DIR location NYC
+    $ python snapshot.py SNAPSHOT_DIR user gokus
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import numpy as np
+from tabulate import tabulate
+
+import backends
+
+# For output coloring
+import colorama
+from colorama import Fore
+
+colorama.init(autoreset=True)
+
+# Version of the on-disk layout, bumped whenever the file format changes
+SNAPSHOT_FORMAT = 1
+
+# Number of rows pulled from the cursor per fetchmany() call during export
+FETCH_BATCH = 10000
+
+# Sentinel stored in integer columns for SQL NULL (e.g. winner_ID of a draw)
+NULL_ID = -1
+
+# Columns exported for each table, as (column name, storage kind) pairs.
+# Kinds: 'int' -> int32, 'float' -> float64, 'bool' -> bool,
+# 'datetime' -> datetime64[s], 'str' -> dictionary-encoded int32 codes.
+SNAPSHOT_TABLES = {
+    'users': [
+        ('user_ID', 'int'),
+        ('username', 'str'),
+    ],
+    'parts': [
+        ('part_ID', 'str'),
+        ('part_type', 'str'),
+        ('weight', 'float'),
+        ('description', 'str'),
+    ],
+    'beyblades': [
+        ('beyblade_ID', 'str'),
+        ('name', 'str'),
+        ('type', 'str'),
+        ('is_custom', 'bool'),
+        ('series', 'str'),
+        ('face_bolt_ID', 'str'),
+        ('energy_ring_ID', 'str'),
+        ('fusion_wheel_ID', 'str'),
+        ('spin_track_ID', 'str'),
+        ('performance_tip_ID', 'str'),
+    ],
+    'beycollection': [
+        ('user_beyblade_ID', 'int'),
+        ('user_ID', 'int'),
+        ('beyblade_ID', 'str'),
+        ('bey_condition', 'str'),
+    ],
+    'battles': [
+        ('battle_ID', 'int'),
+        ('tournament_name', 'str'),
+        ('battle_date', 'datetime'),
+        ('location', 'str'),
+        ('player1_ID', 'int'),
+        ('player2_ID', 'int'),
+        ('player1_beyblade_ID', 'int'),
+        ('player2_beyblade_ID', 'int'),
+        ('winner_ID', 'int'),
+    ],
+}
+
+# Tables whose older rows are moved to an archive table by archive.py; the
+# snapshot exports both, so it always covers the full history
+ARCHIVE_TABLES = {'battles': 'battles_archive'}
+
+# ----------------------------------------------------------------------
+# Exporting a Snapshot
+# ----------------------------------------------------------------------
+
+
+def _column_path(directory, table, column, suffix='.npy'):
+    """
+    Returns the path of the file holding one column of one table.
+    """
+    return os.path.join(directory, f"{table}.{column}{suffix}")
+
+
+def _fetch_columns(conn, table, columns):
+    """
+    Streams a table out of the database in batches and returns one Python
+    list of values per column.
+
+    Arguments:
+        conn - An open database connection.
+        table (str) - The name of the table to export.
+        columns (list) - The (column name, kind) pairs to export.
+
+    Return value: A list of value lists, in the order of `columns`.
+    """
+    cursor = conn.cursor()
+    names = ", ".join(name for name, _ in columns)
+    if table in ARCHIVE_TABLES:
+        cursor.execute(f"SELECT {names} FROM {table} UNION ALL "
+                       f"SELECT {names} FROM {ARCHIVE_TABLES[table]};")
+    else:
+        cursor.execute(f"SELECT {names} FROM {table};")
+    values = [[] for _ in columns]
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            for row in rows:
+                for i, value in enumerate(row):
+                    values[i].append(value)
+    finally:
+        cursor.close()
+    return values
+
+
+def _encode_column(values, kind):
+    """
+    Converts a list of column values into a NumPy array, dictionary-encoding
+    strings.
+
+    Arguments:
+        values (list) - The raw column values returned by the connector.
+        kind (str) - The storage kind of the column (see SNAPSHOT_TABLES).
+
+    Return value: A (array, dictionary) tuple, where dictionary is the list of
+                  distinct strings for 'str' columns and None otherwise.
+    """
+    if kind == 'int':
+        return np.array([NULL_ID if v is None else int(v) for v in values],
+                        dtype=np.int32), None
+    if kind == 'float':
+        return np.array([np.nan if v is None else float(v) for v in values],
+                        dtype=np.float64), None
+    if kind == 'bool':
+        return np.array([bool(v) for v in values], dtype=np.bool_), None
+    if kind == 'datetime':
+        return np.array([np.datetime64('NaT') if v is None else
+                         np.datetime64(v, 's') for v in values],
+                        dtype='datetime64[s]'), None
+    # Dictionary encoding: each distinct string gets the next code in order
+    # of first appearance, and the column stores only the codes.
+    dictionary = {}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        codes[i] = dictionary.setdefault(value, len(dictionary))
+    return codes, list(dictionary)
+
+
+def _write_array(path, array):
+    """
+    Writes an array to an .npy file through a memory map, so the file can be
+    memory-mapped back with the same layout.
+    """
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype,
+                                    shape=array.shape)
+    out[:] = array
+    out.flush()
+    del out
+
+
+def _begin_snapshot(conn):
+    """
+    Starts a new transaction on the connection whose reads all see the
+    database as of the same moment.
+    """
+    conn.rollback()
+    cursor = conn.cursor()
+    try:
+        if backends.dialect(conn) == 'mysql':
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT;")
+        else:
+            cursor.execute("BEGIN;")
+    finally:
+        cursor.close()
+
+
+def export_snapshot(conn, directory):
+    """
+    Writes the users, parts, beyblades, beycollection and battles tables
+    into a columnar snapshot directory, replacing any previous snapshot
+    stored there.
+
+    The tables are read in one transaction, so they are consistent with
+    each other (e.g. every battle's Beyblades are in beycollection). The
+    snapshot is written into a new sibling directory which then replaces
+    the old one, so a failed export leaves the previous snapshot as it was,
+    and readers that have the old files memory-mapped keep reading them.
+
+    Arguments:
+        conn - An open database connection.
+        directory (str) - The directory to write the snapshot to.
+
+    Return value: A dictionary mapping each table name to its row count.
+    """
+    directory = os.path.abspath(directory)
+    parent, name = os.path.split(directory)
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f".{name}.new-{os.getpid()}")
+    old = os.path.join(parent, f".{name}.old-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.mkdir(staging)
+    try:
+        _begin_snapshot(conn)
+        try:
+            counts = _export_tables(conn, staging)
+        finally:
+            conn.rollback()
+        # Moving the old snapshot aside and the new one in are two renames;
+        # the old files are only unlinked, which mapped readers survive
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        os.replace(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    shutil.rmtree(old, ignore_errors=True)
+    return counts
+
+
+def _export_tables(conn, directory):
+    """
+    Writes every table of SNAPSHOT_TABLES and the manifest into an empty
+    directory, and returns the row count of each table.
+    """
+    counts = {}
+    for table, columns in SNAPSHOT_TABLES.items():
+        values = _fetch_columns(conn, table, columns)
+        for (column, kind), column_values in zip(columns, values):
+            array, dictionary = _encode_column(column_values, kind)
+            _write_array(_column_path(directory, table, column), array)
+            if dictionary is not None:
+                with open(_column_path(directory, table, column, '.dict.json'),
+                          'w', encoding='utf-8') as f:
+                    json.dump(dictionary, f)
+        counts[table] = len(values[0]) if values else 0
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'exported_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': {table: {'rows': counts[table],
+                           'columns': dict(columns)}
+                   for table, columns in SNAPSHOT_TABLES.items()},
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w',
+              encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return counts
+
+# ----------------------------------------------------------------------
+# Reading a Snapshot
+# ----------------------------------------------------------------------
+
+
+class DictColumn:
+    """
+    A dictionary-encoded string column: an array of int32 codes plus the
+    list of distinct values the codes index into.
+    """
+
+    def __init__(self, codes, dictionary):
+        self.codes = codes
+        self.dictionary = dictionary
+        self._index = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def code_for(self, value):
+        """
+        Returns the code for a string value, or None if the value never
+        appears in the column.
+        """
+        if self._index is None:
+            self._index = {v: i for i, v in enumerate(self.dictionary)}
+        return self._index.get(value)
+
+    def mask_equal(self, value):
+        """
+        Returns a boolean mask of the rows equal to the given string. The
+        comparison is done on the integer codes, not on strings.
+        """
+        code = self.code_for(value)
+        if code is None:
+            return np.zeros(len(self.codes), dtype=np.bool_)
+        return self.codes == code
+
+    def decode(self, rows=None):
+        """
+        Returns the string values of the column (or of the selected rows).
+        """
+        codes = self.codes if rows is None else self.codes[rows]
+        return [self.dictionary[c] for c in codes]
+
+
+class Snapshot:
+    """
+    A read-only, memory-mapped columnar snapshot of the Beyblade database.
+    Columns are accessed as snapshot.tables[table][column] and are only read
+    from disk as the pages are touched.
+    """
+
+    def __init__(self, directory):
+        manifest_path = os.path.join(directory, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(
+                f"No analytics snapshot found in '{directory}'.")
+        with open(manifest_path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(
+                f"Unsupported snapshot format: {self.manifest.get('format')}")
+
+        self.directory = directory
+        self._bb_row_for_code = None
+        self.tables = {}
+        for table, info in self.manifest['tables'].items():
+            columns = {}
+            for column, kind in info['columns'].items():
+                array = np.load(_column_path(directory, table, column),
+                                mmap_mode='r')
+                if kind == 'str':
+                    with open(_column_path(directory, table, column,
+                                           '.dict.json'),
+                              encoding='utf-8') as f:
+                        array = DictColumn(array, json.load(f))
+                columns[column] = array
+            self.tables[table] = columns
+
+    @property
+    def exported_at(self):
+        return self.manifest['exported_at']
+
+    # ------------------------------------------------------------------
+    # Join helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _positions(keys, lookup):
+        """
+        Returns, for each value in `lookup`, the row position of the equal
+        value in the integer key column `keys` (or -1 if missing). This is
+        the columnar equivalent of an equi-join on a primary key.
+        """
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = np.asarray(keys)[order]
+        idx = np.searchsorted(sorted_keys, lookup)
+        idx = np.clip(idx, 0, max(len(sorted_keys) - 1, 0))
+        if len(sorted_keys) == 0:
+            return np.full(len(lookup), -1, dtype=np.int64)
+        found = sorted_keys[idx] == lookup
+        return np.where(found, order[idx], -1)
+
+    def _lookup_strings(self, table, key_column, value_column, lookup):
+        """
+        Maps integer foreign keys to a string column of another table
+        (e.g. user IDs to usernames). Missing keys map to None.
+        """
+        columns = self.tables[table]
+        pos = self._positions(columns[key_column], lookup)
+        values = columns[value_column]
+        return [values.dictionary[values.codes[p]] if p >= 0 else None
+                for p in pos]
+
+    def _collection_beyblade_codes(self, user_beyblade_ids):
+        """
+        Maps Beyblade-Player IDs (beycollection.user_beyblade_ID) to the
+        codes of beyblades.beyblade_ID, or -1 when unknown.
+        """
+        collection = self.tables['beycollection']
+        beyblades = self.tables['beyblades']
+        pos = self._positions(collection['user_beyblade_ID'],
+                              user_beyblade_ids)
+        # Translate codes from the beycollection dictionary to the row of
+        # the matching beyblade in the beyblades table.
+        coll_ids = collection['beyblade_ID']
+        if self._bb_row_for_code is None:
+            bb_row = {v: i for i, v in
+                      enumerate(beyblades['beyblade_ID'].decode())}
+            self._bb_row_for_code = np.array(
+                [bb_row.get(v, -1) for v in coll_ids.dictionary],
+                dtype=np.int64)
+        bb_row_for_code = self._bb_row_for_code
+        rows = np.full(len(pos), -1, dtype=np.int64)
+        valid = pos >= 0
+        if len(bb_row_for_code):
+            rows[valid] = bb_row_for_code[coll_ids.codes[pos[valid]]]
+        return rows
+
+    # ------------------------------------------------------------------
+    # Analytics
+    # ------------------------------------------------------------------
+
+    def leaderboard(self):
+        """
+        Returns the Beyblade leaderboard as (beyblade_ID, name, type, wins)
+        rows, ordered by wins descending and then by name, matching
+        beyblade_leaderboard() in the CLIs.
+        """
+        battles = self.tables['battles']
+        beyblades = self.tables['beyblades']
+        winners = np.asarray(battles['winner_ID'])
+        winners = winners[winners != NULL_ID]
+        rows = self._collection_beyblade_codes(winners)
+        rows = rows[rows >= 0]
+        wins = np.bincount(rows, minlength=len(beyblades['beyblade_ID']))
+
+        ids = beyblades['beyblade_ID'].decode()
+        names = beyblades['name'].decode()
+        types = beyblades['type'].decode()
+        board = [(ids[i], names[i], types[i], int(wins[i]))
+                 for i in np.flatnonzero(wins)]
+        board.sort(key=lambda row: (-row[3], row[1]))
+        return board
+
+    def distinct(self, column):
+        """
+        Returns the sorted distinct values of a string column of battles
+        (tournament_name or location).
+        """
+        values = self.tables['battles'][column]
+        used = np.unique(np.asarray(values.codes))
+        return sorted(values.dictionary[c] for c in used)
+
+    def battle_rows(self, mask, columns):
+        """
+        Builds battle result rows for the battles selected by `mask`, in the
+        same shape as the battle-result queries in the CLIs.
+
+        Arguments:
+            mask (ndarray) - Boolean mask over the battles table.
+            columns (list) - Output columns, any of 'battle_ID',
+                'tournament_name', 'battle_date', 'location', 'player1',
+                'player2', 'player1_beyblade', 'player2_beyblade',
+                'player1_beyblade_ID', 'player2_beyblade_ID', 'winner_ID'.
+
+        Return value: A list of row tuples ordered by battle_ID.
+        """
+        battles = self.tables['battles']
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(np.asarray(battles['battle_ID'])[rows],
+                               kind='stable')]
+        names = self.tables['beyblades']['name']
+
+        def beyblade_names(column):
+            bb_rows = self._collection_beyblade_codes(
+                np.asarray(battles[column])[rows])
+            return [names.dictionary[names.codes[r]] if r >= 0 else None
+                    for r in bb_rows]
+
+        def ints(column):
+            return [None if v == NULL_ID else int(v)
+                    for v in np.asarray(battles[column])[rows]]
+
+        producers = {
+            'battle_ID': lambda: ints('battle_ID'),
+            'tournament_name': lambda: battles['tournament_name'].decode(rows),
+            'battle_date': lambda: [
+                v.astype(datetime) for v in
+                np.asarray(battles['battle_date'])[rows]],
+            'location': lambda: battles['location'].decode(rows),
+            'player1': lambda: self._lookup_strings(
+                'users', 'user_ID', 'username',
+                np.asarray(battles['player1_ID'])[rows]),
+            'player2': lambda: self._lookup_strings(
+                'users', 'user_ID', 'username',
+                np.asarray(battles['player2_ID'])[rows]),
+            'player1_beyblade': lambda: beyblade_names('player1_beyblade_ID'),
+            'player2_beyblade': lambda: beyblade_names('player2_beyblade_ID'),
+            'player1_beyblade_ID': lambda: ints('player1_beyblade_ID'),
+            'player2_beyblade_ID': lambda: ints('player2_beyblade_ID'),
+            'winner_ID': lambda: ints('winner_ID'),
+        }
+        return list(zip(*(producers[c]() for c in columns)))
+
+    def battles_for_tournament(self, tournament_name):
+        """
+        Returns the battle results of a tournament, like
+        view_battle_results_for_tournament().
+        """
+        mask = self.tables['battles']['tournament_name'].mask_equal(
+            tournament_name)
+        return self.battle_rows(mask, TOURNAMENT_COLUMNS)
+
+    def battles_for_location(self, location):
+        """
+        Returns the battle results at a location, like
+        view_battle_results_for_location().
+        """
+        mask = self.tables['battles']['location'].mask_equal(location)
+        return self.battle_rows(mask, LOCATION_COLUMNS)
+
+    def battles_for_user(self, username):
+        """
+        Returns the battle results a user took part in, like
+        view_all_battle_results_for_user().
+        """
+        users = self.tables['users']
+        battles = self.tables['battles']
+        user_rows = np.flatnonzero(users['username'].mask_equal(username))
+        user_ids = np.asarray(users['user_ID'])[user_rows]
+        mask = (np.isin(battles['player1_ID'], user_ids) |
+                np.isin(battles['player2_ID'], user_ids))
+        return self.battle_rows(mask, USER_COLUMNS)
+
+
+# Output columns and headers of the battle filters, matching the CLIs
+TOURNAMENT_COLUMNS = ['battle_ID', 'battle_date', 'location', 'player1',
+                      'player2', 'player1_beyblade', 'player2_beyblade',
+                      'player1_beyblade_ID', 'player2_beyblade_ID',
+                      'winner_ID']
+TOURNAMENT_HEADERS = ["Battle ID", "Date", "Location",
+                      "Player 1 Username", "Player 2 Username",
+                      "Player 1 Beyblade Name", "Player 2 Beyblade Name",
+                      "Player 1 Beyblade ID", "Player 2 BeyBlade ID",
+                      "Winner ID"]
+LOCATION_COLUMNS = ['battle_ID', 'tournament_name', 'battle_date', 'player1',
+                    'player2', 'player1_beyblade', 'player2_beyblade',
+                    'player1_beyblade_ID', 'player2_beyblade_ID', 'winner_ID']
+LOCATION_HEADERS = ["Battle ID", "Tournament Name", "Date",
+                    "Player 1 Username", "Player 2 Username",
+                    "Player 1 Beyblade Name", "Player 2 Beyblade Name",
+                    "Player 1 Beyblade ID", "Player 2 BeyBlade ID",
+                    "Winner ID"]
+USER_COLUMNS = ['battle_ID', 'tournament_name', 'battle_date', 'location',
+                'player1', 'player2', 'player1_beyblade', 'player2_beyblade',
+                'player1_beyblade_ID', 'player2_beyblade_ID', 'winner_ID']
+USER_HEADERS = ["Battle ID", "Tournament Name", "Date", "Location",
+                "Player 1 Username", "Player 2 Username",
+                "Player 1 Beyblade Name", "Player 2 Beyblade Name",
+                "Player 1 Beyblade ID", "Player 2 BeyBlade ID", "Winner ID"]
+LEADERBOARD_HEADERS = ['Beyblade ID', 'Name', 'Type', 'Wins']
+
+# ----------------------------------------------------------------------
+# Offline Analytics Mode
+# ----------------------------------------------------------------------
+
+
+def print_rows(rows, headers, empty_message):
+    """
+    Prints rows as a grid table, or a red message if there are none.
+    """
+    if rows:
+        print(tabulate(rows, headers=headers, tablefmt="grid"))
+    else:
+        print(Fore.RED + empty_message)
+
+
+def main(argv=None):
+    """
+    Runs one analytics command against a snapshot directory without
+    connecting to MySQL.
+    """
+    parser = argparse.ArgumentParser(
+        description='Offline Beyblade analytics over a columnar snapshot.')
+    parser.add_argument('snapshot_dir', help='directory of the snapshot')
+    parser.add_argument('command', choices=['leaderboard', 'tournaments',
+                                            'locations', 'tournament',
+                                            'location', 'user'])
+    parser.add_argument('value', nargs='?',
+                        help='tournament name, location or username')
+    args = parser.parse_args(argv)
+
+    if args.command in ('tournament', 'location', 'user') and not args.value:
+        parser.error(f"'{args.command}' needs a value to filter on")
+
+    try:
+        snap = Snapshot(args.snapshot_dir)
+    except (FileNotFoundError, ValueError) as err:
+        sys.stderr.write(str(err) + '\n')
+        sys.exit(1)
+
+    print(Fore.BLUE + f"\nUsing snapshot exported at {snap.exported_at}")
+    if args.command == 'leaderboard':
+        print(Fore.BLUE + "\nBeyblade Leaderboard (Most Wins):")
+        print_rows(snap.leaderboard(), LEADERBOARD_HEADERS,
+                   "\nNo battle results found.")
+    elif args.command == 'tournaments':
+        for name in snap.distinct('tournament_name'):
+            print(name)
+    elif args.command == 'locations':
+        for location in snap.distinct('location'):
+            print(location)
+    elif args.command == 'tournament':
+        print_rows(snap.battles_for_tournament(args.value),
+                   TOURNAMENT_HEADERS,
+                   f"\nNo battles found for tournament: {args.value}")
+    elif args.command == 'location':
+        print_rows(snap.battles_for_location(args.value), LOCATION_HEADERS,
+                   f"\nNo battles found for location: {args.value}")
+    elif args.command == 'user':
+        print_rows(snap.battles_for_user(args.value), USER_HEADERS,
+                   "\nNo battles found for user!")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,696 @@
+"""
+This module runs tournaments as brackets of rounds instead of loose battles
+sharing a tournament_name. A tournament is created, Beyblades from Bladers'
+collections (beycollection entries) are registered as entrants, and the
+tournament is started, which pairs the first round. Recording the results of
+a round inserts its battles, updates the standings of the entrants involved
+and pairs the next round, all in one transaction.
+
+Formats:
+
+    single_elimination - Seeded bracket; byes go to the top seeds when the
+                         number of entrants is not a power of two.
+    double_elimination - Entrants are eliminated at their second loss.
+                         Each round pairs the unbeaten entrants with each
+                         other (winners bracket) and the once-beaten ones
+                         with each other (losers bracket), best seed
+                         against worst; the last two meet in a final, which
+                         is replayed if the losers bracket entrant wins.
+    swiss              - A fixed number of rounds (by default enough to
+                         find an unbeaten winner); each round pairs
+                         entrants with equal or close points who have not
+                         met yet.
+
+Standings (wins, losses, draws, byes, points) are stored per entrant and
+updated incrementally, so they are never recomputed from battles. Pairing
+a round is O(n log n) in the number of entrants, plus a short look-ahead
+per entrant to avoid Swiss rematches, so thousands of entrants are fine.
+
+Rounds played outside a bracket can be recorded all at once from a JSON
+array of battles with record_battles(), which checks and inserts them in the
+database with the sp_record_round procedure.
+"""
+
+import json
+import math
+from collections import namedtuple
+from datetime import datetime
+
+import backends
+import journal
+
+FORMATS = ['single_elimination', 'double_elimination', 'swiss']
+
+# Points for a win, a draw and a bye (a bye counts as a win)
+WIN_POINTS = 3
+DRAW_POINTS = 1
+BYE_POINTS = 3
+
+# Number of later entrants a Swiss pairing looks through for an opponent
+# not played yet, before allowing a rematch
+SWISS_LOOKAHEAD = 50
+
+# Maximum number of IDs per IN (...) list when registering entrants
+ID_BATCH = 1000
+
+Entrant = namedtuple('Entrant', ['user_beyblade_ID', 'user_ID', 'seed',
+                                 'wins', 'losses', 'draws', 'byes', 'points',
+                                 'eliminated'])
+
+# A pairing of a round: entrant2 is None for a bye
+Pairing = namedtuple('Pairing', ['bracket', 'entrant1', 'entrant2'])
+
+# ----------------------------------------------------------------------
+# Pairing
+# ----------------------------------------------------------------------
+
+
+def bracket_order(size):
+    """
+    Returns the seeds 1..size (a power of two) in bracket order, so that
+    neighbouring seeds meet in the first round and the top two seeds can
+    only meet in the final: [1, 8, 4, 5, 2, 7, 3, 6] for 8.
+    """
+    order = [1]
+    while len(order) < size:
+        total = 2 * len(order) + 1
+        order = [seed for top in order for seed in (top, total - top)]
+    return order
+
+
+def pair_first_elimination_round(entrants):
+    """
+    Pairs the first round of a single elimination bracket. Entrants are
+    placed by seed, and seeds beyond the number of entrants are byes, which
+    therefore go to the top seeds.
+    """
+    by_seed = sorted(entrants, key=lambda e: e.seed)
+    size = 1
+    while size < len(by_seed):
+        size *= 2
+    order = bracket_order(size)
+    pairings = []
+    for i in range(0, size, 2):
+        first, second = order[i], order[i + 1]
+        # The top seed of a pair always exists (see bracket_order)
+        entrant2 = by_seed[second - 1] if second <= len(by_seed) else None
+        pairings.append(Pairing('main', by_seed[first - 1].user_beyblade_ID,
+                                entrant2 and entrant2.user_beyblade_ID))
+    return pairings
+
+
+def pair_next_elimination_round(winners):
+    """
+    Pairs the next round of a single elimination bracket from the winners of
+    the previous round, in match order, so the winners of neighbouring
+    matches meet.
+    """
+    return [Pairing('main', winners[i],
+                    winners[i + 1] if i + 1 < len(winners) else None)
+            for i in range(0, len(winners), 2)]
+
+
+def _fold(group, bracket):
+    """
+    Pairs a group sorted best first: best against worst, second against
+    second worst, and so on. With an odd group the best entrant among those
+    with the fewest byes gets a bye.
+    """
+    pairings = []
+    if len(group) % 2:
+        bye = min(group, key=lambda e: e.byes)
+        pairings.append(Pairing(bracket, bye.user_beyblade_ID, None))
+        group = [e for e in group if e is not bye]
+    half = len(group) // 2
+    for i in range(half):
+        pairings.append(Pairing(bracket, group[i].user_beyblade_ID,
+                                group[-1 - i].user_beyblade_ID))
+    return pairings
+
+
+def pair_double_elimination_round(entrants):
+    """
+    Pairs a round of a double elimination tournament (see the module
+    docstring). Returns an empty list once one entrant is left.
+    """
+    alive = sorted((e for e in entrants if e.losses < 2),
+                   key=lambda e: e.seed)
+    if len(alive) <= 1:
+        return []
+    if len(alive) == 2:
+        # The final, or its replay when the unbeaten entrant lost it
+        first, second = sorted(alive, key=lambda e: (e.losses, e.seed))
+        return [Pairing('final', first.user_beyblade_ID,
+                        second.user_beyblade_ID)]
+    unbeaten = [e for e in alive if e.losses == 0]
+    beaten_once = [e for e in alive if e.losses == 1]
+    pairings = []
+    # A lone unbeaten entrant waits for the losers bracket to finish
+    if len(unbeaten) >= 2:
+        pairings.extend(_fold(unbeaten, 'winners'))
+    if len(beaten_once) >= 2:
+        pairings.extend(_fold(beaten_once, 'losers'))
+    elif len(beaten_once) == 1 and len(unbeaten) >= 2:
+        pairings.append(Pairing('losers', beaten_once[0].user_beyblade_ID,
+                                None))
+    return pairings
+
+
+def swiss_rank_key(entrant):
+    """
+    Sort key ranking entrants by points, then wins, then seed.
+    """
+    return (-entrant.points, -entrant.wins, entrant.seed)
+
+
+def pair_swiss_round(entrants, played):
+    """
+    Pairs a Swiss round: entrants are ranked by points and each is paired
+    with the next-ranked entrant it has not played, looking at most
+    SWISS_LOOKAHEAD entrants ahead before allowing a rematch. With an odd
+    number of entrants, the lowest-ranked entrant without a bye gets one.
+
+    Arguments:
+        entrants (list) - The Entrant tuples.
+        played (set) - frozensets of the user_beyblade_ID pairs that have
+            already met.
+    """
+    ranked = sorted(entrants, key=swiss_rank_key)
+    pairings = []
+    if len(ranked) % 2:
+        candidates = [e for e in ranked if e.byes == 0] or ranked
+        bye = candidates[-1]
+        ranked.remove(bye)
+        pairings.append(Pairing('main', bye.user_beyblade_ID, None))
+
+    ids = [e.user_beyblade_ID for e in ranked]
+    paired = [False] * len(ids)
+    for i, first in enumerate(ids):
+        if paired[i]:
+            continue
+        paired[i] = True
+        opponent = None
+        for j in range(i + 1, min(len(ids), i + 1 + SWISS_LOOKAHEAD)):
+            if not paired[j]:
+                if opponent is None:
+                    opponent = j  # Best rematch, if nobody new is found
+                if frozenset((first, ids[j])) not in played:
+                    opponent = j
+                    break
+        if opponent is None:
+            # Everyone in the look-ahead window is taken; the number of
+            # entrants is even, so someone further down is still free
+            opponent = next(j for j in range(i + 1, len(ids))
+                            if not paired[j])
+        paired[opponent] = True
+        pairings.append(Pairing('main', first, ids[opponent]))
+    return pairings
+
+# ----------------------------------------------------------------------
+# Tournaments in the Database
+# ----------------------------------------------------------------------
+
+
+def create_tournament(conn, name, location, format, swiss_rounds=None):
+    """
+    Creates a tournament open for registration.
+
+    Arguments:
+        conn - An open database connection (as a BeyAdmin).
+        name (str) - The tournament name, also used on its battles.
+        location (str) - Where the tournament is held.
+        format (str) - One of FORMATS.
+        swiss_rounds (int) - Rounds of a Swiss tournament; by default
+            decided when the tournament starts.
+
+    Return value: The new tournament_ID.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Invalid format '{format}'; expected one of "
+                         f"{', '.join(FORMATS)}.")
+    if swiss_rounds is not None and swiss_rounds < 1:
+        raise ValueError('A Swiss tournament needs at least one round.')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO tournaments (tournament_name, location, format, "
+            "swiss_rounds, created_at) VALUES (%s, %s, %s, %s, %s);",
+            (name, location, format,
+             swiss_rounds if format == 'swiss' else None,
+             datetime.now().replace(microsecond=0)))
+        tournament_id = cursor.lastrowid
+        conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return tournament_id
+
+
+def get_tournament(conn, name):
+    """
+    Returns a tournament by name as a dictionary, or None if there is none.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT tournament_ID, tournament_name, location, format, "
+            "swiss_rounds, current_round, status FROM tournaments "
+            "WHERE tournament_name = %s;", (name,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    if row is None:
+        return None
+    return dict(zip(['tournament_ID', 'tournament_name', 'location', 'format',
+                     'swiss_rounds', 'current_round', 'status'], row))
+
+
+def _get_tournament_by_id(cursor, tournament_id):
+    cursor.execute(
+        "SELECT tournament_name, location, format, swiss_rounds, "
+        "current_round, status FROM tournaments WHERE tournament_ID = %s;",
+        (tournament_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Tournament {tournament_id} does not exist.")
+    return dict(zip(['tournament_name', 'location', 'format', 'swiss_rounds',
+                     'current_round', 'status'], row))
+
+
+def register_entrants(conn, tournament_id, user_beyblade_ids):
+    """
+    Registers Beyblades from Bladers' collections for a tournament, seeded
+    in the order given after those already registered.
+
+    Arguments:
+        conn - An open database connection (as a BeyAdmin).
+        tournament_id (int) - The tournament, which must be open for
+            registration.
+        user_beyblade_ids (list) - beycollection IDs (Beyblade-Player IDs).
+
+    Return value: A (registered, failures) pair: the number of entrants
+                  registered and a list of (user_beyblade_ID, message)
+                  tuples for the IDs that were not.
+    """
+    cursor = conn.cursor()
+    try:
+        tournament = _get_tournament_by_id(cursor, tournament_id)
+        if tournament['status'] != 'registration':
+            raise ValueError(f"{tournament['tournament_name']} has already "
+                             "started.")
+        cursor.execute("SELECT user_ID, seed FROM tournament_entrants "
+                       "WHERE tournament_ID = %s;", (tournament_id,))
+        rows = cursor.fetchall()
+        users = {user_id for user_id, _ in rows}
+        next_seed = max((seed for _, seed in rows), default=0) + 1
+
+        # Owners of the Beyblades, looked up ID_BATCH IDs at a time. Only
+        # users in the users table can be recorded in battles.
+        owners = {}
+        ids = list(dict.fromkeys(user_beyblade_ids))
+        for start in range(0, len(ids), ID_BATCH):
+            chunk = ids[start:start + ID_BATCH]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                "SELECT c.user_beyblade_ID, c.user_ID FROM beycollection c "
+                "JOIN users u ON c.user_ID = u.user_ID "
+                f"WHERE c.user_beyblade_ID IN ({placeholders});", chunk)
+            owners.update(cursor.fetchall())
+
+        new_rows, failures = [], []
+        for user_beyblade_id in user_beyblade_ids:
+            user_id = owners.get(user_beyblade_id)
+            if user_id is None:
+                failures.append((user_beyblade_id,
+                                 "not in a registered user's collection"))
+            elif user_id in users:
+                failures.append((user_beyblade_id,
+                                 f'user {user_id} is already registered'))
+            else:
+                users.add(user_id)
+                new_rows.append((tournament_id, user_beyblade_id, user_id,
+                                 next_seed))
+                next_seed += 1
+        if new_rows:
+            cursor.executemany(
+                "INSERT INTO tournament_entrants (tournament_ID, "
+                "user_beyblade_ID, user_ID, seed) VALUES (%s, %s, %s, %s);",
+                new_rows)
+        conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(new_rows), failures
+
+
+def _load_entrants(cursor, tournament_id):
+    cursor.execute(
+        "SELECT user_beyblade_ID, user_ID, seed, wins, losses, draws, byes, "
+        "points, eliminated FROM tournament_entrants "
+        "WHERE tournament_ID = %s;", (tournament_id,))
+    return {row[0]: Entrant(*row[:8], bool(row[8]))
+            for row in cursor.fetchall()}
+
+
+def _plan_round(cursor, tournament_id, tournament, entrants, round_number):
+    """
+    Returns the pairings of a round, or an empty list if the tournament is
+    over.
+    """
+    format = tournament['format']
+    alive = [e for e in entrants.values() if not e.eliminated]
+    if format == 'single_elimination':
+        if round_number == 1:
+            return pair_first_elimination_round(alive)
+        cursor.execute(
+            "SELECT winner_ID FROM tournament_matches "
+            "WHERE tournament_ID = %s AND round = %s ORDER BY match_number;",
+            (tournament_id, round_number - 1))
+        winners = [winner for (winner,) in cursor.fetchall()]
+        return pair_next_elimination_round(winners) if len(winners) > 1 else []
+    if format == 'double_elimination':
+        return pair_double_elimination_round(alive)
+    if round_number > tournament['swiss_rounds']:
+        return []
+    cursor.execute(
+        "SELECT entrant1_ID, entrant2_ID FROM tournament_matches "
+        "WHERE tournament_ID = %s AND entrant2_ID IS NOT NULL;",
+        (tournament_id,))
+    played = {frozenset(pair) for pair in cursor.fetchall()}
+    return pair_swiss_round(alive, played)
+
+
+def _start_round(cursor, tournament_id, tournament, entrants, round_number):
+    """
+    Pairs and stores a round, recording its byes at once. Marks the
+    tournament finished instead if there is nothing left to play.
+
+    Return value: The round number, or None if the tournament finished.
+    """
+    pairings = _plan_round(cursor, tournament_id, tournament, entrants,
+                           round_number)
+    if not pairings:
+        cursor.execute("UPDATE tournaments SET status = 'finished' "
+                       "WHERE tournament_ID = %s;", (tournament_id,))
+        return None
+
+    cursor.executemany(
+        "INSERT INTO tournament_matches (tournament_ID, round, match_number, "
+        "bracket, entrant1_ID, entrant2_ID, winner_ID, recorded) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s);",
+        [(tournament_id, round_number, number, p.bracket, p.entrant1,
+          p.entrant2, p.entrant1 if p.entrant2 is None else None,
+          p.entrant2 is None)
+         for number, p in enumerate(pairings, start=1)])
+    byes = [(BYE_POINTS, tournament_id, p.entrant1)
+            for p in pairings if p.entrant2 is None]
+    if byes:
+        cursor.executemany(
+            "UPDATE tournament_entrants SET byes = byes + 1, "
+            "points = points + %s "
+            "WHERE tournament_ID = %s AND user_beyblade_ID = %s;", byes)
+    cursor.execute(
+        "UPDATE tournaments SET current_round = %s, status = 'running' "
+        "WHERE tournament_ID = %s;", (round_number, tournament_id))
+    return round_number
+
+
+def start_tournament(conn, tournament_id):
+    """
+    Closes registration and pairs the first round. A Swiss tournament
+    without a set number of rounds gets ceil(log2(entrants)) rounds.
+
+    Return value: The number of matches in the first round.
+    """
+    cursor = conn.cursor()
+    try:
+        tournament = _get_tournament_by_id(cursor, tournament_id)
+        if tournament['status'] != 'registration':
+            raise ValueError(f"{tournament['tournament_name']} has already "
+                             "started.")
+        entrants = _load_entrants(cursor, tournament_id)
+        if len(entrants) < 2:
+            raise ValueError('A tournament needs at least two entrants.')
+        if tournament['format'] == 'swiss' and not tournament['swiss_rounds']:
+            tournament['swiss_rounds'] = math.ceil(math.log2(len(entrants)))
+            cursor.execute(
+                "UPDATE tournaments SET swiss_rounds = %s "
+                "WHERE tournament_ID = %s;",
+                (tournament['swiss_rounds'], tournament_id))
+        _start_round(cursor, tournament_id, tournament, entrants, 1)
+        cursor.execute("SELECT COUNT(*) FROM tournament_matches "
+                       "WHERE tournament_ID = %s AND round = 1;",
+                       (tournament_id,))
+        matches = cursor.fetchone()[0]
+        conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return matches
+
+
+def record_round(conn, tournament_id, results, battle_date=None):
+    """
+    Records the results of the current round of a tournament in one
+    transaction: inserts a battle per match, updates the standings of the
+    entrants that played and pairs the next round (or finishes the
+    tournament).
+
+    Arguments:
+        conn - An open database connection (as a BeyAdmin).
+        tournament_id (int) - The tournament.
+        results (dict) - The winner (a user_beyblade_ID) of every unplayed
+            match of the current round by match_ID; None records a draw,
+            which only Swiss tournaments allow.
+        battle_date (datetime) - Date of the battles (default: now).
+
+    Return value: The number of the next round, or None if the tournament
+                  is finished.
+    """
+    battle_date = (battle_date or datetime.now()).replace(microsecond=0)
+    cursor = conn.cursor()
+    try:
+        tournament = _get_tournament_by_id(cursor, tournament_id)
+        if tournament['status'] != 'running':
+            raise ValueError(f"{tournament['tournament_name']} is not "
+                             "running.")
+        round_number = tournament['current_round']
+        cursor.execute(
+            "SELECT match_ID, entrant1_ID, entrant2_ID "
+            "FROM tournament_matches "
+            "WHERE tournament_ID = %s AND round = %s AND recorded = 0;",
+            (tournament_id, round_number))
+        matches = {row[0]: row[1:] for row in cursor.fetchall()}
+        missing = sorted(set(matches) - set(results))
+        unknown = sorted(set(results) - set(matches))
+        if missing or unknown:
+            raise ValueError(
+                f"Results must cover exactly the unplayed matches of round "
+                f"{round_number} (missing: {missing}, unknown: {unknown}).")
+        elimination = tournament['format'] != 'swiss'
+        for match_id, winner in results.items():
+            if winner is None and elimination:
+                raise ValueError(f"Match {match_id}: draws are not allowed "
+                                 "in elimination tournaments.")
+            if winner is not None and winner not in matches[match_id]:
+                raise ValueError(f"Match {match_id}: {winner} did not play "
+                                 "in this match.")
+
+        entrants = _load_entrants(cursor, tournament_id)
+        deltas = {}  # user_beyblade_ID -> [wins, losses, draws, points]
+        match_updates = []
+        for match_id, (entrant1, entrant2) in matches.items():
+            winner = results[match_id]
+            cursor.execute(
+                "INSERT INTO battles (tournament_name, battle_date, location, "
+                "player1_ID, player2_ID, player1_beyblade_ID, "
+                "player2_beyblade_ID, winner_ID) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s);",
+                (tournament['tournament_name'], battle_date,
+                 tournament['location'], entrants[entrant1].user_ID,
+                 entrants[entrant2].user_ID, entrant1, entrant2, winner))
+            match_updates.append((cursor.lastrowid, winner, match_id))
+            for entrant in (entrant1, entrant2):
+                delta = deltas.setdefault(entrant, [0, 0, 0, 0])
+                if winner is None:
+                    delta[2] += 1
+                    delta[3] += DRAW_POINTS
+                elif winner == entrant:
+                    delta[0] += 1
+                    delta[3] += WIN_POINTS
+                else:
+                    delta[1] += 1
+
+        cursor.executemany(
+            "UPDATE tournament_matches SET battle_ID = %s, winner_ID = %s, "
+            "recorded = 1 WHERE match_ID = %s;", match_updates)
+
+        losses_allowed = {'single_elimination': 1, 'double_elimination': 2}
+        updates = []
+        for user_beyblade_id, (wins, losses, draws, points) in deltas.items():
+            entrant = entrants[user_beyblade_id]
+            entrant = entrant._replace(
+                wins=entrant.wins + wins, losses=entrant.losses + losses,
+                draws=entrant.draws + draws, points=entrant.points + points)
+            entrant = entrant._replace(
+                eliminated=entrant.losses >= losses_allowed.get(
+                    tournament['format'], math.inf))
+            entrants[user_beyblade_id] = entrant
+            updates.append((wins, losses, draws, points, entrant.eliminated,
+                            tournament_id, user_beyblade_id))
+        cursor.executemany(
+            "UPDATE tournament_entrants SET wins = wins + %s, "
+            "losses = losses + %s, draws = draws + %s, points = points + %s, "
+            "eliminated = %s "
+            "WHERE tournament_ID = %s AND user_beyblade_ID = %s;", updates)
+
+        next_round = _start_round(cursor, tournament_id, tournament, entrants,
+                                  round_number + 1)
+        conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return next_round
+
+
+def get_pairings(conn, tournament_id, round_number):
+    """
+    Returns the matches of a round as (match_ID, bracket, player 1,
+    Beyblade 1, player 2, Beyblade 2, result) rows, where the Beyblade
+    columns hold 'name (user_beyblade_ID)'.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT m.match_ID, m.bracket, u1.username, bb1.name, "
+            "m.entrant1_ID, u2.username, bb2.name, m.entrant2_ID, "
+            "m.winner_ID, m.recorded "
+            "FROM tournament_matches m "
+            "JOIN beycollection c1 ON m.entrant1_ID = c1.user_beyblade_ID "
+            "JOIN users u1 ON c1.user_ID = u1.user_ID "
+            "JOIN beyblades bb1 ON c1.beyblade_ID = bb1.beyblade_ID "
+            "LEFT JOIN beycollection c2 "
+            "ON m.entrant2_ID = c2.user_beyblade_ID "
+            "LEFT JOIN users u2 ON c2.user_ID = u2.user_ID "
+            "LEFT JOIN beyblades bb2 ON c2.beyblade_ID = bb2.beyblade_ID "
+            "WHERE m.tournament_ID = %s AND m.round = %s "
+            "ORDER BY m.match_number;", (tournament_id, round_number))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    pairings = []
+    for (match_id, bracket, user1, name1, id1, user2, name2, id2, winner,
+         recorded) in rows:
+        if id2 is None:
+            result = 'bye'
+        elif not recorded:
+            result = 'to play'
+        elif winner is None:
+            result = 'draw'
+        else:
+            result = f"winner: {user1 if winner == id1 else user2}"
+        pairings.append((match_id, bracket, user1, f"{name1} ({id1})",
+                         user2 or '-', f"{name2} ({id2})" if id2 else '-',
+                         result))
+    return pairings
+
+
+def get_standings(conn, tournament_id):
+    """
+    Returns the standings of a tournament, best first, as (rank, username,
+    Beyblade name, user_beyblade_ID, points, wins, losses, draws, byes,
+    eliminated) rows. Entrants still in the tournament rank above the
+    eliminated ones.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT u.username, bb.name, e.user_beyblade_ID, e.points, "
+            "e.wins, e.losses, e.draws, e.byes, e.eliminated "
+            "FROM tournament_entrants e "
+            "JOIN users u ON e.user_ID = u.user_ID "
+            "JOIN beycollection c ON e.user_beyblade_ID = c.user_beyblade_ID "
+            "JOIN beyblades bb ON c.beyblade_ID = bb.beyblade_ID "
+            "WHERE e.tournament_ID = %s "
+            "ORDER BY e.eliminated, e.points DESC, e.wins DESC, e.losses, "
+            "e.seed;", (tournament_id,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return [(rank, *row[:8], bool(row[8]))
+            for rank, row in enumerate(rows, start=1)]
+
+# ----------------------------------------------------------------------
+# Rounds of Loose Battles
+# ----------------------------------------------------------------------
+
+
+def read_battles_file(path):
+    """
+    Reads a round of battles from a JSON file holding an array of objects
+    with the fields of journal.BATTLE_FIELDS.
+
+    Raises OSError if the file cannot be read and ValueError if it is not
+    such an array.
+    """
+    with open(path, encoding='utf-8') as f:
+        battles = json.load(f)
+    if not isinstance(battles, list) or not all(isinstance(b, dict)
+                                                for b in battles):
+        raise ValueError(f"'{path}' must hold a JSON array of battles.")
+    return battles
+
+
+def record_battles(conn, battles):
+    """
+    Records a round of battles outside a bracket (e.g. a whole round of a
+    tournament run on paper) with sp_record_round: the Beyblade ownership of
+    every battle is checked in one query and all the battles are inserted
+    with one statement, in one transaction. Nothing is recorded unless every
+    battle is valid.
+
+    Arguments:
+        conn - An open database connection (as a BeyAdmin).
+        battles (list) - Dicts with the fields of journal.BATTLE_FIELDS;
+            winner_ID is None or missing for a draw.
+
+    Return value: A (recorded, failures) pair: the number of battles
+                  recorded and a list of (row, message) tuples, with rows
+                  numbered from 1, for the battles that are not valid.
+    """
+    rows, failures = [], []
+    for number, battle in enumerate(battles, start=1):
+        try:
+            entry = journal.make_entry(
+                *(battle.get(field) for field in journal.BATTLE_FIELDS))
+        except ValueError as err:
+            failures.append((number, str(err)))
+            continue
+        rows.append({field: entry[field] for field in journal.BATTLE_FIELDS})
+    if failures or not rows:
+        return 0, failures
+
+    cursor = conn.cursor()
+    try:
+        cursor.callproc('sp_record_round', [json.dumps(rows)])
+        cursor.execute("SELECT row_no, error FROM round_errors "
+                       "ORDER BY row_no;")
+        failures = [(int(row), error) for row, error in cursor.fetchall()]
+        if failures:
+            conn.rollback()
+        else:
+            conn.commit()
+    except backends.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return (0 if failures else len(rows)), failures